@@ -0,0 +1,73 @@
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """TTL/LRU-кэш пользователей по telegram_id (с индексом по user_id).
+
+    Кэш в памяти одного процесса: invalidate() не доходит до других реплик,
+    там запись устаревает не позже чем через ttl секунд.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # telegram_id -> (expires_at, user)
+        self._by_user_id = {}       # user_id -> telegram_id
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int):
+        """Пользователь по telegram_id или None, если нет в кэше/устарел"""
+        entry = self._data.get(telegram_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self._remove(telegram_id)
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(telegram_id)
+        self.hits += 1
+        return user
+
+    def get_by_user_id(self, user_id: int):
+        """Пользователь по user_id или None"""
+        telegram_id = self._by_user_id.get(user_id)
+        if telegram_id is None:
+            self.misses += 1
+            return None
+        return self.get(telegram_id)
+
+    def set(self, user):
+        """Положить строку users в кэш"""
+        if self.maxsize <= 0 or not user:
+            return
+
+        telegram_id = user['telegram_id']
+        self._data[telegram_id] = (time.monotonic() + self.ttl, user)
+        self._data.move_to_end(telegram_id)
+        self._by_user_id[user['user_id']] = telegram_id
+
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+
+    def invalidate(self, *user_ids: int):
+        """Сбросить записи пользователей по user_id"""
+        for user_id in user_ids:
+            telegram_id = self._by_user_id.get(user_id)
+            if telegram_id is not None:
+                self._remove(telegram_id)
+
+    def clear(self):
+        self._data.clear()
+        self._by_user_id.clear()
+
+    def _remove(self, telegram_id: int):
+        entry = self._data.pop(telegram_id, None)
+        if entry is not None:
+            self._by_user_id.pop(entry[1]['user_id'], None)
@@ -6,6 +6,19 @@ load_dotenv()
 # Telegram
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# Режим получения апдейтов: polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Webhook (BOT_MODE=webhook)
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')  # https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+WEBHOOK_SSL_CERT = os.getenv('WEBHOOK_SSL_CERT') or None  # самоподписанный сертификат
+WEBHOOK_SSL_KEY = os.getenv('WEBHOOK_SSL_KEY') or None
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv('WEBHOOK_SHUTDOWN_TIMEOUT', '30'))
+
 # Telegram ID для админ-доступа
 ADMIN_ID = 757042486
 
@@ -18,6 +31,61 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'admin123')
 }
 
+# Пул соединений с БД
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+# Простаивающие соединения сверх min_size закрываются через DB_POOL_MAX_IDLE сек;
+# свободные соединения проверяются раз в DB_POOL_CHECK_MINUTES (а не при каждой выдаче)
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+DB_POOL_CHECK_MINUTES = int(os.getenv('DB_POOL_CHECK_MINUTES', '5'))
+
+# Буфер event_log: размер пачки, интервал сброса (сек), максимум событий в памяти
+EVENT_LOG_BATCH_SIZE = int(os.getenv('EVENT_LOG_BATCH_SIZE', '200'))
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv('EVENT_LOG_FLUSH_INTERVAL', '2'))
+EVENT_LOG_MAX_PENDING = int(os.getenv('EVENT_LOG_MAX_PENDING', '10000'))
+
+# Секции event_log: сколько месяцев создавать заранее, сколько хранить в БД
+# (0 - хранить всё), куда складывать архивы отсоединённых секций
+EVENT_LOG_PARTITIONS_AHEAD = int(os.getenv('EVENT_LOG_PARTITIONS_AHEAD', '3'))
+EVENT_LOG_RETENTION_MONTHS = int(os.getenv('EVENT_LOG_RETENTION_MONTHS', '12'))
+EVENT_LOG_ARCHIVE_DIR = os.getenv('EVENT_LOG_ARCHIVE_DIR', 'archive')
+
+# Кэш пользователей: максимум записей и время жизни (сек). Кэш у каждого процесса
+# свой: правки из другой реплики видны не позже USER_CACHE_TTL
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+
+# Генерация PDF-квитанций: число процессов и максимум задач в очереди
+RECEIPT_WORKERS = int(os.getenv('RECEIPT_WORKERS', '2'))
+RECEIPT_QUEUE_LIMIT = int(os.getenv('RECEIPT_QUEUE_LIMIT', '50'))
+
+# Очередь исходящих сообщений: общий лимит бота (Telegram ~30/с), лимит и запас
+# на один чат, число параллельных отправок, попыток при сетевых ошибках
+NOTIFY_RATE_LIMIT = float(os.getenv('NOTIFY_RATE_LIMIT', '25'))
+NOTIFY_CHAT_RATE_LIMIT = float(os.getenv('NOTIFY_CHAT_RATE_LIMIT', '1'))
+NOTIFY_CHAT_BURST = float(os.getenv('NOTIFY_CHAT_BURST', '3'))
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', '4'))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '5'))
+# Сообщение из outbox отбрасывается (с записью notification_dropped в event_log)
+# после стольких попыток всего или через столько часов после постановки
+NOTIFY_OUTBOX_MAX_ATTEMPTS = int(os.getenv('NOTIFY_OUTBOX_MAX_ATTEMPTS', '20'))
+NOTIFY_OUTBOX_MAX_AGE_HOURS = float(os.getenv('NOTIFY_OUTBOX_MAX_AGE_HOURS', '24'))
+
+# Страховочное истечение сделок: размер пачки одного UPDATE
+EXPIRY_SWEEP_BATCH_SIZE = int(os.getenv('EXPIRY_SWEEP_BATCH_SIZE', '200'))
+
+# FSM-хранилище: postgres, redis или memory; время жизни брошенного диалога (сек)
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'postgres')
+FSM_TTL = int(os.getenv('FSM_TTL', '86400'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+
+# Сверка снимка статистики админки с таблицами (минуты)
+STATS_RECONCILE_MINUTES = int(os.getenv('STATS_RECONCILE_MINUTES', '60'))
+
+# Выгрузка /export и export.py: строк в одной пачке для Parquet
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '5000'))
+
 # Crypto API
 TON_API_KEY = os.getenv('TON_API_KEY')
 BTC_API_KEY = os.getenv('BTC_API_KEY')
@@ -0,0 +1 @@
+# Модули бота импортируются как верхнеуровневые (import database), как в main.py
@@ -1,79 +1,184 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from config import DB_CONFIG
+import asyncio
+import json
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from psycopg import sql, DataError, IntegrityError
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from config import (DB_CONFIG, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE,
+                    EVENT_LOG_BATCH_SIZE, EVENT_LOG_FLUSH_INTERVAL, EVENT_LOG_MAX_PENDING,
+                    USER_CACHE_SIZE, USER_CACHE_TTL)
+from cache import UserCache
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_connection():
-    """Создает подключение к БД"""
-    return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
+# Общий пул соединений процесса. Открывается в main() через open_pool()
+pool = AsyncConnectionPool(
+    kwargs={**DB_CONFIG, 'row_factory': dict_row},
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    max_idle=DB_POOL_MAX_IDLE,
+    name='garant_db',
+    open=False
+)
+
+async def open_pool():
+    """Открыть пул и дождаться min_size соединений"""
+    await pool.open(wait=True)
+    logger.info(f"DB pool opened (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+
+async def close_pool():
+    """Закрыть пул соединений"""
+    await pool.close()
+    logger.info("DB pool closed")
+
+async def check_pool():
+    """Проверить свободные соединения пула и заменить разорванные.
+    
+    Выполняется периодически планировщиком: проверка при каждой выдаче
+    (check=) стоила бы лишних обращений к БД на каждый запрос.
+    """
+    await pool.check()
+
+def get_pool_stats() -> dict:
+    """Метрики пула: размер, ожидание соединения, таймауты.
+    
+    Счётчики запросов, ожидания и потерь - с прошлого вызова (сбрасываются при чтении).
+    """
+    stats = pool.pop_stats()
+    return {
+        'pool_size': stats.get('pool_size', 0),
+        'pool_available': stats.get('pool_available', 0),
+        'requests_waiting': stats.get('requests_waiting', 0),
+        'requests_num': stats.get('requests_num', 0),
+        'requests_wait_ms': stats.get('requests_wait_ms', 0),
+        'requests_timeouts': stats.get('requests_errors', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+    }
+
+@asynccontextmanager
+async def get_connection():
+    """Взять соединение из пула (возвращается в пул при выходе из блока)"""
+    try:
+        async with pool.connection() as conn:
+            yield conn
+    except PoolTimeout:
+        logger.error(f"DB pool acquire timeout ({DB_POOL_TIMEOUT}s): {pool.get_stats()}")
+        raise
+
+# Ключи advisory-блокировок фоновых задач (migrate.py использует 7_426_001)
+STATS_RECONCILE_LOCK_ID = 7_426_002
+EVENT_LOG_MAINTENANCE_LOCK_ID = 7_426_003
+
+@asynccontextmanager
+async def try_advisory_lock(lock_id: int):
+    """Advisory-блокировка уровня сессии на отдельном соединении пула.
+    
+    Отдаёт True, если блокировка взята (задача выполняется только в одной
+    реплике), и False, если её держит другой процесс. Снимается при выходе.
+    """
+    async with get_connection() as conn:
+        cur = await conn.execute("SELECT pg_try_advisory_lock(%s) AS locked", (lock_id,))
+        locked = (await cur.fetchone())['locked']
+        await conn.commit()
+        if not locked:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+            await conn.commit()
 
 # === USERS ===
 
-def get_or_create_user(telegram_id: int, username: str, full_name: str):
+# Кэш строк users: сбрасывается при смене кошелька и статистики.
+# Кэш свой у каждого процесса: изменения, сделанные другой репликой, видны
+# не позже USER_CACHE_TTL. Поэтому кошельки для денежных операций
+# (проверка перед сделкой, квитанции) читаются из БД через get_user_wallet.
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+async def get_or_create_user(telegram_id: int, username: str, full_name: str):
     """Получить или создать пользователя (защита от инъекций через %s)"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT * FROM users WHERE telegram_id = %s",
-                (telegram_id,)
+    user = user_cache.get(telegram_id)
+    if user:
+        return user
+    
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            # Один запрос и для регистрации, и для поиска: при параллельном
+            # первом /start второй INSERT уходит в DO UPDATE вместо ошибки
+            await cur.execute(
+                """INSERT INTO users (telegram_id, username, full_name, role) 
+                   VALUES (%s, %s, %s, 'user')
+                   ON CONFLICT (telegram_id) DO UPDATE
+                   SET username = EXCLUDED.username, full_name = EXCLUDED.full_name
+                   RETURNING *, (xmax = 0) AS created""",
+                (telegram_id, username, full_name)
             )
-            user = cur.fetchone()
+            user = await cur.fetchone()
             
-            if not user:
-                cur.execute(
-                    """INSERT INTO users (telegram_id, username, role) 
-                       VALUES (%s, %s, 'user') RETURNING *""",
-                    (telegram_id, username)
-                )
-                user = cur.fetchone()
-                conn.commit()
-                
-                log_event(user['user_id'], 'user_registered', 
-                         f'{{"telegram_id": {telegram_id}}}')
+            if user.pop('created'):
+                await log_event(user['user_id'], 'user_registered',
+                                {'telegram_id': telegram_id}, cur=cur)
+            await conn.commit()
             
+            user_cache.set(user)
             return user
-    finally:
-        conn.close()
 
-def update_wallet(user_id: int, currency: str, wallet_address: str):
+async def update_wallet(user_id: int, currency: str, wallet_address: str):
     """Обновить кошелёк пользователя"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
             column = 'wallet_ton' if currency == 'TON' else 'wallet_btc'
-            cur.execute(
+            await cur.execute(
                 f"UPDATE users SET {column} = %s WHERE user_id = %s",
                 (wallet_address, user_id)
             )
-            conn.commit()
-            log_event(user_id, 'wallet_updated', 
-                     f'{{"currency": "{currency}", "wallet": "{wallet_address}"}}')
-    finally:
-        conn.close()
+            await log_event(user_id, 'wallet_updated',
+                            {'currency': currency, 'wallet': wallet_address}, cur=cur)
+            await conn.commit()
+    user_cache.invalidate(user_id)
 
-def get_user_by_id(user_id: int):
+async def get_user_by_id(user_id: int):
     """Получить пользователя по user_id"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-            return cur.fetchone()
-    finally:
-        conn.close()
+    user = user_cache.get_by_user_id(user_id)
+    if user:
+        return user
+    
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+            user = await cur.fetchone()
+    user_cache.set(user)
+    return user
+
+async def get_user_wallet(user_id: int, currency: str):
+    """Кошелёк пользователя для валюты - всегда из БД, в обход кэша"""
+    column = 'wallet_ton' if currency == 'TON' else 'wallet_btc'
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"SELECT {column} AS wallet FROM users WHERE user_id = %s", (user_id,))
+            row = await cur.fetchone()
+    return row['wallet'] if row else None
 
 # === DEALS ===
 
-def create_deal(buyer_id: int, seller_id: int, amount: float, currency: str, 
-                garant_address: str, expiry_time):
+# Сделки, которые ещё не дошли до финального статуса
+ACTIVE_DEAL_STATUSES = ('awaiting_confirmation', 'awaiting_payment',
+                        'awaiting_admin_confirmation', 'payment_received')
+
+async def create_deal(buyer_id: int, seller_id: int, amount: float, currency: str, 
+                      garant_address: str, expiry_time):
     """Создать сделку"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
             commission = amount * 0.01
-            cur.execute(
+            await cur.execute(
                 """INSERT INTO deals 
                    (buyer_id, seller_id, amount, currency, garant_payment_address, 
                     expiry_time, commission, status) 
@@ -82,258 +187,945 @@ def create_deal(buyer_id: int, seller_id: int, amount: float, currency: str,
                 (buyer_id, seller_id, amount, currency, garant_address, 
                  expiry_time, commission)
             )
-            deal_id = cur.fetchone()['deal_id']
-            conn.commit()
-            
-            log_event(buyer_id, 'deal_created', 
-                     f'{{"deal_id": {deal_id}, "amount": {amount}, "currency": "{currency}"}}')
-            return deal_id
-        
-    finally:
-        conn.close()
-
-def confirm_deal_creation(deal_id: int, user_id: int):
-    """Продавец подтверждает создание сделки"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
+            deal_id = (await cur.fetchone())['deal_id']
+            await log_event(buyer_id, 'deal_created',
+                            {'deal_id': deal_id, 'amount': amount, 'currency': currency}, cur=cur)
+            await conn.commit()
+    
+    # Триггер update_user_stats увеличил total_deals обоих участников
+    user_cache.invalidate(buyer_id, seller_id)
+    return deal_id
+
+async def confirm_deal_creation(deal_id: int, user_id: int):
+    """Продавец подтверждает создание сделки. Возвращает срок оплаты (expiry_time)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """UPDATE deals 
                    SET creation_confirmed = true, status = 'awaiting_payment' 
-                   WHERE deal_id = %s""",
+                   WHERE deal_id = %s
+                   RETURNING expiry_time, buyer_id, seller_id""",
                 (deal_id,)
             )
-            conn.commit()
-            log_event(user_id, 'deal_confirmed', f'{{"deal_id": {deal_id}}}')
-    finally:
-        conn.close()
+            row = await cur.fetchone()
+            await log_event(user_id, 'deal_confirmed', {'deal_id': deal_id}, cur=cur)
+            await conn.commit()
+    
+    if not row:
+        return None
+    user_cache.invalidate(row['buyer_id'], row['seller_id'])
+    return row['expiry_time']
 
-def cancel_deal(deal_id: int, user_id: int):
+async def cancel_deal(deal_id: int, user_id: int):
     """Отменить сделку"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE deals SET status = %s WHERE deal_id = %s",
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE deals SET status = %s WHERE deal_id = %s RETURNING buyer_id, seller_id",
                 ('cancelled', deal_id)
             )
-            conn.commit()
-            log_event(user_id, 'deal_cancelled', f'{{"deal_id": {deal_id}}}')
-    finally:
-        conn.close()
+            parties = await cur.fetchone()
+            await log_event(user_id, 'deal_cancelled', {'deal_id': deal_id}, cur=cur)
+            await conn.commit()
+    
+    if parties:
+        user_cache.invalidate(parties['buyer_id'], parties['seller_id'])
 
-def confirm_payment(deal_id: int):
+async def confirm_payment(deal_id: int):
     """Покупатель оплатил"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """UPDATE deals 
                    SET payment_status = 'paid', status = 'payment_received' 
-                   WHERE deal_id = %s""",
+                   WHERE deal_id = %s
+                   RETURNING buyer_id, seller_id""",
                 (deal_id,)
             )
-            conn.commit()
-    finally:
-        conn.close()
+            parties = await cur.fetchone()
+            await conn.commit()
+    
+    if parties:
+        user_cache.invalidate(parties['buyer_id'], parties['seller_id'])
 
-def confirm_delivery(deal_id: int, user_id: int, is_buyer: bool):
+async def confirm_delivery(deal_id: int, user_id: int, is_buyer: bool):
     """Подтверждение получения товара"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
             column = 'buyer_confirm' if is_buyer else 'seller_confirm'
-            cur.execute(
+            await cur.execute(
                 f"UPDATE deals SET {column} = true WHERE deal_id = %s",
                 (deal_id,)
             )
             
-            cur.execute(
-                "SELECT buyer_confirm, seller_confirm FROM deals WHERE deal_id = %s",
+            await cur.execute(
+                "SELECT buyer_id, seller_id, buyer_confirm, seller_confirm FROM deals WHERE deal_id = %s",
                 (deal_id,)
             )
-            result = cur.fetchone()
+            result = await cur.fetchone()
+            completed = result['buyer_confirm'] and result['seller_confirm']
             
-            if result['buyer_confirm'] and result['seller_confirm']:
-                cur.execute(
+            if completed:
+                await cur.execute(
                     """UPDATE deals 
                        SET status = 'completed', payment_status = 'confirmed' 
                        WHERE deal_id = %s""",
                     (deal_id,)
                 )
-                log_event(user_id, 'deal_completed', f'{{"deal_id": {deal_id}}}')
+                await log_event(user_id, 'deal_completed', {'deal_id': deal_id}, cur=cur)
             
-            conn.commit()
-    finally:
-        conn.close()
+            await conn.commit()
+    
+    # Триггер update_user_stats поменял статистику обоих участников
+    if completed:
+        user_cache.invalidate(result['buyer_id'], result['seller_id'])
 
-def get_user_deals(user_id: int, status_filter=None):
-    """Получить сделки пользователя"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            if status_filter:
-                cur.execute(
-                    """SELECT d.*, 
-                       CASE WHEN d.buyer_id = %s THEN 'buyer' ELSE 'seller' END as role
-                       FROM deals d 
-                       WHERE (d.buyer_id = %s OR d.seller_id = %s) 
-                       AND d.status = %s
-                       ORDER BY d.date_created DESC""",
-                    (user_id, user_id, user_id, status_filter)
-                )
-            else:
-                cur.execute(
-                    """SELECT d.*, 
-                       CASE WHEN d.buyer_id = %s THEN 'buyer' ELSE 'seller' END as role
-                       FROM deals d 
-                       WHERE d.buyer_id = %s OR d.seller_id = %s
-                       ORDER BY d.date_created DESC""",
-                    (user_id, user_id, user_id)
-                )
-            return cur.fetchall()
-    finally:
-        conn.close()
+def _user_deals_query(user_id: int, status_filter=None, limit: int = None,
+                      before_id: int = None, after_id: int = None):
+    """Запрос get_user_deals: (sql, params, порядок сортировки)"""
+    params = {'user_id': user_id, 'limit': limit}
+    conditions = ""
+    if status_filter:
+        statuses = [status_filter] if isinstance(status_filter, str) else list(status_filter)
+        conditions += " AND d.status = ANY(%(statuses)s)"
+        params['statuses'] = statuses
+    
+    order = "DESC"
+    if before_id is not None:
+        conditions += """ AND (d.date_created, d.deal_id) < 
+                          (SELECT date_created, deal_id FROM deals WHERE deal_id = %(cursor)s)"""
+        params['cursor'] = before_id
+    elif after_id is not None:
+        conditions += """ AND (d.date_created, d.deal_id) > 
+                          (SELECT date_created, deal_id FROM deals WHERE deal_id = %(cursor)s)"""
+        params['cursor'] = after_id
+        order = "ASC"
+    
+    limit_clause = " LIMIT %(limit)s" if limit else ""
+    branch = """(SELECT d.*, '{role}' as role FROM deals d 
+                 WHERE d.{column} = %(user_id)s{conditions}
+                 ORDER BY d.date_created {order}, d.deal_id {order}{limit_clause})"""
+    query = (
+        branch.format(role='buyer', column='buyer_id', conditions=conditions,
+                      order=order, limit_clause=limit_clause)
+        + " UNION ALL "
+        + branch.format(role='seller', column='seller_id', conditions=conditions,
+                        order=order, limit_clause=limit_clause)
+        + f" ORDER BY date_created {order}, deal_id {order}{limit_clause}"
+    )
+    return query, params, order
+
+async def get_user_deals(user_id: int, status_filter=None, limit: int = None,
+                         before_id: int = None, after_id: int = None):
+    """Получить сделки пользователя (от новых к старым).
+    
+    status_filter - статус или список статусов.
+    Keyset-пагинация по (date_created, deal_id): before_id - сделки старше
+    указанной (следующая страница), after_id - новее (предыдущая страница).
+    Ветки покупателя и продавца идут отдельными подзапросами с LIMIT,
+    чтобы каждая читала ограниченный диапазон своего индекса.
+    """
+    query, params, order = _user_deals_query(user_id, status_filter, limit, before_id, after_id)
+    
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            deals = await cur.fetchall()
+    
+    if order == "ASC":
+        deals.reverse()
+    return deals
 
-def get_deal_by_id(deal_id: int):
+async def get_user_deal_counters(user_id: int) -> dict:
+    """Счётчики сделок пользователя для профиля: total, active, completed.
+    
+    Один агрегирующий запрос; ветки покупателя и продавца разделены,
+    чтобы каждая шла по своему индексу (buyer_id / seller_id).
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT COUNT(*) AS total,
+                       COUNT(*) FILTER (WHERE status = ANY(%(active)s)) AS active,
+                       COUNT(*) FILTER (WHERE status = 'completed') AS completed
+                FROM (
+                    SELECT status FROM deals WHERE buyer_id = %(user_id)s
+                    UNION ALL
+                    SELECT status FROM deals WHERE seller_id = %(user_id)s
+                ) user_deals
+            """, {'user_id': user_id, 'active': list(ACTIVE_DEAL_STATUSES)})
+            return await cur.fetchone()
+
+async def get_deal_by_id(deal_id: int):
     """Получить сделку по ID"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM deals WHERE deal_id = %s", (deal_id,))
-            return cur.fetchone()
-    finally:
-        conn.close()
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT * FROM deals WHERE deal_id = %s", (deal_id,))
+            return await cur.fetchone()
 
-def update_deal_status(deal_id: int, status: str):
+async def update_deal_status(deal_id: int, status: str):
     """Обновление статуса сделки"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE deals SET status = %s WHERE deal_id = %s",
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE deals SET status = %s WHERE deal_id = %s RETURNING buyer_id, seller_id",
                 (status, deal_id)
             )
-            conn.commit()
-    finally:
-        conn.close()
+            parties = await cur.fetchone()
+            await conn.commit()
+    
+    # Счётчики в users меняются при любом переходе статуса
+    if parties:
+        user_cache.invalidate(parties['buyer_id'], parties['seller_id'])
+
+# === RECEIPTS ===
+
+async def get_receipt(deal_id: int, role: str):
+    """Сохранённая квитанция по сделке (role: buyer/seller)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT * FROM receipts WHERE deal_id = %s AND role = %s",
+                (deal_id, role)
+            )
+            return await cur.fetchone()
+
+async def save_receipt(deal_id: int, role: str, pdf: bytes = None, file_id: str = None):
+    """Сохранить PDF и/или Telegram file_id квитанции (заполненные поля не затираются)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """INSERT INTO receipts (deal_id, role, pdf, file_id) 
+                   VALUES (%s, %s, %s, %s)
+                   ON CONFLICT (deal_id, role) DO UPDATE
+                   SET pdf = COALESCE(EXCLUDED.pdf, receipts.pdf),
+                       file_id = COALESCE(EXCLUDED.file_id, receipts.file_id)""",
+                (deal_id, role, pdf, file_id)
+            )
+            await conn.commit()
+
+# === FSM ===
+
+async def fsm_get(key: str, ttl: int):
+    """Состояние и данные FSM по ключу (устаревшие записи не возвращаются)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """SELECT state, data FROM fsm_storage 
+                   WHERE key = %s AND updated_at > NOW() - make_interval(secs => %s)""",
+                (key, ttl)
+            )
+            return await cur.fetchone()
+
+async def fsm_set_state(key: str, state, ttl: int):
+    """Записать состояние FSM (данные устаревшей записи сбрасываются)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """INSERT INTO fsm_storage (key, state) VALUES (%s, %s)
+                   ON CONFLICT (key) DO UPDATE 
+                   SET state = EXCLUDED.state,
+                       data = CASE 
+                           WHEN fsm_storage.updated_at > NOW() - make_interval(secs => %s)
+                           THEN fsm_storage.data
+                           ELSE '{}'
+                       END,
+                       updated_at = NOW()""",
+                (key, state, ttl)
+            )
+            await conn.commit()
+
+async def fsm_set_data(key: str, data: dict, ttl: int):
+    """Заменить данные FSM (состояние устаревшей записи сбрасывается)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """INSERT INTO fsm_storage (key, data) VALUES (%s, %s)
+                   ON CONFLICT (key) DO UPDATE 
+                   SET data = EXCLUDED.data,
+                       state = CASE 
+                           WHEN fsm_storage.updated_at > NOW() - make_interval(secs => %s)
+                           THEN fsm_storage.state
+                       END,
+                       updated_at = NOW()""",
+                (key, Jsonb(data), ttl)
+            )
+            await conn.commit()
+
+async def fsm_update_data(key: str, data: dict, ttl: int) -> dict:
+    """Дополнить данные FSM одним запросом (устаревшая запись начинается заново)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """INSERT INTO fsm_storage (key, data) VALUES (%s, %s)
+                   ON CONFLICT (key) DO UPDATE 
+                   SET data = CASE 
+                           WHEN fsm_storage.updated_at > NOW() - make_interval(secs => %s)
+                           THEN fsm_storage.data || EXCLUDED.data
+                           ELSE EXCLUDED.data
+                       END,
+                       state = CASE 
+                           WHEN fsm_storage.updated_at > NOW() - make_interval(secs => %s)
+                           THEN fsm_storage.state
+                       END,
+                       updated_at = NOW()
+                   RETURNING data""",
+                (key, Jsonb(data), ttl, ttl)
+            )
+            row = await cur.fetchone()
+            await conn.commit()
+            return row['data']
+
+async def delete_expired_fsm(ttl: int) -> int:
+    """Удалить брошенные диалоги старше ttl секунд"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "DELETE FROM fsm_storage WHERE updated_at < NOW() - make_interval(secs => %s)",
+                (ttl,)
+            )
+            deleted = cur.rowcount
+            await conn.commit()
+            return deleted
+
+# === OUTBOX ===
+
+async def save_outbox(messages: list):
+    """Сохранить недоставленные сообщения: список (chat_id, payload)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.executemany(
+                "INSERT INTO outbox (chat_id, payload) VALUES (%s, %s)",
+                [(chat_id, Jsonb(payload)) for chat_id, payload in messages]
+            )
+            await conn.commit()
+
+async def take_outbox(limit: int):
+    """Забрать (удалить и вернуть) до limit самых старых сообщений.
+    SKIP LOCKED: несколько реплик разбирают outbox без дублей"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """DELETE FROM outbox
+                   WHERE id IN (
+                       SELECT id FROM outbox ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING chat_id, payload""",
+                (limit,)
+            )
+            rows = await cur.fetchall()
+            await conn.commit()
+            return rows
 
 # === EVENT LOG ===
 
-def log_event(user_id: int, action: str, details: str):
-    """Записать событие в лог"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO event_log (initiator_id, action, details) VALUES (%s, %s, %s)",
-                (user_id, action, details)
+class EventLogBuffer:
+    """Буфер событий приложения для event_log.
+    
+    События копятся в памяти и пишутся одной транзакцией через COPY,
+    когда набирается batch_size записей или проходит flush_interval секунд.
+    При ошибке записи события возвращаются в буфер (не более max_pending,
+    самые старые отбрасываются с ошибкой в логе). Если база отвергла данные
+    пачки, события пишутся по одному, а отвергнутые отбрасываются.
+    """
+    
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._rows = []
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+    
+    def add(self, user_id, action: str, details: str):
+        """Добавить событие в буфер (без обращения к БД)"""
+        self._rows.append((user_id, action, details, datetime.now(timezone.utc)))
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+    
+    def start(self):
+        """Запустить фоновую запись буфера"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановить фоновую запись и сбросить остаток буфера"""
+        if self._task is not None:
+            # Не отменяем задачу: начатая запись пачки должна завершиться
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+    
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+    
+    async def flush(self):
+        """Записать накопленные события одной транзакцией"""
+        async with self._lock:
+            if not self._rows:
+                return
+            rows, self._rows = self._rows, []
+            try:
+                try:
+                    await self._copy(rows)
+                except (DataError, IntegrityError) as e:
+                    # Повтор той же пачки упадёт снова: ищем плохие строки
+                    logger.warning(f"COPY of {len(rows)} events rejected, inserting one by one: {e}")
+                    await self._insert_each(rows)
+            except asyncio.CancelledError:
+                # Запись прервана отменой задачи: пачка возвращается в буфер
+                self._requeue(rows)
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing {len(rows)} events: {e}")
+                self._requeue(rows)
+    
+    async def _copy(self, rows: list):
+        async with get_connection() as conn:
+            async with conn.cursor() as cur:
+                async with cur.copy(
+                    "COPY event_log (initiator_id, action, details, timestamp) FROM STDIN"
+                ) as copy:
+                    for row in rows:
+                        await copy.write_row(row)
+            await conn.commit()
+    
+    async def _insert_each(self, rows: list):
+        """Записать события по одному; записанные и отброшенные убираются из rows"""
+        async with get_connection() as conn:
+            async with conn.cursor() as cur:
+                while rows:
+                    try:
+                        async with conn.transaction():
+                            await cur.execute(
+                                """INSERT INTO event_log (initiator_id, action, details, timestamp)
+                                   VALUES (%s, %s, %s, %s)""",
+                                rows[0]
+                            )
+                    except (DataError, IntegrityError) as e:
+                        logger.error(f"Dropping event {rows[0][1]} of user {rows[0][0]}: {e}")
+                    del rows[0]
+    
+    def _requeue(self, rows: list):
+        """Вернуть незаписанные события в начало буфера (не более max_pending)"""
+        self._rows = rows + self._rows
+        overflow = len(self._rows) - self.max_pending
+        if overflow > 0:
+            del self._rows[:overflow]
+            logger.error(f"Event log buffer overflow, dropped {overflow} events")
+
+event_buffer = EventLogBuffer(EVENT_LOG_BATCH_SIZE, EVENT_LOG_FLUSH_INTERVAL, EVENT_LOG_MAX_PENDING)
+
+async def log_event(user_id: int, action: str, details, cur=None):
+    """Записать событие в лог.
+    
+    Если передан cur, запись идёт в транзакции вызывающего кода и фиксируется
+    вместе с изменением данных (ошибка откатывает всю транзакцию).
+    Без cur событие ставится в буфер event_buffer и пишется пачкой.
+    """
+    if not isinstance(details, str):
+        details = json.dumps(details, ensure_ascii=False, default=str)
+    
+    if cur is not None:
+        await cur.execute(
+            "INSERT INTO event_log (initiator_id, action, details) VALUES (%s, %s, %s)",
+            (user_id, action, details)
+        )
+        return
+    
+    event_buffer.add(user_id, action, details)
+
+async def get_recent_events(limit: int = 20, hours: int = 24):
+    """Последние события за hours часов (читаются только свежие секции)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """SELECT e.timestamp, e.initiator_id, e.action, e.details, u.username
+                   FROM event_log e
+                   LEFT JOIN users u ON u.user_id = e.initiator_id
+                   WHERE e.timestamp > NOW() - make_interval(hours => %s)
+                   ORDER BY e.timestamp DESC
+                   LIMIT %s""",
+                (hours, limit)
+            )
+            return await cur.fetchall()
+
+# === EVENT LOG PARTITIONS ===
+
+EVENT_LOG_PARTITION_RE = re.compile(r'^event_log_y(\d{4})m(\d{2})$')
+
+async def create_event_log_partitions(months_ahead: int) -> list:
+    """Создать секции event_log на текущий и months_ahead следующих месяцев"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """SELECT create_event_log_partition(
+                       (date_trunc('month', NOW()) + make_interval(months => m))::date
+                   ) AS name
+                   FROM generate_series(0, %s) AS m""",
+                (months_ahead,)
+            )
+            names = [row['name'] for row in await cur.fetchall()]
+            await conn.commit()
+            return names
+
+async def get_event_log_partitions():
+    """Месячные секции event_log: имя, (год, месяц), подключена ли к event_log.
+    
+    Отсоединённые, но ещё не заархивированные таблицы тоже попадают в список.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """SELECT relname, relispartition FROM pg_class
+                   WHERE relkind = 'r' AND relname LIKE 'event_log_y%%'"""
             )
-            conn.commit()
-    except Exception as e:
-        logger.error(f"Error logging event: {e}")
-    finally:
-        conn.close()
+            rows = await cur.fetchall()
+    
+    partitions = []
+    for row in rows:
+        match = EVENT_LOG_PARTITION_RE.match(row['relname'])
+        if match:
+            month = (int(match.group(1)), int(match.group(2)))
+            partitions.append({'name': row['relname'], 'month': month,
+                               'attached': row['relispartition']})
+    return sorted(partitions, key=lambda p: p['month'])
+
+async def detach_event_log_partition(name: str):
+    """Отсоединить секцию от event_log (данные остаются в отдельной таблице).
+    
+    DETACH ... CONCURRENTLY недоступен: у event_log есть секция DEFAULT.
+    Обычный DETACH берёт эксклюзивную блокировку event_log, поэтому её
+    ожидание ограничено lock_timeout - иначе в очереди за ней встала бы вся
+    запись событий. Не дождались - повтор при следующем запуске задачи.
+    """
+    async with get_connection() as conn:
+        await conn.execute("SET LOCAL lock_timeout = '5s'")
+        await conn.execute(
+            sql.SQL("ALTER TABLE event_log DETACH PARTITION {}").format(sql.Identifier(name))
+        )
+        await conn.commit()
+
+async def export_event_log_partition(name: str, write) -> int:
+    """Выгрузить таблицу секции в CSV (с заголовком) через COPY TO STDOUT.
+    
+    write - корутина, получающая очередной кусок данных. Возвращает число байт.
+    """
+    size = 0
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            query = sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(name))
+            async with cur.copy(query) as copy:
+                async for data in copy:
+                    await write(bytes(data))
+                    size += len(data)
+    return size
+
+async def drop_event_log_partition(name: str):
+    """Удалить отсоединённую и заархивированную секцию"""
+    async with get_connection() as conn:
+        await conn.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        await conn.commit()
+
+# === EXPORT ===
+
+# Выгружаемые таблицы и колонка времени, по которой задаётся период
+EXPORT_TABLES = {
+    'deals': 'date_created',
+    'transactions': 'date',
+    'event_log': 'timestamp',
+}
+
+def _export_query(table: str, since: datetime = None, until: datetime = None):
+    """SELECT строк таблицы за период [since, until) по колонке времени"""
+    column = sql.Identifier(EXPORT_TABLES[table])
+    conditions = []
+    if since:
+        conditions.append(sql.SQL("{} >= %(since)s").format(column))
+    if until:
+        conditions.append(sql.SQL("{} < %(until)s").format(column))
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    query = sql.SQL("SELECT * FROM {table}{where} ORDER BY {column}").format(
+        table=sql.Identifier(table), where=where, column=column
+    )
+    return query, {'since': since, 'until': until}
+
+async def export_csv(table: str, write, since: datetime = None, until: datetime = None) -> int:
+    """Выгрузить строки за период в CSV (с заголовком) через COPY TO STDOUT.
+    
+    write - корутина, получающая очередной кусок данных. Возвращает число байт.
+    """
+    query, params = _export_query(table, since, until)
+    size = 0
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            copy_query = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)").format(query)
+            async with cur.copy(copy_query, params) as copy:
+                async for data in copy:
+                    await write(bytes(data))
+                    size += len(data)
+    return size
+
+async def iter_export_batches(table: str, since: datetime = None, until: datetime = None,
+                              batch_size: int = 5000):
+    """Строки за период пачками по batch_size через серверный курсор.
+    
+    Первым элементом отдаёт описание колонок (cursor.description), затем списки строк.
+    """
+    query, params = _export_query(table, since, until)
+    async with get_connection() as conn:
+        async with conn.cursor(name=f"export_{table}") as cur:
+            await cur.execute(query, params)
+            yield cur.description
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
 
 # === SCHEDULER ===
 
-def expire_old_deals():
-    """Фоновая задача: отменять просроченные сделки"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """UPDATE deals 
-                   SET status = 'expired' 
-                   WHERE status = 'awaiting_payment' 
-                   AND expiry_time < NOW()
-                   RETURNING deal_id"""
+# Общая часть запросов истечения. Строки блокируются с SKIP LOCKED: реплики
+# и очередь сроков не ждут друг друга, а делят просроченные сделки между собой.
+# Telegram ID участников возвращаются сразу - для уведомлений без доп. запросов
+_EXPIRE_DEALS_SQL = """
+    WITH due AS (
+        SELECT deal_id FROM deals
+        WHERE {condition}
+          AND status = 'awaiting_payment'
+          AND expiry_time <= NOW()
+        ORDER BY expiry_time
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE deals d
+    SET status = 'expired'
+    FROM due, users b, users s
+    WHERE d.deal_id = due.deal_id
+      AND b.user_id = d.buyer_id
+      AND s.user_id = d.seller_id
+    RETURNING d.deal_id, d.amount, d.currency, d.buyer_id, d.seller_id,
+              b.telegram_id AS buyer_telegram_id, s.telegram_id AS seller_telegram_id
+"""
+
+async def _expire(condition: str, params: dict):
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_EXPIRE_DEALS_SQL.format(condition=condition), params)
+            expired = await cur.fetchall()
+            await conn.commit()
+    
+    for deal in expired:
+        user_cache.invalidate(deal['buyer_id'], deal['seller_id'])
+        logger.info(f"Deal {deal['deal_id']} expired")
+    return expired
+
+async def get_pending_expiries():
+    """Неоплаченные сделки и их сроки (для очереди истечения при старте)"""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT deal_id, expiry_time FROM deals WHERE status = 'awaiting_payment'"
             )
-            expired = cur.fetchall()
-            conn.commit()
-            
-            for deal in expired:
-                logger.info(f"Deal {deal['deal_id']} expired")
-    finally:
-        conn.close()
+            return await cur.fetchall()
+
+async def expire_deals(deal_ids: list):
+    """Перевести в expired сделки из списка, если они всё ещё не оплачены и срок вышел"""
+    return await _expire("deal_id = ANY(%(ids)s)", {'ids': deal_ids, 'limit': len(deal_ids)})
+
+async def expire_old_deals(limit: int):
+    """Перевести в expired не более limit просроченных неоплаченных сделок"""
+    return await _expire("TRUE", {'limit': limit})
 
 # === FOR ADMIN ===
 
-def get_all_users():
-    """Получить всех пользователей"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users ORDER BY user_id DESC")
-            users = cur.fetchall()
-            return users
-    finally:
-        conn.close()
-
-def get_all_deals():
-    """Получить все сделки"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
+async def get_users_page(limit: int, before_id: int = None, after_id: int = None):
+    """Страница пользователей для админки (от новых к старым).
+    
+    Keyset-пагинация по user_id: before_id - следующая страница,
+    after_id - предыдущая.
+    """
+    params = {'limit': limit}
+    condition = ""
+    order = "DESC"
+    if before_id is not None:
+        condition = "WHERE user_id < %(cursor)s"
+        params['cursor'] = before_id
+    elif after_id is not None:
+        condition = "WHERE user_id > %(cursor)s"
+        params['cursor'] = after_id
+        order = "ASC"
+    
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"""
+                SELECT user_id, telegram_id, username, role, reg_date
+                FROM users {condition}
+                ORDER BY user_id {order}
+                LIMIT %(limit)s
+            """, params)
+            users = await cur.fetchall()
+    
+    if order == "ASC":
+        users.reverse()
+    return users
+
+async def get_deals_page(limit: int, statuses=None, currency: str = None, since: datetime = None,
+                         before_id: int = None, after_id: int = None):
+    """Страница сделок для админки (от новых к старым) с фильтрами.
+    
+    statuses - список статусов, currency - валюта, since - созданы не раньше.
+    Keyset-пагинация по deal_id как в get_users_page. Имена участников
+    подтягиваются только для строк страницы.
+    """
+    params = {'limit': limit}
+    conditions = []
+    if statuses:
+        conditions.append("status = ANY(%(statuses)s)")
+        params['statuses'] = list(statuses)
+    if currency:
+        conditions.append("currency = %(currency)s")
+        params['currency'] = currency
+    if since:
+        conditions.append("date_created >= %(since)s")
+        params['since'] = since
+    
+    order = "DESC"
+    if before_id is not None:
+        conditions.append("deal_id < %(cursor)s")
+        params['cursor'] = before_id
+    elif after_id is not None:
+        conditions.append("deal_id > %(cursor)s")
+        params['cursor'] = after_id
+        order = "ASC"
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"""
                 SELECT d.*, 
                        b.username as buyer_username, 
                        s.username as seller_username
-                FROM deals d
+                FROM (SELECT * FROM deals {where}
+                      ORDER BY deal_id {order}
+                      LIMIT %(limit)s) d
                 LEFT JOIN users b ON d.buyer_id = b.user_id
                 LEFT JOIN users s ON d.seller_id = s.user_id
-                ORDER BY d.deal_id DESC
-            """)
-            deals = cur.fetchall()
-            return deals
-    finally:
-        conn.close()
-
-def get_system_stats():
-    """Получить статистику системы"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            # Количество пользователей
-            cur.execute("SELECT COUNT(*) as count FROM users")
-            total_users = cur.fetchone()['count']
-            
-            # Количество сделок
-            cur.execute("SELECT COUNT(*) as count FROM deals")
-            total_deals = cur.fetchone()['count']
-            
-            # Завершённые сделки
-            cur.execute("SELECT COUNT(*) as count FROM deals WHERE status = 'completed'")
-            completed_deals = cur.fetchone()['count']
-            
-            # Активные сделки
-            cur.execute("SELECT COUNT(*) as count FROM deals WHERE status IN ('awaiting_confirmation', 'awaiting_payment', 'awaiting_admin_confirmation', 'payment_received')")
-            active_deals = cur.fetchone()['count']
-            
-            # Общий объём
-            cur.execute("SELECT SUM(amount) as total FROM deals WHERE status = 'completed'")
-            result = cur.fetchone()['total']
-            total_volume = result if result else 0
-            
-            return {
-                'total_users': total_users,
-                'total_deals': total_deals,
-                'completed_deals': completed_deals,
-                'active_deals': active_deals,
-                'total_volume': total_volume
+                ORDER BY d.deal_id {order}
+            """, params)
+            deals = await cur.fetchall()
+    
+    if order == "ASC":
+        deals.reverse()
+    return deals
+
+def _like_escape(text: str) -> str:
+    """Экранировать спецсимволы LIKE (% _ \\)"""
+    return re.sub(r'([%_\\])', r'\\\1', text)
+
+async def search(query: str, limit: int = 10) -> dict:
+    """Поиск для админки: {'deals': [...], 'users': [...]}.
+    
+    Число - ID сделки, ID или telegram ID пользователя. Текст - префикс
+    username (без @), подстрока кошелька или адреса гаранта (от 3 символов).
+    Каждому условию соответствует индекс из 0011_search_indexes.sql.
+    """
+    query = query.strip().lstrip('@')
+    deals, users = [], []
+    if not query:
+        return {'deals': deals, 'users': users}
+    
+    deal_select = """
+        SELECT d.*, 
+               b.username as buyer_username, 
+               s.username as seller_username
+        FROM deals d
+        LEFT JOIN users b ON d.buyer_id = b.user_id
+        LEFT JOIN users s ON d.seller_id = s.user_id
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            # isdigit() пропускает и не-ASCII цифры ('²'), которые int() не разбирает
+            if query.isascii() and query.isdigit():
+                number = int(query)
+                await cur.execute(deal_select + " WHERE d.deal_id = %s", (number,))
+                deals = await cur.fetchall()
+                await cur.execute("""
+                    SELECT * FROM users WHERE user_id = %(number)s
+                    UNION
+                    SELECT * FROM users WHERE telegram_id = %(number)s
+                    LIMIT %(limit)s
+                """, {'number': number, 'limit': limit})
+                users = await cur.fetchall()
+            else:
+                params = {'prefix': _like_escape(query.lower()) + '%',
+                          'pattern': '%' + _like_escape(query) + '%',
+                          'limit': limit}
+                substring = len(query) >= 3
+                user_conditions = "lower(username) LIKE %(prefix)s"
+                if substring:
+                    user_conditions += " OR wallet_ton ILIKE %(pattern)s OR wallet_btc ILIKE %(pattern)s"
+                await cur.execute(f"""
+                    SELECT * FROM users WHERE {user_conditions}
+                    ORDER BY user_id DESC
+                    LIMIT %(limit)s
+                """, params)
+                users = await cur.fetchall()
+                if substring:
+                    await cur.execute(deal_select + """
+                        WHERE d.garant_payment_address ILIKE %(pattern)s
+                        ORDER BY d.deal_id DESC
+                        LIMIT %(limit)s
+                    """, params)
+                    deals = await cur.fetchall()
+    
+    return {'deals': deals, 'users': users}
+
+def summarize_deal_stats(total_users: int, rows) -> dict:
+    """Сводка для админки из строк (status, currency, count, volume, commission)"""
+    by_status = {}
+    completed_by_currency = {}
+    for row in rows:
+        by_status[row['status']] = by_status.get(row['status'], 0) + row['count']
+        if row['status'] == 'completed':
+            completed_by_currency[row['currency']] = {
+                'count': row['count'],
+                'volume': row['volume'],
+                'commission': row['commission'],
             }
-    finally:
-        conn.close()
+    
+    return {
+        'total_users': total_users,
+        'total_deals': sum(by_status.values()),
+        'completed_deals': by_status.get('completed', 0),
+        'active_deals': sum(by_status.get(status, 0) for status in ACTIVE_DEAL_STATUSES),
+        'total_volume': sum(c['volume'] for c in completed_by_currency.values()),
+        'total_commission': sum(c['commission'] for c in completed_by_currency.values()),
+        'by_status': by_status,
+        'completed_by_currency': completed_by_currency,
+    }
+
+async def get_system_stats():
+    """Получить статистику системы из снимка deal_stats / user_counts.
+    
+    Снимок ведут триггеры, поэтому чтение не зависит от размера deals и users.
+    as_of - время последнего изменения, reconciled_at - последней сверки.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT COALESCE(SUM(count), 0) AS total_users, MAX(updated_at) AS updated_at FROM user_counts"
+            )
+            users = await cur.fetchone()
+            await cur.execute("SELECT reconciled_at FROM stats_snapshot")
+            snapshot = await cur.fetchone()
+            
+            await cur.execute(
+                "SELECT status, currency, count, volume, commission, updated_at FROM deal_stats WHERE count <> 0"
+            )
+            rows = await cur.fetchall()
+    
+    stats = summarize_deal_stats(users['total_users'], rows)
+    changes = [row['updated_at'] for row in rows] + ([users['updated_at']] if users['updated_at'] else [])
+    stats['as_of'] = max(changes) if changes else None
+    stats['reconciled_at'] = snapshot['reconciled_at'] if snapshot else None
+    return stats
 
-def force_cancel_deal(deal_id: int):
+async def reconcile_stats() -> int:
+    """Сверить снимок статистики с deals и users и исправить расхождения.
+    
+    Расхождение считается в одном снимке REPEATABLE READ (триггеры меняют
+    deal_stats в той же транзакции, что и deals, поэтому в любом снимке они
+    совпадают, если дрейфа нет) и прибавляется к счётчикам отдельной
+    транзакцией. Запись в deals и users не блокируется. Выполняется только
+    в одной реплике; в остальных возвращает 0. Возвращает число исправленных строк.
+    """
+    async with try_advisory_lock(STATS_RECONCILE_LOCK_ID) as locked:
+        if not locked:
+            return 0
+        async with get_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                await cur.execute("""
+                    WITH actual AS (
+                        SELECT COALESCE(status, '') AS status, COALESCE(currency, '') AS currency,
+                               COUNT(*) AS count,
+                               COALESCE(SUM(amount), 0) AS volume,
+                               COALESCE(SUM(commission), 0) AS commission
+                        FROM deals
+                        GROUP BY 1, 2
+                    ),
+                    drift AS (
+                        SELECT COALESCE(a.status, s.status) AS status,
+                               COALESCE(a.currency, s.currency) AS currency,
+                               COALESCE(a.count, 0) - COALESCE(s.count, 0) AS count,
+                               COALESCE(a.volume, 0) - COALESCE(s.volume, 0) AS volume,
+                               COALESCE(a.commission, 0) - COALESCE(s.commission, 0) AS commission
+                        FROM actual a
+                        FULL JOIN deal_stats s ON s.status = a.status AND s.currency = a.currency
+                    )
+                    SELECT status, currency, count, volume, commission FROM drift
+                    WHERE (count, volume, commission) <> (0, 0, 0)
+                    ORDER BY status, currency
+                """)
+                drift = await cur.fetchall()
+                await cur.execute("""
+                    WITH actual AS (
+                        SELECT user_id % 16 AS shard, COUNT(*) AS count FROM users GROUP BY 1
+                    )
+                    SELECT c.shard, COALESCE(a.count, 0) - c.count AS drift
+                    FROM user_counts c
+                    LEFT JOIN actual a ON a.shard = c.shard
+                    WHERE COALESCE(a.count, 0) <> c.count
+                    ORDER BY c.shard
+                """)
+                users_drift = await cur.fetchall()
+                await conn.commit()
+                
+                # Поправки прибавляются к текущим значениям и не затирают
+                # изменения, сделанные триггерами после снимка. Строки берутся
+                # в том же порядке, что и в триггерах, - без взаимоблокировок
+                if drift:
+                    await cur.executemany("""
+                        INSERT INTO deal_stats AS ds (status, currency, count, volume, commission)
+                        VALUES (%(status)s, %(currency)s, %(count)s, %(volume)s, %(commission)s)
+                        ON CONFLICT (status, currency) DO UPDATE
+                        SET count = ds.count + EXCLUDED.count,
+                            volume = ds.volume + EXCLUDED.volume,
+                            commission = ds.commission + EXCLUDED.commission,
+                            updated_at = now()
+                    """, drift)
+                if users_drift:
+                    await cur.executemany(
+                        """UPDATE user_counts SET count = count + %(drift)s, updated_at = now()
+                           WHERE shard = %(shard)s""",
+                        users_drift
+                    )
+                await cur.execute("UPDATE stats_snapshot SET reconciled_at = now()")
+                await conn.commit()
+                return len(drift) + len(users_drift)
+
+async def force_cancel_deal(deal_id: int):
     """Принудительная отмена сделки админом"""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE deals SET status = %s WHERE deal_id = %s",
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE deals SET status = %s WHERE deal_id = %s RETURNING buyer_id, seller_id",
                 ('cancelled', deal_id)
             )
-            conn.commit()
-    finally:
-        conn.close()
+            parties = await cur.fetchone()
+            await conn.commit()
+    
+    if parties:
+        user_cache.invalidate(parties['buyer_id'], parties['seller_id'])
@@ -0,0 +1,122 @@
+# Истечение неоплаченных сделок точно по expiry_time
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from database import get_pending_expiries, expire_deals, expire_old_deals
+from config import EXPIRY_SWEEP_BATCH_SIZE
+from notifier import notify
+
+logger = logging.getLogger(__name__)
+
+# Сделки со сроком в пределах окна истекают одним запросом
+EXPIRY_BATCH_WINDOW = 1.0
+EXPIRY_BATCH_SIZE = 100
+EXPIRY_RETRY_DELAY = 30
+
+_deadlines = []  # куча (expiry_time, deal_id)
+_wakeup = asyncio.Event()
+_task = None
+
+
+def schedule_expiry(deal_id: int, expiry_time: datetime):
+    """Поставить сделку в очередь истечения (после перехода в awaiting_payment)"""
+    if expiry_time is None:
+        return
+    earliest = _deadlines[0][0] if _deadlines else None
+    heapq.heappush(_deadlines, (expiry_time, deal_id))
+    # Будим цикл, только если новый срок раньше того, которого он ждёт
+    if earliest is None or expiry_time < earliest:
+        _wakeup.set()
+
+
+async def start_expiry():
+    """Загрузить сроки неоплаченных сделок из БД и запустить цикл истечения"""
+    global _task
+    rows = await get_pending_expiries()
+    _deadlines[:] = [(row['expiry_time'], row['deal_id']) for row in rows if row['expiry_time']]
+    heapq.heapify(_deadlines)
+    if _task is None:
+        _task = asyncio.create_task(_run())
+    logger.info(f"Deal expiry started ({len(_deadlines)} deals awaiting payment)")
+
+
+async def stop_expiry():
+    """Остановить цикл истечения"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+        logger.info("Deal expiry stopped")
+
+
+async def _run():
+    while True:
+        _wakeup.clear()
+        if not _deadlines:
+            await _wakeup.wait()
+            continue
+
+        delay = (_deadlines[0][0] - datetime.now(timezone.utc)).total_seconds()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+                continue  # появился более ранний срок
+            except asyncio.TimeoutError:
+                pass
+
+        now = datetime.now(timezone.utc)
+        horizon = now + timedelta(seconds=EXPIRY_BATCH_WINDOW)
+        batch = []
+        latest = now
+        while _deadlines and len(batch) < EXPIRY_BATCH_SIZE and _deadlines[0][0] <= horizon:
+            expiry_time, deal_id = heapq.heappop(_deadlines)
+            batch.append(deal_id)
+            latest = max(latest, expiry_time)
+
+        # Часть сроков в окне ещё впереди: ждём последний, чтобы NOW() в БД его прошёл
+        delay = (latest - datetime.now(timezone.utc)).total_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        try:
+            expired = await expire_deals(batch)
+        except Exception as e:
+            logger.error(f"Error expiring deals {batch}: {e}")
+            # Вернём сделки в очередь и повторим позже
+            retry_at = datetime.now(timezone.utc) + timedelta(seconds=EXPIRY_RETRY_DELAY)
+            for deal_id in batch:
+                heapq.heappush(_deadlines, (retry_at, deal_id))
+            continue
+
+        # Оплаченные и отменённые к этому моменту сделки UPDATE просто не вернёт,
+        # а истёкшие в другом воркере - уже не в статусе awaiting_payment
+        notify_expired(expired)
+
+
+async def expire_overdue_deals():
+    """Страховочный проход планировщика: сделки, сроки которых не попали
+    в очередь этого процесса (созданы другим воркером, пропущены при сбое)"""
+    # Пачками: каждая транзакция короткая, а реплики берут разные сделки (SKIP LOCKED)
+    while True:
+        expired = await expire_old_deals(EXPIRY_SWEEP_BATCH_SIZE)
+        notify_expired(expired)
+        if len(expired) < EXPIRY_SWEEP_BATCH_SIZE:
+            break
+
+
+def notify_expired(deals):
+    """Поставить уведомления обоим участникам в очередь отправки"""
+    for deal in deals:
+        text = (
+            f"⏰ Сделка #{deal['deal_id']} истекла\n\n"
+            f"💰 {deal['amount']} {deal['currency']}\n"
+            f"Оплата не поступила вовремя, сделка закрыта."
+        )
+        notify(deal['buyer_telegram_id'], text)
+        notify(deal['seller_telegram_id'], text)
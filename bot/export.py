@@ -0,0 +1,137 @@
+# Выгрузка deals, transactions и event_log за период в сжатый файл
+#
+# CSV идёт потоком COPY TO STDOUT прямо в gzip, Parquet (нужен пакет pyarrow) -
+# пачками через серверный курсор. В памяти не больше одной пачки строк,
+# сколько бы их ни было в таблице.
+#
+# Из командной строки:
+#   python export.py deals --since 2026-01-01 --until 2026-02-01 [--format parquet] [-o файл]
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+from datetime import datetime, timezone
+from psycopg.postgres import types as pg_types
+from config import EXPORT_BATCH_SIZE
+from database import EXPORT_TABLES, export_csv, iter_export_batches, open_pool, close_pool
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+
+def export_filename(table: str, since: datetime = None, until: datetime = None, fmt: str = 'csv') -> str:
+    """Имя файла выгрузки: deals_2026-01-01_2026-02-01.csv.gz"""
+    period = f"{since:%Y-%m-%d}" if since else 'start'
+    period += f"_{until:%Y-%m-%d}" if until else '_now'
+    extension = 'csv.gz' if fmt == 'csv' else 'parquet'
+    return f"{table}_{period}.{extension}"
+
+
+async def export_table(table: str, path: str, since: datetime = None, until: datetime = None,
+                       fmt: str = 'csv') -> int:
+    """Выгрузить строки таблицы за период [since, until) в файл path. Возвращает размер файла"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table {table}, expected one of: {', '.join(EXPORT_TABLES)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of: {', '.join(EXPORT_FORMATS)}")
+
+    # Файл появляется под своим именем только целиком
+    tmp_path = f"{path}.tmp"
+    try:
+        if fmt == 'csv':
+            await _export_csv(table, tmp_path, since, until)
+        else:
+            await _export_parquet(table, tmp_path, since, until)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    size = os.path.getsize(path)
+    logger.info(f"Exported {table} ({since} - {until}) to {path} ({size} bytes)")
+    return size
+
+
+async def _export_csv(table: str, path: str, since: datetime, until: datetime):
+    # Сжатие и запись на диск - в потоке, чтобы не блокировать event loop
+    archive = await asyncio.to_thread(gzip.open, path, 'wb')
+    try:
+        async def write(data: bytes):
+            await asyncio.to_thread(archive.write, data)
+        await export_csv(table, write, since, until)
+    finally:
+        await asyncio.to_thread(archive.close)
+
+
+def _arrow_type(pa, column):
+    """Тип колонки Parquet по типу PostgreSQL (неизвестные - строкой)"""
+    info = pg_types.get(column.type_code)
+    name = info.name if info else None
+    if name in ('int2', 'int4', 'int8'):
+        return pa.int64()
+    if name == 'numeric':
+        return pa.decimal128(column.precision or 38, column.scale if column.scale is not None else 10)
+    if name in ('float4', 'float8'):
+        return pa.float64()
+    if name == 'bool':
+        return pa.bool_()
+    if name == 'timestamptz':
+        return pa.timestamp('us', tz='UTC')
+    if name == 'timestamp':
+        return pa.timestamp('us')
+    if name == 'date':
+        return pa.date32()
+    return pa.string()
+
+
+async def _export_parquet(table: str, path: str, since: datetime, until: datetime):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Формат parquet требует пакет pyarrow (pip install pyarrow)")
+
+    batches = iter_export_batches(table, since, until, EXPORT_BATCH_SIZE)
+    try:
+        description = await anext(batches)
+        schema = pa.schema([(column.name, _arrow_type(pa, column)) for column in description])
+        writer = await asyncio.to_thread(pq.ParquetWriter, path, schema, compression='zstd')
+        try:
+            # Каждая пачка - отдельная row group
+            async for rows in batches:
+                await asyncio.to_thread(writer.write_table, pa.Table.from_pylist(rows, schema=schema))
+        finally:
+            await asyncio.to_thread(writer.close)
+    finally:
+        await batches.aclose()
+
+
+def parse_date(value: str) -> datetime:
+    """ГГГГ-ММ-ДД -> начало дня UTC"""
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+async def main(args):
+    path = args.output or export_filename(args.table, args.since, args.until, args.format)
+    await open_pool()
+    try:
+        await export_table(args.table, path, args.since, args.until, args.format)
+    finally:
+        await close_pool()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Выгрузка таблицы за период в сжатый файл")
+    parser.add_argument('table', choices=list(EXPORT_TABLES))
+    parser.add_argument('--since', type=parse_date, help="с даты включительно (ГГГГ-ММ-ДД, UTC)")
+    parser.add_argument('--until', type=parse_date, help="по дату не включительно (ГГГГ-ММ-ДД, UTC)")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('-o', '--output', help="путь к файлу (по умолчанию - имя по таблице и периоду)")
+    asyncio.run(main(parser.parse_args()))
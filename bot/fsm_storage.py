@@ -0,0 +1,76 @@
+from typing import Any, Dict, Mapping, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+from config import FSM_STORAGE, FSM_TTL, REDIS_URL
+from database import fsm_get, fsm_set_state, fsm_set_data, fsm_update_data
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_storage.
+
+    Диалоги переживают перезапуск и доступны всем репликам бота.
+    Записи старше ttl секунд считаются брошенными: они не читаются
+    и удаляются задачей планировщика.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(str(key.thread_id))
+        business_connection_id = getattr(key, 'business_connection_id', None)
+        if business_connection_id:
+            parts.append(str(business_connection_id))
+        parts.append(key.destiny)
+        return ':'.join(parts)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await fsm_set_state(self._key(key), state, self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await fsm_get(self._key(key), self.ttl)
+        return row['state'] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await fsm_set_data(self._key(key), dict(data), self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await fsm_get(self._key(key), self.ttl)
+        return dict(row['data']) if row else {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        # Слияние на стороне БД: один запрос вместо get_data + set_data
+        return dict(await fsm_update_data(self._key(key), dict(data), self.ttl))
+
+    async def close(self) -> None:
+        # Соединениями владеет общий пул database.pool
+        pass
+
+
+def create_storage() -> BaseStorage:
+    """FSM-хранилище по настройке FSM_STORAGE: postgres, redis или memory"""
+    if FSM_STORAGE == 'postgres':
+        logger.info(f"FSM storage: postgres (ttl={FSM_TTL}s)")
+        return PostgresStorage(ttl=FSM_TTL)
+
+    if FSM_STORAGE == 'redis':
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise RuntimeError("FSM_STORAGE=redis требует пакет redis (pip install redis)")
+        logger.info(f"FSM storage: redis {REDIS_URL} (ttl={FSM_TTL}s)")
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+
+    if FSM_STORAGE == 'memory':
+        logger.warning("FSM storage: memory (состояния теряются при перезапуске)")
+        return MemoryStorage()
+
+    raise ValueError(f"Unknown FSM_STORAGE: {FSM_STORAGE}")
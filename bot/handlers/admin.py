@@ -1,18 +1,67 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command, CommandObject
 from database import (get_deal_by_id, update_deal_status, get_user_by_id, 
-                     get_all_users, get_all_deals, get_system_stats, force_cancel_deal)
+                     get_users_page, get_deals_page, get_system_stats, force_cancel_deal,
+                     log_event, get_recent_events, search, ACTIVE_DEAL_STATUSES, EXPORT_TABLES)
 from config import ADMIN_ID
+from keyboards.inline import admin_page_keyboard
+from export import EXPORT_FORMATS, export_filename, export_table, parse_date
+from utils.receipt_store import send_receipt
+from notifier import notify
+from datetime import datetime, timedelta, timezone
+import asyncio
+import html
 import logging
+import os
+import re
+import tempfile
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+# Лимит длины сообщения Telegram
+MESSAGE_LIMIT = 4096
+ADMIN_USERS_PAGE_SIZE = 30
+ADMIN_DEALS_PAGE_SIZE = 15
+FIND_LIMIT = 10
+# Сколько символов запроса повторять в заголовке ответа /find
+FIND_QUERY_ECHO_LIMIT = 100
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+_export_lock = asyncio.Lock()
+
+DEAL_CURRENCIES = ('TON', 'BTC')
+
+STATUS_EMOJI = {
+    'awaiting_confirmation': '⏳',
+    'awaiting_payment': '💳',
+    'awaiting_admin_confirmation': '🔍',
+    'payment_received': '✅',
+    'payment_rejected': '❌',
+    'awaiting_delivery': '📦',
+    'completed': '✅',
+    'cancelled': '❌',
+    'expired': '⏰'
+}
+
+# Группы статусов для фильтра /deals
+DEAL_FILTER_GROUPS = {
+    'active': ACTIVE_DEAL_STATUSES,
+    'closed': ('cancelled', 'expired', 'payment_rejected'),
+}
+
 def is_admin(user_id: int) -> bool:
     """Проверка админа"""
     return user_id == ADMIN_ID
 
+def stats_freshness(stats: dict) -> str:
+    """Строка "по состоянию на" для снимка статистики"""
+    as_of = stats['as_of'].astimezone(timezone.utc).strftime('%d.%m.%Y %H:%M:%S') if stats['as_of'] else '—'
+    reconciled = (stats['reconciled_at'].astimezone(timezone.utc).strftime('%d.%m.%Y %H:%M')
+                  if stats['reconciled_at'] else '—')
+    return f"🕒 Данные на {as_of} UTC (сверка {reconciled})"
+
 @router.message(Command("admin"))
 async def cmd_admin(message: Message):
     """Команда /admin - главная админ-панель"""
@@ -20,7 +69,7 @@ async def cmd_admin(message: Message):
         await message.answer("❌ У вас нет доступа к этой команде")
         return
     
-    stats = get_system_stats()
+    stats = await get_system_stats()
     
     text = (
         f"🔧 <b>Админ-панель</b>\n\n"
@@ -29,127 +78,318 @@ async def cmd_admin(message: Message):
         f"💼 Всего сделок: {stats['total_deals']}\n"
         f"✅ Завершено: {stats['completed_deals']}\n"
         f"⏳ Активных: {stats['active_deals']}\n"
-        f"💰 Общий объём: {stats['total_volume']:.2f}\n\n"
+        f"💰 Общий объём: {stats['total_volume']:.2f}\n"
+        f"{stats_freshness(stats)}\n\n"
         f"<b>Доступные команды:</b>\n"
         f"/users - Список пользователей\n"
-        f"/deals - Список сделок\n"
+        f"/deals [статус] [TON|BTC] [7d|ГГГГ-ММ-ДД] - Список сделок\n"
         f"/active_deals - Активные сделки\n"
-        f"/stats - Детальная статистика"
+        f"/find ЗАПРОС - Поиск по ID, @username, кошельку, адресу\n"
+        f"/stats - Детальная статистика\n"
+        f"/logs - События за последние сутки\n"
+        f"/export ТАБЛИЦА [С] [ПО] [csv|parquet] - Выгрузка файлом\n"
+        f"/receipt_ID - Квитанции по сделке"
     )
     
     await message.answer(text, parse_mode="HTML")
 
+def split_message(header: str, blocks, limit: int = MESSAGE_LIMIT) -> list:
+    """Разбить список на сообщения не длиннее limit символов, не разрывая блоки"""
+    chunks = []
+    current = header
+    for block in blocks:
+        if current and len(current) + len(block) > limit:
+            chunks.append(current)
+            current = ""
+        current += block
+    chunks.append(current)
+    return chunks
+
+def page_cursors(rows, page_size: int, direction: str, key: str):
+    """Обрезать выборку на page_size + 1 строк до страницы и найти курсоры листания"""
+    # Лишняя запись говорит о наличии ещё одной страницы в направлении листания
+    has_more = len(rows) > page_size
+    if direction == 'p':
+        rows = rows[1:] if has_more else rows
+        has_newer, has_older = has_more, True
+    else:
+        rows = rows[:page_size]
+        has_newer, has_older = direction == 'n', has_more
+    
+    if not rows:
+        return rows, None, None
+    return rows, rows[0][key] if has_newer else None, rows[-1][key] if has_older else None
+
+async def send_page(message: Message, chunks, keyboard):
+    """Отправить страницу списка; кнопки листания - под последним сообщением"""
+    for i, chunk in enumerate(chunks):
+        await message.answer(chunk, parse_mode="HTML",
+                             reply_markup=keyboard if i == len(chunks) - 1 else None)
+
+async def show_page(callback: CallbackQuery, chunks, keyboard):
+    """Показать страницу по кнопке: на месте, если она помещается в одно сообщение"""
+    if len(chunks) == 1:
+        await callback.message.edit_text(chunks[0], parse_mode="HTML", reply_markup=keyboard)
+    else:
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await send_page(callback.message, chunks, keyboard)
+    await callback.answer()
+
+def format_user(user: dict, wallets: bool = False) -> str:
+    """Блок пользователя для админских списков"""
+    username = user['username'] if user['username'] else 'Без username'
+    text = (
+        f"🆔 ID: {user['user_id']}\n"
+        f"👤 Username: @{html.escape(username)}\n"
+        f"🔗 TG ID: <code>{user['telegram_id']}</code>\n"
+    )
+    if wallets:
+        text += (
+            f"💎 TON: <code>{html.escape(user['wallet_ton'] or '—')}</code>\n"
+            f"₿ BTC: <code>{html.escape(user['wallet_btc'] or '—')}</code>\n"
+        )
+    return text + "\n"
+
+def format_deal(deal: dict) -> str:
+    """Блок сделки для админских списков (с командой отмены для активных)"""
+    emoji = STATUS_EMOJI.get(deal['status'], '❓')
+    buyer_username = deal['buyer_username'] if deal['buyer_username'] else 'Без username'
+    seller_username = deal['seller_username'] if deal['seller_username'] else 'Без username'
+    text = (
+        f"{emoji} <b>Сделка #{deal['deal_id']}</b>\n"
+        f"💵 Сумма: {deal['amount']} {deal['currency']}\n"
+        f"👤 Покупатель: @{html.escape(buyer_username)} (ID: {deal['buyer_id']})\n"
+        f"👤 Продавец: @{html.escape(seller_username)} (ID: {deal['seller_id']})\n"
+        f"📊 Статус: {deal['status']}\n"
+    )
+    if deal['status'] in ACTIVE_DEAL_STATUSES:
+        text += f"🗑 Отменить: /cancel_deal_{deal['deal_id']}\n"
+    return text + "\n"
+
+async def render_users_page(direction: str = None, cursor: int = None):
+    """Текст (по сообщениям) и клавиатура страницы списка пользователей"""
+    users = await get_users_page(
+        ADMIN_USERS_PAGE_SIZE + 1,
+        before_id=cursor if direction == 'n' else None,
+        after_id=cursor if direction == 'p' else None
+    )
+    users, newer, older = page_cursors(users, ADMIN_USERS_PAGE_SIZE, direction, 'user_id')
+    
+    if not users:
+        return ["❌ Пользователей нет"], None
+    
+    blocks = [format_user(user) for user in users]
+    header = f"👥 <b>Пользователи (ID {users[0]['user_id']}–{users[-1]['user_id']}):</b>\n\n"
+    return split_message(header, blocks), admin_page_keyboard("ausers", newer, older)
+
+def parse_deal_filters(tokens) -> dict:
+    """Фильтры /deals из аргументов: статус или группа, валюта, 7d или ГГГГ-ММ-ДД.
+    
+    Неизвестный или повторный аргумент - ValueError.
+    """
+    filters = {}
+    for token in tokens:
+        if token.lower() in DEAL_FILTER_GROUPS:
+            name, value = 'statuses', list(DEAL_FILTER_GROUPS[token.lower()])
+        elif token.lower() in STATUS_EMOJI:
+            name, value = 'statuses', [token.lower()]
+        elif token.upper() in DEAL_CURRENCIES:
+            name, value = 'currency', token.upper()
+        elif re.fullmatch(r'\d{1,4}d', token.lower()):
+            name, value = 'since', datetime.now(timezone.utc) - timedelta(days=int(token[:-1]))
+        elif re.fullmatch(r'\d{4}-\d{2}-\d{2}', token):
+            try:
+                name, value = 'since', datetime.strptime(token, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except ValueError:
+                raise ValueError(token)
+        else:
+            raise ValueError(token)
+        # По одному фильтру каждого вида: так callback_data укладывается в 64 байта
+        if name in filters:
+            raise ValueError(token)
+        filters[name] = value
+    return filters
+
+async def render_deals_page(filter_key: str, direction: str = None, cursor: int = None):
+    """Текст (по сообщениям) и клавиатура страницы списка сделок.
+    
+    filter_key - аргументы /deals через точку ("-" без фильтров); он же
+    попадает в callback_data, поэтому фильтры применяются и при листании.
+    """
+    tokens = [] if filter_key == '-' else filter_key.split('.')
+    filters = parse_deal_filters(tokens)
+    deals = await get_deals_page(
+        ADMIN_DEALS_PAGE_SIZE + 1,
+        **filters,
+        before_id=cursor if direction == 'n' else None,
+        after_id=cursor if direction == 'p' else None
+    )
+    deals, newer, older = page_cursors(deals, ADMIN_DEALS_PAGE_SIZE, direction, 'deal_id')
+    
+    title = "⏳ <b>Активные сделки</b>" if filter_key == 'active' else "💼 <b>Сделки</b>"
+    if tokens and filter_key != 'active':
+        title += f" ({' '.join(tokens)})"
+    
+    if not deals:
+        return [f"{title}\n\n❌ Сделок нет"], None
+    
+    blocks = [format_deal(deal) for deal in deals]
+    return split_message(f"{title}:\n\n", blocks), admin_page_keyboard(f"adeals:{filter_key}", newer, older)
+
 @router.message(Command("users"))
 async def cmd_users(message: Message):
-    """Список всех пользователей"""
+    """Список пользователей (постранично)"""
     if not is_admin(message.from_user.id):
         await message.answer("❌ У вас нет доступа к этой команде")
         return
     
-    users = get_all_users()
-    
-    if not users:
-        await message.answer("❌ Пользователей нет")
+    chunks, keyboard = await render_users_page()
+    await send_page(message, chunks, keyboard)
+
+@router.message(Command("deals"))
+async def cmd_deals(message: Message, command: CommandObject):
+    """Список сделок (постранично): /deals [статус|active|closed] [TON|BTC] [7d|ГГГГ-ММ-ДД]"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет доступа к этой команде")
         return
     
-    text = f"👥 <b>Список пользователей ({len(users)}):</b>\n\n"
-    
-    for user in users[:50]:  # Показываем первых 50
-        username = user['username'] if user['username'] else 'Без username'
-        text += (
-            f"🆔 ID: {user['user_id']}\n"
-            f"👤 Username: @{username}\n"
-            f"🔗 TG ID: <code>{user['telegram_id']}</code>\n\n"
+    tokens = command.args.split() if command.args else []
+    try:
+        parse_deal_filters(tokens)
+    except ValueError as e:
+        await message.answer(
+            f"❌ Неизвестный фильтр: {html.escape(str(e))}\n\n"
+            f"Формат: /deals [статус|active|closed] [TON|BTC] [7d|ГГГГ-ММ-ДД]"
         )
+        return
     
-    if len(users) > 50:
-        text += f"\n... и ещё {len(users) - 50} пользователей"
-    
-    await message.answer(text, parse_mode="HTML")
+    chunks, keyboard = await render_deals_page('.'.join(tokens) or '-')
+    await send_page(message, chunks, keyboard)
 
-@router.message(Command("deals"))
-async def cmd_deals(message: Message):
-    """Список всех сделок"""
+@router.message(Command("active_deals"))
+async def cmd_active_deals(message: Message):
+    """Активные сделки с командами отмены"""
     if not is_admin(message.from_user.id):
         await message.answer("❌ У вас нет доступа к этой команде")
         return
     
-    deals = get_all_deals()
+    chunks, keyboard = await render_deals_page('active')
+    await send_page(message, chunks, keyboard)
+
+@router.message(Command("find"))
+async def cmd_find(message: Message, command: CommandObject):
+    """Поиск: /find <ID сделки | telegram ID | @username | кошелёк | адрес гаранта>"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет доступа к этой команде")
+        return
     
-    if not deals:
-        await message.answer("❌ Сделок нет")
+    if not command.args:
+        await message.answer("Формат: /find <ID сделки | telegram ID | @username | кошелёк | адрес гаранта>")
         return
     
-    status_emoji = {
-        'awaiting_confirmation': '⏳',
-        'awaiting_payment': '💳',
-        'awaiting_admin_confirmation': '🔍',
-        'payment_received': '✅',
-        'payment_rejected': '❌',
-        'completed': '✅',
-        'cancelled': '❌',
-        'expired': '⏰'
-    }
-    
-    text = f"💼 <b>Все сделки ({len(deals)}):</b>\n\n"
-    
-    for deal in deals[:30]:  # Показываем первых 30
-        emoji = status_emoji.get(deal['status'], '❓')
-        buyer_username = deal['buyer_username'] if deal['buyer_username'] else 'Без username'
-        seller_username = deal['seller_username'] if deal['seller_username'] else 'Без username'
-        
-        text += (
-            f"{emoji} <b>Сделка #{deal['deal_id']}</b>\n"
-            f"💵 Сумма: {deal['amount']} {deal['currency']}\n"
-            f"👤 Покупатель: @{buyer_username}\n"
-            f"👤 Продавец: @{seller_username}\n"
-            f"📊 Статус: {deal['status']}\n\n"
-        )
+    results = await search(command.args, limit=FIND_LIMIT)
     
-    if len(deals) > 30:
-        text += f"\n... и ещё {len(deals) - 30} сделок"
+    if not results['deals'] and not results['users']:
+        await message.answer("🔍 Ничего не найдено")
+        return
     
-    await message.answer(text, parse_mode="HTML")
+    blocks = []
+    if results['deals']:
+        blocks.append(f"💼 <b>Сделки ({len(results['deals'])}):</b>\n\n")
+        blocks.extend(format_deal(deal) for deal in results['deals'])
+    if results['users']:
+        blocks.append(f"👥 <b>Пользователи ({len(results['users'])}):</b>\n\n")
+        blocks.extend(format_user(user, wallets=True) for user in results['users'])
+    
+    query = command.args.strip()
+    if len(query) > FIND_QUERY_ECHO_LIMIT:
+        query = query[:FIND_QUERY_ECHO_LIMIT] + '…'
+    header = f"🔍 <b>Поиск:</b> {html.escape(query)}\n\n"
+    await send_page(message, split_message(header, blocks), None)
 
-@router.message(Command("active_deals"))
-async def cmd_active_deals(message: Message):
-    """Активные сделки с кнопками отмены"""
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    """Выгрузка таблицы за период файлом: /export таблица [с] [по] [csv|parquet]"""
     if not is_admin(message.from_user.id):
         await message.answer("❌ У вас нет доступа к этой команде")
         return
     
-    deals = get_all_deals()
-    active_statuses = ['awaiting_confirmation', 'awaiting_payment', 'awaiting_admin_confirmation', 'payment_received']
-    active_deals = [d for d in deals if d['status'] in active_statuses]
+    usage = (
+        f"Формат: /export {'|'.join(EXPORT_TABLES)} [ГГГГ-ММ-ДД] [ГГГГ-ММ-ДД] [csv|parquet]\n"
+        f"Период - с первой даты включительно по вторую не включительно"
+    )
+    tokens = command.args.split() if command.args else []
+    if not tokens or tokens[0] not in EXPORT_TABLES:
+        await message.answer(usage)
+        return
     
-    if not active_deals:
-        await message.answer("✅ Активных сделок нет")
+    table, dates, fmt = tokens[0], [], 'csv'
+    try:
+        for token in tokens[1:]:
+            if token.lower() in EXPORT_FORMATS:
+                fmt = token.lower()
+            else:
+                dates.append(parse_date(token))
+    except ValueError:
+        await message.answer(usage)
+        return
+    if len(dates) > 2:
+        await message.answer(usage)
         return
+    since, until = (dates + [None, None])[:2]
     
-    status_emoji = {
-        'awaiting_confirmation': '⏳',
-        'awaiting_payment': '💳',
-        'awaiting_admin_confirmation': '🔍',
-        'payment_received': '✅'
-    }
+    # Выгрузка держит соединение из пула до конца - по одной за раз
+    if _export_lock.locked():
+        await message.answer("⏳ Уже выполняется другая выгрузка, попробуйте позже")
+        return
     
-    text = f"⏳ <b>Активные сделки ({len(active_deals)}):</b>\n\n"
+    async with _export_lock:
+        await message.answer(f"⏳ Выгружаю {table}...")
+        filename = export_filename(table, since, until, fmt)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, filename)
+            try:
+                size = await export_table(table, path, since, until, fmt)
+            except Exception as e:
+                logger.error(f"Export of {table} failed: {e}")
+                await message.answer(f"❌ Ошибка выгрузки: {e}")
+                return
+            
+            if size > TELEGRAM_DOCUMENT_LIMIT:
+                await message.answer(
+                    f"❌ Файл {size // (1024 * 1024)} МБ больше лимита Telegram (50 МБ).\n"
+                    f"Сузьте период или выгрузите через python export.py"
+                )
+                return
+            
+            await message.answer_document(FSInputFile(path, filename=filename),
+                                          caption=f"📦 {filename} ({size // 1024} КБ)")
+    
+    await log_event(None, 'admin_export', {'table': table, 'format': fmt,
+                                           'since': str(since), 'until': str(until),
+                                           'admin_telegram_id': message.from_user.id})
+
+@router.callback_query(F.data.startswith("ausers:"))
+async def users_page_callback(callback: CallbackQuery):
+    """Листание списка пользователей: ausers:<p|n>:<user_id>"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
     
-    for deal in active_deals:
-        emoji = status_emoji.get(deal['status'], '❓')
-        buyer_username = deal['buyer_username'] if deal['buyer_username'] else 'Без username'
-        seller_username = deal['seller_username'] if deal['seller_username'] else 'Без username'
-        
-        text += (
-            f"{emoji} <b>Сделка #{deal['deal_id']}</b>\n"
-            f"💵 Сумма: {deal['amount']} {deal['currency']}\n"
-            f"👤 Покупатель: @{buyer_username} (ID: {deal['buyer_id']})\n"
-            f"👤 Продавец: @{seller_username} (ID: {deal['seller_id']})\n"
-            f"📊 Статус: {deal['status']}\n"
-            f"🗑 Отменить: /cancel_deal_{deal['deal_id']}\n\n"
-        )
+    _, direction, cursor = callback.data.split(":")
+    chunks, keyboard = await render_users_page(direction, int(cursor))
+    await show_page(callback, chunks, keyboard)
+
+@router.callback_query(F.data.startswith("adeals:"))
+async def deals_page_callback(callback: CallbackQuery):
+    """Листание списка сделок: adeals:<фильтры>:<p|n>:<deal_id>"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
     
-    await message.answer(text, parse_mode="HTML")
+    _, filter_key, direction, cursor = callback.data.split(":")
+    chunks, keyboard = await render_deals_page(filter_key, direction, int(cursor))
+    await show_page(callback, chunks, keyboard)
 
 @router.message(Command("stats"))
 async def cmd_stats(message: Message):
@@ -158,17 +398,14 @@ async def cmd_stats(message: Message):
         await message.answer("❌ У вас нет доступа к этой команде")
         return
     
-    stats = get_system_stats()
-    deals = get_all_deals()
-    
-    # Статистика по валютам
-    ton_deals = len([d for d in deals if d['currency'] == 'TON' and d['status'] == 'completed'])
-    btc_deals = len([d for d in deals if d['currency'] == 'BTC' and d['status'] == 'completed'])
-    usdt_deals = len([d for d in deals if d['currency'] == 'USDT' and d['status'] == 'completed'])
+    stats = await get_system_stats()
+    by_status = stats['by_status']
     
-    # Статистика по статусам
-    cancelled = len([d for d in deals if d['status'] == 'cancelled'])
-    expired = len([d for d in deals if d['status'] == 'expired'])
+    currency_lines = "".join(
+        f"  • {currency}: {data['count']} сделок, {data['volume']:.2f} "
+        f"(комиссия {data['commission']:.2f})\n"
+        for currency, data in sorted(stats['completed_by_currency'].items())
+    ) or "  • нет\n"
     
     text = (
         f"📊 <b>Детальная статистика</b>\n\n"
@@ -177,17 +414,43 @@ async def cmd_stats(message: Message):
         f"  • Всего: {stats['total_deals']}\n"
         f"  • ✅ Завершено: {stats['completed_deals']}\n"
         f"  • ⏳ Активных: {stats['active_deals']}\n"
-        f"  • ❌ Отменено: {cancelled}\n"
-        f"  • ⏰ Истекло: {expired}\n\n"
+        f"  • ❌ Отменено: {by_status.get('cancelled', 0)}\n"
+        f"  • ⏰ Истекло: {by_status.get('expired', 0)}\n"
+        f"  • 🚫 Оплата отклонена: {by_status.get('payment_rejected', 0)}\n\n"
         f"💰 <b>По валютам (завершённые):</b>\n"
-        f"  • TON: {ton_deals}\n"
-        f"  • BTC: {btc_deals}\n"
-        f"  • USDT: {usdt_deals}\n\n"
-        f"💵 <b>Общий объём:</b> {stats['total_volume']:.2f}"
+        f"{currency_lines}\n"
+        f"💵 <b>Общий объём:</b> {stats['total_volume']:.2f}\n"
+        f"🏦 <b>Комиссия:</b> {stats['total_commission']:.2f}\n\n"
+        f"{stats_freshness(stats)}"
     )
     
     await message.answer(text, parse_mode="HTML")
 
+@router.message(Command("logs"))
+async def cmd_logs(message: Message):
+    """Последние события из event_log"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет доступа к этой команде")
+        return
+    
+    events = await get_recent_events(limit=20, hours=24)
+    
+    if not events:
+        await message.answer("📜 За последние сутки событий нет")
+        return
+    
+    text = f"📜 <b>Последние события ({len(events)}):</b>\n\n"
+    
+    for event in events:
+        initiator = f"@{event['username']}" if event['username'] else (event['initiator_id'] or 'system')
+        text += (
+            f"🕒 {event['timestamp'].strftime('%d.%m %H:%M:%S')} "
+            f"<b>{event['action']}</b> ({html.escape(str(initiator))})\n"
+            f"   {html.escape((event['details'] or '')[:200])}\n"
+        )
+    
+    await message.answer(text, parse_mode="HTML")
+
 @router.message(F.text.startswith("/cancel_deal_"))
 async def cmd_cancel_deal(message: Message):
     """Принудительная отмена сделки"""
@@ -201,7 +464,7 @@ async def cmd_cancel_deal(message: Message):
         await message.answer("❌ Неверный формат команды")
         return
     
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     
     if not deal:
         await message.answer("❌ Сделка не найдена")
@@ -212,43 +475,50 @@ async def cmd_cancel_deal(message: Message):
         return
     
     # Отменяем сделку
-    force_cancel_deal(deal_id)
+    await force_cancel_deal(deal_id)
+    await log_event(None, 'admin_deal_cancelled', {'deal_id': deal_id, 'admin_telegram_id': message.from_user.id})
     
     # Уведомляем участников
-    buyer = get_user_by_id(deal['buyer_id'])
-    seller = get_user_by_id(deal['seller_id'])
-    
-    notified = []
-    
-    try:
-        await message.bot.send_message(
-            buyer['telegram_id'],
-            f"⚠️ <b>Сделка #{deal_id} отменена администратором</b>",
-            parse_mode="HTML"
-        )
-        notified.append("покупатель")
-    except Exception as e:
-        logger.error(f"Failed to notify buyer: {e}")
-    
-    try:
-        await message.bot.send_message(
-            seller['telegram_id'],
-            f"⚠️ <b>Сделка #{deal_id} отменена администратором</b>",
-            parse_mode="HTML"
-        )
-        notified.append("продавец")
-    except Exception as e:
-        logger.error(f"Failed to notify seller: {e}")
+    buyer = await get_user_by_id(deal['buyer_id'])
+    seller = await get_user_by_id(deal['seller_id'])
     
-    notification_status = f"Уведомлены: {', '.join(notified)}" if notified else "Участники не уведомлены"
+    for party in (buyer, seller):
+        notify(party['telegram_id'], f"⚠️ <b>Сделка #{deal_id} отменена администратором</b>", parse_mode="HTML")
     
     await message.answer(
         f"✅ <b>Сделка #{deal_id} отменена</b>\n\n"
         f"💵 Сумма: {deal['amount']} {deal['currency']}\n"
-        f"📊 {notification_status}",
+        f"📊 Уведомления участникам поставлены в очередь",
         parse_mode="HTML"
     )
 
+@router.message(F.text.startswith("/receipt_"))
+async def cmd_receipt(message: Message):
+    """Квитанции по завершённой сделке (из кэша, без повторной генерации)"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет доступа к этой команде")
+        return
+    
+    try:
+        deal_id = int(message.text.split("_")[-1])
+    except ValueError:
+        await message.answer("❌ Неверный формат команды")
+        return
+    
+    deal = await get_deal_by_id(deal_id)
+    
+    if not deal or deal['status'] != 'completed':
+        await message.answer("❌ Завершённая сделка не найдена")
+        return
+    
+    for role, title in (('seller', 'продавца'), ('buyer', 'покупателя')):
+        try:
+            await send_receipt(chat_id=message.chat.id, deal=deal, role=role,
+                               caption=f"📄 Сделка #{deal_id}: квитанция {title}")
+        except Exception as e:
+            logger.error(f"Failed to send {role} receipt for deal {deal_id}: {e}")
+            await message.answer(f"❌ Не удалось отправить квитанцию {title}")
+
 # Обработчики подтверждения/отклонения переводов
 @router.callback_query(F.data.startswith("admin_confirm:"))
 async def admin_confirm_payment(callback: CallbackQuery):
@@ -258,54 +528,49 @@ async def admin_confirm_payment(callback: CallbackQuery):
         return
     
     deal_id = int(callback.data.split(":")[1])
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     
     if not deal:
         await callback.answer("Сделка не найдена", show_alert=True)
         return
     
     # Обновляем статус на "payment_received"
-    update_deal_status(deal_id, 'payment_received')
+    await update_deal_status(deal_id, 'payment_received')
+    await log_event(None, 'admin_payment_confirmed', {'deal_id': deal_id, 'admin_telegram_id': callback.from_user.id})
     
-    buyer = get_user_by_id(deal['buyer_id'])
-    seller = get_user_by_id(deal['seller_id'])
+    buyer = await get_user_by_id(deal['buyer_id'])
+    seller = await get_user_by_id(deal['seller_id'])
     
     # НОВОЕ: Импортируем клавиатуру
     from keyboards.inline import buyer_confirm_delivery_keyboard
     
     # Уведомляем покупателя С КНОПКОЙ
-    try:
-        await callback.bot.send_message(
-            chat_id=buyer['telegram_id'],
-            text=(
-                f"✅ <b>Перевод подтверждён!</b>\n\n"
-                f"Сделка: #{deal_id}\n"
-                f"Сумма: {deal['amount']} {deal['currency']}\n\n"
-                f"Администратор проверил перевод.\n"
-                f"Ожидайте отправки товара от продавца.\n\n"
-                f"После получения товара нажмите кнопку ниже:"
-            ),
-            parse_mode="HTML",
-            reply_markup=buyer_confirm_delivery_keyboard(deal_id)  # НОВАЯ КНОПКА
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify buyer: {e}")
+    notify(
+        buyer['telegram_id'],
+        (
+            f"✅ <b>Перевод подтверждён!</b>\n\n"
+            f"Сделка: #{deal_id}\n"
+            f"Сумма: {deal['amount']} {deal['currency']}\n\n"
+            f"Администратор проверил перевод.\n"
+            f"Ожидайте отправки товара от продавца.\n\n"
+            f"После получения товара нажмите кнопку ниже:"
+        ),
+        parse_mode="HTML",
+        reply_markup=buyer_confirm_delivery_keyboard(deal_id)  # НОВАЯ КНОПКА
+    )
     
     # Уведомляем продавца
-    try:
-        await callback.bot.send_message(
-            chat_id=seller['telegram_id'],
-            text=(
-                f"✅ <b>Оплата получена!</b>\n\n"
-                f"Сделка: #{deal_id}\n"
-                f"Сумма: {deal['amount']} {deal['currency']}\n\n"
-                f"Покупатель перевёл деньги (подтверждено администратором).\n"
-                f"Отправьте товар покупателю."
-            ),
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify seller: {e}")
+    notify(
+        seller['telegram_id'],
+        (
+            f"✅ <b>Оплата получена!</b>\n\n"
+            f"Сделка: #{deal_id}\n"
+            f"Сумма: {deal['amount']} {deal['currency']}\n\n"
+            f"Покупатель перевёл деньги (подтверждено администратором).\n"
+            f"Отправьте товар покупателю."
+        ),
+        parse_mode="HTML"
+    )
     
     await callback.answer("✅ Перевод подтверждён")
     await callback.message.edit_text(
@@ -326,32 +591,30 @@ async def admin_reject_payment(callback: CallbackQuery):
         return
     
     deal_id = int(callback.data.split(":")[1])
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     
     if not deal:
         await callback.answer("Сделка не найдена", show_alert=True)
         return
     
     # Обновляем статус
-    update_deal_status(deal_id, 'payment_rejected')
+    await update_deal_status(deal_id, 'payment_rejected')
+    await log_event(None, 'admin_payment_rejected', {'deal_id': deal_id, 'admin_telegram_id': callback.from_user.id})
     
-    buyer = get_user_by_id(deal['buyer_id'])
+    buyer = await get_user_by_id(deal['buyer_id'])
     
     # Уведомляем покупателя
-    try:
-        await callback.bot.send_message(
-            chat_id=buyer['telegram_id'],
-            text=(
-                f"❌ <b>Перевод отклонён</b>\n\n"
-                f"Сделка: #{deal_id}\n"
-                f"Сумма: {deal['amount']} {deal['currency']}\n\n"
-                f"Администратор не подтвердил перевод.\n"
-                f"Свяжитесь с поддержкой."
-            ),
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify buyer: {e}")
+    notify(
+        buyer['telegram_id'],
+        (
+            f"❌ <b>Перевод отклонён</b>\n\n"
+            f"Сделка: #{deal_id}\n"
+            f"Сумма: {deal['amount']} {deal['currency']}\n\n"
+            f"Администратор не подтвердил перевод.\n"
+            f"Свяжитесь с поддержкой."
+        ),
+        parse_mode="HTML"
+    )
     
     await callback.answer("❌ Перевод отклонён")
     await callback.message.edit_text(
@@ -1,17 +1,21 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest
 from datetime import datetime, timedelta
 from keyboards.inline import (deal_type_choice, currency_choice, confirm_deal_creation, 
                               deal_actions, main_menu, payment_confirmation_keyboard, 
-                              admin_confirmation_keyboard)
-from database import (get_or_create_user, get_user_by_id, create_deal, 
+                              admin_confirmation_keyboard, receipt_keyboard, my_deals_keyboard)
+from database import (get_user_by_id, create_deal, 
     confirm_deal_creation as db_confirm_creation, cancel_deal, 
-    confirm_delivery, get_user_deals, get_deal_by_id, update_deal_status)
+    confirm_delivery, get_user_deals, get_deal_by_id, update_deal_status, log_event,
+    get_user_wallet, ACTIVE_DEAL_STATUSES)
 from states import DealCreation
 from config import DEAL_EXPIRY_HOURS, ADMIN_ID
 import logging
-from utils.document_generator import generate_seller_receipt, generate_buyer_receipt
+from utils.receipt_store import send_receipt
+from expiry import schedule_expiry
+from notifier import notify
 
 
 router = Router()
@@ -31,10 +35,9 @@ async def start_deal_creation(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("deal_role:"), DealCreation.waiting_for_role)
-async def choose_role(callback: CallbackQuery, state: FSMContext):
+async def choose_role(callback: CallbackQuery, state: FSMContext, user: dict):
     role = callback.data.split(":")[1]
     await state.update_data(role=role)
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
     role_text = "покупателем" if role == "buyer" else "продавцом"
     await callback.message.edit_text(f"Вы выбрали: {role_text}\n\nВаш ID: `{user['user_id']}`\n\nВведите ID второго участника сделки:", parse_mode="Markdown")
     await state.set_state(DealCreation.waiting_for_partner_id)
@@ -42,18 +45,17 @@ async def choose_role(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(DealCreation.waiting_for_partner_id)
-async def enter_partner_id(message: Message, state: FSMContext):
+async def enter_partner_id(message: Message, state: FSMContext, user: dict):
     try:
         partner_id = int(message.text)
     except ValueError:
         await message.answer("❌ ID должен быть числом. Попробуйте ещё раз:")
         return
-    partner = get_user_by_id(partner_id)
+    partner = await get_user_by_id(partner_id)
     if not partner:
         await message.answer("❌ Пользователь с таким ID не найден.")
         return
-    current_user = get_or_create_user(message.from_user.id, message.from_user.username or "Без username", message.from_user.full_name)
-    if partner_id == current_user['user_id']:
+    if partner_id == user['user_id']:
         await message.answer("❌ Нельзя создать сделку с самим собой!")
         return
     await state.update_data(partner_id=partner_id, partner_username=partner['username'])
@@ -76,51 +78,47 @@ async def enter_amount(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("currency:"), DealCreation.waiting_for_currency)
-async def choose_currency(callback: CallbackQuery, state: FSMContext):
+async def choose_currency(callback: CallbackQuery, state: FSMContext, user: dict):
     currency = callback.data.split(":")[1]
     data = await state.get_data()
-    current_user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
     role = data['role']
     partner_id = data['partner_id']
     amount = data['amount']
     if role == 'seller':
-        wallet_field = 'wallet_ton' if currency == 'TON' else 'wallet_btc'
-        if not current_user[wallet_field]:
+        # Кошелёк мог смениться в другой реплике: проверяем по БД, а не по кэшу
+        if not await get_user_wallet(user['user_id'], currency):
             await callback.message.edit_text(f"❌ Перед созданием сделки внесите ваши платежные данные для {currency}.\n\nПерейдите в раздел 💳 Кошельки", reply_markup=main_menu())
             await state.clear()
             await callback.answer()
             return
-    buyer_id = current_user['user_id'] if role == 'buyer' else partner_id
-    seller_id = current_user['user_id'] if role == 'seller' else partner_id
+    buyer_id = user['user_id'] if role == 'buyer' else partner_id
+    seller_id = user['user_id'] if role == 'seller' else partner_id
     garant_address = f"GARANT_{currency}_{datetime.now().timestamp()}"
     expiry_time = datetime.now() + timedelta(hours=DEAL_EXPIRY_HOURS)
-    deal_id = create_deal(buyer_id, seller_id, amount, currency, garant_address, expiry_time)
+    deal_id = await create_deal(buyer_id, seller_id, amount, currency, garant_address, expiry_time)
     await callback.message.edit_text(f"✅ Сделка #{deal_id} создана!\n\n💰 Сумма: {amount} {currency}\n👤 Партнёр: @{data['partner_username']}\n\nОжидайте подтверждения от второго участника...")
-    try:
-        partner = get_user_by_id(partner_id)
-        await callback.bot.send_message(chat_id=partner['telegram_id'], text=f"🔔 Новая сделка!\n\nПользователь @{callback.from_user.username} создал сделку:\n💰 Сумма: {amount} {currency}\n\nПодтвердите создание:", reply_markup=confirm_deal_creation(deal_id))
-    except Exception as e:
-        logger.error(f"Failed to notify partner: {e}")
+    partner = await get_user_by_id(partner_id)
+    notify(partner['telegram_id'], f"🔔 Новая сделка!\n\nПользователь @{callback.from_user.username} создал сделку:\n💰 Сумма: {amount} {currency}\n\nПодтвердите создание:", reply_markup=confirm_deal_creation(deal_id))
     await state.clear()
     await callback.answer("Сделка создана!")
 
 
 @router.callback_query(F.data.startswith("confirm_creation:"))
-async def confirm_creation(callback: CallbackQuery):
+async def confirm_creation(callback: CallbackQuery, user: dict):
     deal_id = int(callback.data.split(":")[1])
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     if not deal:
         await callback.answer("Сделка не найдена", show_alert=True)
         return
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
-    db_confirm_creation(deal_id, user['user_id'])
-    buyer = get_user_by_id(deal['buyer_id'])
+    expiry_time = await db_confirm_creation(deal_id, user['user_id'])
+    schedule_expiry(deal_id, expiry_time)
+    buyer = await get_user_by_id(deal['buyer_id'])
     
     await callback.message.edit_text(f"✅ Вы подтвердили сделку #{deal_id}\n\nОжидайте оплату от покупателя...")
     
-    await callback.bot.send_message(
-        chat_id=buyer['telegram_id'], 
-        text=(
+    notify(
+        buyer['telegram_id'],
+        (
             f"✅ Сделка #{deal_id} подтверждена!\n\n"
             f"💳 Переведите {deal['amount']} {deal['currency']} на адрес:\n"
             f"`{deal['garant_payment_address']}`\n\n"
@@ -134,165 +132,180 @@ async def confirm_creation(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("reject_creation:"))
-async def reject_creation(callback: CallbackQuery):
+async def reject_creation(callback: CallbackQuery, user: dict):
     deal_id = int(callback.data.split(":")[1])
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     if not deal:
         await callback.answer("Сделка не найдена", show_alert=True)
         return
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
-    cancel_deal(deal_id, user['user_id'])
+    await cancel_deal(deal_id, user['user_id'])
     await callback.message.edit_text(f"❌ Вы отклонили сделку #{deal_id}")
-    buyer = get_user_by_id(deal['buyer_id'])
-    await callback.bot.send_message(chat_id=buyer['telegram_id'], text=f"❌ Сделка #{deal_id} отклонена")
+    buyer = await get_user_by_id(deal['buyer_id'])
+    notify(buyer['telegram_id'], f"❌ Сделка #{deal_id} отклонена")
     await callback.answer()
 
 
-@router.callback_query(F.data == "my_deals")
-async def show_my_deals_callback(callback: CallbackQuery):
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
-    deals = get_user_deals(user['user_id'])
-    if not deals:
-        await callback.message.edit_text("У вас пока нет сделок", reply_markup=main_menu())
-        await callback.answer()
-        return
+DEALS_PAGE_SIZE = 10
+
+# Вкладки списка сделок: код в callback_data -> (название, статусы)
+DEAL_TABS = {
+    'all': ('Все', None),
+    'active': ('Активные', list(ACTIVE_DEAL_STATUSES)),
+    'done': ('Завершённые', ['completed']),
+    'closed': ('Закрытые', ['cancelled', 'expired', 'payment_rejected']),
+}
+
+STATUS_NAMES = {
+    'awaiting_confirmation': 'Ожидает подтверждения',
+    'awaiting_payment': 'Ожидает оплаты',
+    'awaiting_admin_confirmation': 'Проверка админом',
+    'payment_received': 'Оплата получена',
+    'payment_rejected': 'Оплата отклонена',
+    'completed': 'Завершена',
+    'cancelled': 'Отменена',
+    'expired': 'Истекла'
+}
+
+STATUS_EMOJI = {
+    'awaiting_confirmation': '⏳',
+    'awaiting_payment': '💳',
+    'awaiting_admin_confirmation': '🔍',
+    'payment_received': '✅',
+    'payment_rejected': '❌',
+    'completed': '✅',
+    'cancelled': '❌',
+    'expired': '⏰'
+}
+
+
+async def render_deals_page(user: dict, tab: str = 'all', direction: str = None, cursor: int = None):
+    """Текст и клавиатура одной страницы "Мои сделки" (keyset-пагинация)"""
+    if tab not in DEAL_TABS:
+        tab = 'all'
+    tab_name, statuses = DEAL_TABS[tab]
     
-    status_names = {
-        'awaiting_confirmation': 'Ожидает подтверждения',
-        'awaiting_payment': 'Ожидает оплаты',
-        'awaiting_admin_confirmation': 'Проверка админом',
-        'payment_received': 'Оплата получена',
-        'payment_rejected': 'Оплата отклонена',
-        'completed': 'Завершена',
-        'cancelled': 'Отменена',
-        'expired': 'Истекла'
-    }
+    deals = await get_user_deals(
+        user['user_id'],
+        status_filter=statuses,
+        limit=DEALS_PAGE_SIZE + 1,
+        before_id=cursor if direction == 'n' else None,
+        after_id=cursor if direction == 'p' else None
+    )
     
-    text = "💼 <b>Ваши сделки:</b>\n\n"
-    for deal in deals[:10]:
-        status_emoji = {
-            'awaiting_confirmation': '⏳',
-            'awaiting_payment': '💳',
-            'awaiting_admin_confirmation': '🔍',
-            'payment_received': '✅',
-            'payment_rejected': '❌',
-            'completed': '✅',
-            'cancelled': '❌',
-            'expired': '⏰'
-        }.get(deal['status'], '❓')
-        
-        status_text = status_names.get(deal['status'], deal['status'])
-        text += f"{status_emoji} Сделка #{deal['deal_id']}\n   💰 {deal['amount']} {deal['currency']}\n   Статус: {status_text}\n\n"
+    # Лишняя запись говорит о наличии ещё одной страницы в направлении листания
+    has_more = len(deals) > DEALS_PAGE_SIZE
+    if direction == 'p':
+        deals = deals[1:] if has_more else deals
+        has_newer, has_older = has_more, True
+    else:
+        deals = deals[:DEALS_PAGE_SIZE]
+        has_newer, has_older = direction == 'n', has_more
     
-    await callback.message.edit_text(text, reply_markup=main_menu(), parse_mode="HTML")
-    await callback.answer()
-
-
-async def show_my_deals(message: Message):
-    user = get_or_create_user(message.from_user.id, message.from_user.username or "Без username", message.from_user.full_name)
-    deals = get_user_deals(user['user_id'])
     if not deals:
-        await message.answer("У вас пока нет сделок")
-        return
+        if tab == 'all' and not direction:
+            return "У вас пока нет сделок", main_menu()
+        return f"💼 <b>Ваши сделки: {tab_name}</b>\n\nСделок нет", my_deals_keyboard(tab, None, None)
     
-    status_names = {
-        'awaiting_confirmation': 'Ожидает подтверждения',
-        'awaiting_payment': 'Ожидает оплаты',
-        'awaiting_admin_confirmation': 'Проверка админом',
-        'payment_received': 'Оплата получена',
-        'payment_rejected': 'Оплата отклонена',
-        'completed': 'Завершена',
-        'cancelled': 'Отменена',
-        'expired': 'Истекла'
-    }
-    
-    text = "💼 <b>Ваши сделки:</b>\n\n"
-    for deal in deals[:10]:
-        status_emoji = {
-            'awaiting_confirmation': '⏳',
-            'awaiting_payment': '💳',
-            'awaiting_admin_confirmation': '🔍',
-            'payment_received': '✅',
-            'payment_rejected': '❌',
-            'completed': '✅',
-            'cancelled': '❌',
-            'expired': '⏰'
-        }.get(deal['status'], '❓')
-        
-        status_text = status_names.get(deal['status'], deal['status'])
+    text = f"💼 <b>Ваши сделки: {tab_name}</b>\n\n"
+    for deal in deals:
+        status_emoji = STATUS_EMOJI.get(deal['status'], '❓')
+        status_text = STATUS_NAMES.get(deal['status'], deal['status'])
         text += f"{status_emoji} Сделка #{deal['deal_id']}\n   💰 {deal['amount']} {deal['currency']}\n   Статус: {status_text}\n\n"
     
-    await message.answer(text, parse_mode="HTML")
+    newer_cursor = deals[0]['deal_id'] if has_newer else None
+    older_cursor = deals[-1]['deal_id'] if has_older else None
+    return text, my_deals_keyboard(tab, newer_cursor, older_cursor)
+
+
+@router.callback_query(F.data == "my_deals")
+async def show_my_deals_callback(callback: CallbackQuery, user: dict):
+    text, markup = await render_deals_page(user)
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("deals:"))
+async def deals_page_callback(callback: CallbackQuery, user: dict):
+    """Переключение вкладок и страниц: deals:<tab>[:<n|p>:<deal_id>]"""
+    parts = callback.data.split(":")
+    tab = parts[1]
+    direction, cursor = (parts[2], int(parts[3])) if len(parts) == 4 else (None, None)
+    text, markup = await render_deals_page(user, tab, direction, cursor)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    except TelegramBadRequest:
+        # Повторное нажатие на текущую вкладку: сообщение не изменилось
+        pass
+    await callback.answer()
+
+
+async def show_my_deals(message: Message, user: dict):
+    text, markup = await render_deals_page(user)
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
 
 
 @router.callback_query(F.data.startswith("confirm_delivery:"))
-async def confirm_delivery_callback(callback: CallbackQuery):
+async def confirm_delivery_callback(callback: CallbackQuery, user: dict):
     deal_id = int(callback.data.split(":")[1])
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     if not deal:
         await callback.answer("Сделка не найдена", show_alert=True)
         return
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
     is_buyer = (user['user_id'] == deal['buyer_id'])
-    confirm_delivery(deal_id, user['user_id'], is_buyer)
-    deal = get_deal_by_id(deal_id)
+    await confirm_delivery(deal_id, user['user_id'], is_buyer)
+    deal = await get_deal_by_id(deal_id)
     if deal['status'] == 'completed':
         await callback.message.edit_text(f"🎉 Сделка #{deal_id} завершена!\n\nДеньги переведены продавцу.")
         other_id = deal['seller_id'] if is_buyer else deal['buyer_id']
-        other_user = get_user_by_id(other_id)
-        await callback.bot.send_message(chat_id=other_user['telegram_id'], text=f"🎉 Сделка #{deal_id} завершена!")
+        other_user = await get_user_by_id(other_id)
+        notify(other_user['telegram_id'], f"🎉 Сделка #{deal_id} завершена!")
     else:
         await callback.message.edit_text(f"✅ Вы подтвердили получение по сделке #{deal_id}\n\nОжидаем подтверждения от второго участника...")
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("cancel_deal:"))
-async def cancel_deal_callback(callback: CallbackQuery):
+async def cancel_deal_callback(callback: CallbackQuery, user: dict):
     deal_id = int(callback.data.split(":")[1])
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
-    cancel_deal(deal_id, user['user_id'])
+    await cancel_deal(deal_id, user['user_id'])
     await callback.message.edit_text(f"❌ Сделка #{deal_id} отменена")
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("payment_sent:"))
-async def payment_sent(callback: CallbackQuery):
+async def payment_sent(callback: CallbackQuery, user: dict):
     """Покупатель нажал 'Я перевёл деньги'"""
     deal_id = int(callback.data.split(":")[1])
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     
     if not deal:
         await callback.answer("Сделка не найдена", show_alert=True)
         return
     
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
-    
     if user['user_id'] != deal['buyer_id']:
         await callback.answer("Только покупатель может подтвердить оплату", show_alert=True)
         return
     
-    update_deal_status(deal_id, 'awaiting_admin_confirmation')
+    await update_deal_status(deal_id, 'awaiting_admin_confirmation')
+    await log_event(user['user_id'], 'payment_sent', {'deal_id': deal_id})
     
-    buyer = get_user_by_id(deal['buyer_id'])
-    seller = get_user_by_id(deal['seller_id'])
+    buyer = await get_user_by_id(deal['buyer_id'])
+    seller = await get_user_by_id(deal['seller_id'])
     
-    try:
-        await callback.bot.send_message(
-            chat_id=ADMIN_ID,
-            text=(
-                f"💰 <b>Подтверждение перевода</b>\n\n"
-                f"🔢 Сделка: #{deal_id}\n"
-                f"💵 Сумма: {deal['amount']} {deal['currency']}\n"
-                f"👤 Покупатель: @{buyer['username']} (ID: {buyer['user_id']})\n"
-                f"👤 Продавец: @{seller['username']} (ID: {seller['user_id']})\n"
-                f"📍 Адрес: <code>{deal['garant_payment_address']}</code>\n\n"
-                f"Проверьте поступление средств и подтвердите:"
-            ),
-            parse_mode="HTML",
-            reply_markup=admin_confirmation_keyboard(deal_id)
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify admin: {e}")
+    notify(
+        ADMIN_ID,
+        (
+            f"💰 <b>Подтверждение перевода</b>\n\n"
+            f"🔢 Сделка: #{deal_id}\n"
+            f"💵 Сумма: {deal['amount']} {deal['currency']}\n"
+            f"👤 Покупатель: @{buyer['username']} (ID: {buyer['user_id']})\n"
+            f"👤 Продавец: @{seller['username']} (ID: {seller['user_id']})\n"
+            f"📍 Адрес: <code>{deal['garant_payment_address']}</code>\n\n"
+            f"Проверьте поступление средств и подтвердите:"
+        ),
+        parse_mode="HTML",
+        reply_markup=admin_confirmation_keyboard(deal_id)
+    )
     
     await callback.message.edit_text(
         f"✅ Заявка отправлена администратору\n\n"
@@ -304,17 +317,15 @@ async def payment_sent(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("confirm_received:"))
-async def buyer_confirm_received(callback: CallbackQuery):
+async def buyer_confirm_received(callback: CallbackQuery, user: dict):
     """Покупатель подтвердил получение товара и завершил сделку"""
     deal_id = int(callback.data.split(":")[1])
-    deal = get_deal_by_id(deal_id)
+    deal = await get_deal_by_id(deal_id)
     
     if not deal:
         await callback.answer("Сделка не найдена", show_alert=True)
         return
     
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
-    
     if user['user_id'] != deal['buyer_id']:
         await callback.answer("Только покупатель может подтвердить получение", show_alert=True)
         return
@@ -323,79 +334,41 @@ async def buyer_confirm_received(callback: CallbackQuery):
         await callback.answer("Сделка ещё не готова к подтверждению", show_alert=True)
         return
     
-    update_deal_status(deal_id, 'completed')
+    await update_deal_status(deal_id, 'completed')
     
-    seller = get_user_by_id(deal['seller_id'])
-    buyer = get_user_by_id(deal['buyer_id'])
+    seller = await get_user_by_id(deal['seller_id'])
     
     # === ГЕНЕРИРУЕМ И ОТПРАВЛЯЕМ ДОКУМЕНТЫ ===
     
     try:
-        # Генерируем PDF для продавца
-        seller_pdf_bytes = generate_seller_receipt(
-            deal_id=deal_id,
-            seller_username=seller['username'],
-            seller_id=seller['user_id'],
-            buyer_username=buyer['username'],
-            buyer_id=buyer['user_id'],
-            amount=deal['amount'],
-            currency=deal['currency'],
-            wallet_address=seller['wallet_ton'] if deal['currency'] == 'TON' else seller['wallet_btc']
-        )
-        
-        # Создаем файл для отправки
-        seller_file = BufferedInputFile(
-            file=seller_pdf_bytes,
-            filename=f"receipt_deal_{deal_id}_seller.pdf"
-        )
-        
-        # Отправляем продавцу
-        await callback.bot.send_document(
+        await send_receipt(
             chat_id=seller['telegram_id'],
-            document=seller_file,
+            deal=deal,
+            role='seller',
             caption=(
                 f"🎉 <b>Покупатель подтвердил получение!</b>\n\n"
                 f"Сделка: #{deal_id}\n"
                 f"Сумма: <b>{deal['amount']} {deal['currency']}</b>\n\n"
                 f"Приложенный документ подтверждает завершение сделки.\n"
                 f"Средства перечислены на ваш кошелёк."
-            ),
-            parse_mode="HTML"
+            )
         )
         logger.info(f"Seller receipt sent for deal {deal_id}")
     except Exception as e:
         logger.error(f"Failed to send receipt to seller: {e}")
     
     try:
-        # Генерируем PDF для покупателя
-        buyer_pdf_bytes = generate_buyer_receipt(
-            deal_id=deal_id,
-            buyer_username=buyer['username'],
-            buyer_id=buyer['user_id'],
-            seller_username=seller['username'],
-            seller_id=seller['user_id'],
-            amount=deal['amount'],
-            currency=deal['currency'],
-            seller_wallet=seller['wallet_ton'] if deal['currency'] == 'TON' else seller['wallet_btc']
-        )
-        
-        # Создаем файл для отправки
-        buyer_file = BufferedInputFile(
-            file=buyer_pdf_bytes,
-            filename=f"receipt_deal_{deal_id}_buyer.pdf"
-        )
-        
-        # Отправляем покупателю
-        await callback.message.answer_document(
-            document=buyer_file,
+        await send_receipt(
+            chat_id=callback.from_user.id,
+            deal=deal,
+            role='buyer',
             caption=(
                 f"🎉 <b>Сделка успешно завершена!</b>\n\n"
                 f"Сделка: #{deal_id}\n"
                 f"Сумма: <b>{deal['amount']} {deal['currency']}</b>\n\n"
                 f"Приложенный документ подтверждает завершение сделки.\n"
                 f"Спасибо за использование EasyGarante!"
-            ),
-            parse_mode="HTML"
+            )
         )
         logger.info(f"Buyer receipt sent for deal {deal_id}")
     except Exception as e:
@@ -409,8 +382,34 @@ async def buyer_confirm_received(callback: CallbackQuery):
         f"🎉 Сделка успешно завершена!\n"
         f"Документ отправлен вам отдельным сообщением.\n"
         f"Спасибо за использование сервиса EasyGarante.",
-        parse_mode="HTML"
+        parse_mode="HTML",
+        reply_markup=receipt_keyboard(deal_id)
     )
     
     await callback.answer("✅ Сделка завершена")
     logger.info(f"Deal {deal_id} completed by buyer {user['user_id']}")
+
+
+@router.callback_query(F.data.startswith("receipt:"))
+async def resend_receipt(callback: CallbackQuery, user: dict):
+    """Повторная отправка квитанции участнику завершённой сделки"""
+    deal_id = int(callback.data.split(":")[1])
+    deal = await get_deal_by_id(deal_id)
+    
+    if not deal or user['user_id'] not in (deal['buyer_id'], deal['seller_id']):
+        await callback.answer("Сделка не найдена", show_alert=True)
+        return
+    
+    if deal['status'] != 'completed':
+        await callback.answer("Квитанция доступна только по завершённой сделке", show_alert=True)
+        return
+    
+    role = 'buyer' if user['user_id'] == deal['buyer_id'] else 'seller'
+    try:
+        await send_receipt(chat_id=callback.from_user.id, deal=deal, role=role,
+                           caption=f"📄 Квитанция по сделке #{deal_id}")
+    except Exception as e:
+        logger.error(f"Failed to resend receipt for deal {deal_id}: {e}")
+        await callback.answer("Не удалось отправить квитанцию", show_alert=True)
+        return
+    await callback.answer()
@@ -1,16 +1,13 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from keyboards.inline import main_menu
-from database import get_or_create_user, get_user_deals
+from database import get_user_deal_counters
 
 router = Router()
 
 @router.callback_query(F.data == "profile")
-async def show_profile_callback(callback: CallbackQuery):
-    user = get_or_create_user(callback.from_user.id, callback.from_user.username or "Без username", callback.from_user.full_name)
-    deals = get_user_deals(user['user_id'])
-    active_deals = [d for d in deals if d['status'] in ['awaiting_confirmation', 'awaiting_payment', 'payment_received']]
-    completed_deals = [d for d in deals if d['status'] == 'completed']
+async def show_profile_callback(callback: CallbackQuery, user: dict):
+    counters = await get_user_deal_counters(user['user_id'])
     text = f"""
 👤 **Ваш профиль**
 
@@ -21,8 +18,8 @@ async def show_profile_callback(callback: CallbackQuery):
 
 📊 **Статистика:**
 💼 Всего сделок: {user['total_deals']}
-✅ Завершено: {len(completed_deals)}
-⏳ Активных: {len(active_deals)}
+✅ Завершено: {counters['completed']}
+⏳ Активных: {counters['active']}
 ⭐ Рейтинг успеха: {user['success_rate']}%
 
 💳 **Кошельки:**
@@ -32,11 +29,8 @@ async def show_profile_callback(callback: CallbackQuery):
     await callback.message.edit_text(text, reply_markup=main_menu(), parse_mode="Markdown")
     await callback.answer()
 
-async def show_profile(message: Message):
-    user = get_or_create_user(message.from_user.id, message.from_user.username or "Без username", message.from_user.full_name)
-    deals = get_user_deals(user['user_id'])
-    active_deals = [d for d in deals if d['status'] in ['awaiting_confirmation', 'awaiting_payment', 'payment_received']]
-    completed_deals = [d for d in deals if d['status'] == 'completed']
+async def show_profile(message: Message, user: dict):
+    counters = await get_user_deal_counters(user['user_id'])
     text = f"""
 👤 **Ваш профиль**
 
@@ -47,8 +41,8 @@ async def show_profile(message: Message):
 
 📊 **Статистика:**
 💼 Всего сделок: {user['total_deals']}
-✅ Завершено: {len(completed_deals)}
-⏳ Активных: {len(active_deals)}
+✅ Завершено: {counters['completed']}
+⏳ Активных: {counters['active']}
 ⭐ Рейтинг успеха: {user['success_rate']}%
 
 💳 **Кошельки:**
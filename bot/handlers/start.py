@@ -4,19 +4,12 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext  # ДОБАВЬ ЭТУ СТРОКУ
 from keyboards.inline import main_menu, get_user_id_button
 from keyboards.reply import main_reply_keyboard
-from database import get_or_create_user
 
 router = Router()
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, user: dict):
     """Обработка /start"""
-    user = get_or_create_user(
-        telegram_id=message.from_user.id,
-        username=message.from_user.username or "Без username",
-        full_name=message.from_user.full_name
-    )
-    
     welcome_text = f"""
 👋 Добро пожаловать, {message.from_user.first_name}!
 
@@ -52,30 +45,24 @@ async def back_to_main(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "get_my_id")
-async def get_my_id(callback: CallbackQuery):
+async def get_my_id(callback: CallbackQuery, user: dict):
     """Получить свой ID"""
-    user = get_or_create_user(
-        callback.from_user.id,
-        callback.from_user.username or "Без username",
-        callback.from_user.full_name
-    )
-    
     await callback.answer(
         f"Ваш ID: {user['user_id']}",
         show_alert=True
     )
 
 @router.message(F.text == "👤 Профиль")
-async def profile_text(message: Message):
+async def profile_text(message: Message, user: dict):
     """Профиль через reply-кнопку"""
     from handlers.profile import show_profile
-    await show_profile(message)
+    await show_profile(message, user)
 
 @router.message(F.text == "💼 Мои сделки")
-async def deals_text(message: Message):
+async def deals_text(message: Message, user: dict):
     """Сделки через reply-кнопку"""
     from handlers.deals import show_my_deals
-    await show_my_deals(message)
+    await show_my_deals(message, user)
 
 @router.message(F.text == "➕ Создать сделку")
 async def create_deal_text(message: Message, state: FSMContext):
@@ -84,7 +71,7 @@ async def create_deal_text(message: Message, state: FSMContext):
     await start_deal_creation(message, state)
 
 @router.message(F.text == "💳 Кошельки")
-async def wallets_text(message: Message):
+async def wallets_text(message: Message, user: dict):
     """Кошельки через reply-кнопку"""
     from handlers.wallet import manage_wallets
-    await manage_wallets(message)
+    await manage_wallets(message, user)
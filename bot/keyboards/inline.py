@@ -77,3 +77,37 @@ def buyer_confirm_delivery_keyboard(deal_id: int):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Подтвердить получение товара", callback_data=f"confirm_received:{deal_id}")]
     ])
+
+def receipt_keyboard(deal_id: int):
+    """Кнопка повторной отправки квитанции по завершённой сделке"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📄 Получить квитанцию", callback_data=f"receipt:{deal_id}")]
+    ])
+
+def my_deals_keyboard(tab: str, newer_cursor: int = None, older_cursor: int = None):
+    """Вкладки по статусам и листание списка "Мои сделки" """
+    tabs = [('all', 'Все'), ('active', 'Активные'), ('done', 'Завершённые'), ('closed', 'Закрытые')]
+    buttons = [[
+        InlineKeyboardButton(text=f"• {name}" if code == tab else name, callback_data=f"deals:{code}")
+        for code, name in tabs
+    ]]
+    
+    nav = []
+    if newer_cursor:
+        nav.append(InlineKeyboardButton(text="« Новее", callback_data=f"deals:{tab}:p:{newer_cursor}"))
+    if older_cursor:
+        nav.append(InlineKeyboardButton(text="Старее »", callback_data=f"deals:{tab}:n:{older_cursor}"))
+    if nav:
+        buttons.append(nav)
+    
+    buttons.append([InlineKeyboardButton(text="« Главное меню", callback_data="back_main")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def admin_page_keyboard(prefix: str, newer_cursor: int = None, older_cursor: int = None):
+    """Листание админских списков: callback_data вида <prefix>:<p|n>:<id>"""
+    nav = []
+    if newer_cursor:
+        nav.append(InlineKeyboardButton(text="« Новее", callback_data=f"{prefix}:p:{newer_cursor}"))
+    if older_cursor:
+        nav.append(InlineKeyboardButton(text="Старее »", callback_data=f"{prefix}:n:{older_cursor}"))
+    return InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
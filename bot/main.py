@@ -1,10 +1,16 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN
+from config import BOT_TOKEN, BOT_MODE
 from handlers import start, deals, wallet, profile, admin
-from scheduler import start_scheduler
+from scheduler import start_scheduler, stop_scheduler
+from expiry import start_expiry, stop_expiry
+from notifier import start_notifier, stop_notifier
+from database import open_pool, close_pool, event_buffer
+from migrate import check_schema
+from middlewares import UserMiddleware
+from fsm_storage import create_storage
+from utils.receipt_renderer import start_renderer, stop_renderer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,11 +18,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def main():
-    """Запуск бота"""
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+async def on_startup(dispatcher: Dispatcher, bot: Bot):
+    """Подготовка ресурсов перед приёмом апдейтов"""
+    # Не стартуем на схеме, к которой не применены миграции
+    await check_schema()
+    
+    # Открываем пул соединений с БД и буфер event_log
+    await open_pool()
+    event_buffer.start()
+    
+    # Пул процессов для генерации PDF-квитанций
+    start_renderer()
+    
+    # Очередь уведомлений и истечение неоплаченных сделок по их expiry_time
+    await start_notifier(bot)
+    await start_expiry()
+    
+    # Запускаем планировщик
+    start_scheduler()
+    
+    logger.info(f"Bot started ({BOT_MODE})")
+
+async def on_shutdown(dispatcher: Dispatcher):
+    """Освобождение ресурсов после остановки приёма апдейтов"""
+    stop_scheduler()
+    await stop_expiry()
+    await stop_notifier()
+    stop_renderer()
+    await event_buffer.stop()
+    await dispatcher.storage.close()
+    await close_pool()
+    logger.info("Bot stopped")
+
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми роутерами и middleware"""
+    dp = Dispatcher(storage=create_storage())
+    
+    # Пользователь загружается один раз на апдейт и передаётся в хендлеры
+    dp.message.middleware(UserMiddleware())
+    dp.callback_query.middleware(UserMiddleware())
     
     # Регистрируем роутеры
     dp.include_router(start.router)
@@ -25,15 +65,30 @@ async def main():
     dp.include_router(profile.router)
     dp.include_router(admin.router)
     
-    # Запускаем планировщик
-    start_scheduler()
-    
-    logger.info("Bot started")
-    
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    """Long polling: апдейты обрабатываются параллельно (handle_as_tasks)"""
     try:
+        await bot.delete_webhook()
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         await bot.session.close()
 
+def main():
+    """Запуск бота"""
+    bot = Bot(token=BOT_TOKEN)
+    dp = create_dispatcher()
+    
+    if BOT_MODE == 'webhook':
+        from webhook import run_webhook
+        run_webhook(bot, dp)
+    elif BOT_MODE == 'polling':
+        asyncio.run(run_polling(bot, dp))
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {BOT_MODE}")
+
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()
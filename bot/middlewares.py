@@ -0,0 +1,23 @@
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from database import get_or_create_user
+
+
+class UserMiddleware(BaseMiddleware):
+    """Один раз на апдейт находит пользователя и передаёт его в хендлер как user"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get('event_from_user')
+        if from_user is not None and 'user' not in data:
+            data['user'] = await get_or_create_user(
+                from_user.id,
+                from_user.username or "Без username",
+                from_user.full_name
+            )
+        return await handler(event, data)
@@ -0,0 +1,238 @@
+# Миграции схемы БД: python migrate.py [--status | --baseline VERSION]
+#
+# Миграции лежат в migrations/NNNN_name.sql и применяются по порядку номеров.
+# Применённые версии записываются в schema_migrations. Файл с первой строкой
+# "-- migrate: no-transaction" выполняется вне транзакции по одному оператору
+# (нужно для CREATE INDEX CONCURRENTLY), остальные - целиком в транзакции.
+
+import asyncio
+import logging
+import re
+import sys
+from pathlib import Path
+import psycopg
+from config import DB_CONFIG
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+NO_TRANSACTION_MARK = '-- migrate: no-transaction'
+
+# Один раннер на базу, даже если стартуют несколько воркеров сразу
+MIGRATION_LOCK_ID = 7_426_001
+
+
+class Migration:
+    """Файл миграции"""
+
+    def __init__(self, path: Path):
+        version, _, name = path.stem.partition('_')
+        self.version = int(version)
+        self.name = name
+        self.sql = path.read_text(encoding='utf-8')
+        self.transactional = not self.sql.startswith(NO_TRANSACTION_MARK)
+
+    def statements(self) -> list:
+        """Операторы по одному (для миграций вне транзакции)"""
+        return split_statements(self.sql)
+
+    def concurrent_indexes(self) -> list:
+        """Имена индексов, которые миграция строит через CREATE INDEX CONCURRENTLY"""
+        matches = (_CONCURRENT_INDEX.match(statement) for statement in self.statements())
+        return [match.group(1) for match in matches if match]
+
+
+_CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)',
+    re.IGNORECASE
+)
+_DOLLAR_TAG = re.compile(r'\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$')
+
+
+def split_statements(sql: str) -> list:
+    """Разбить SQL на операторы по ';' вне строк, комментариев и $$-блоков.
+
+    Комментарии -- и /* */ в операторы не попадают.
+    """
+    statements = []
+    current = []
+    i, n = 0, len(sql)
+    while i < n:
+        char = sql[i]
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = n if end == -1 else end
+            continue
+        if sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            current.append(' ')
+            continue
+        if char in ("'", '"'):
+            # Кавычка внутри экранируется удвоением, поиск закрывающей это учитывает
+            end = sql.find(char, i + 1)
+            while end != -1 and sql.startswith(char * 2, end):
+                end = sql.find(char, end + 2)
+            end = n if end == -1 else end + 1
+            current.append(sql[i:end])
+            i = end
+            continue
+        if char == '$':
+            tag = _DOLLAR_TAG.match(sql, i)
+            if tag and not (i and (sql[i - 1].isalnum() or sql[i - 1] == '_')):
+                end = sql.find(tag.group(), tag.end())
+                end = n if end == -1 else end + len(tag.group())
+                current.append(sql[i:end])
+                i = end
+                continue
+        if char == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def load_migrations() -> list:
+    """Все миграции из MIGRATIONS_DIR по возрастанию версии"""
+    migrations = sorted((Migration(path) for path in MIGRATIONS_DIR.glob('[0-9]*_*.sql')),
+                        key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+async def get_applied_versions(conn) -> set:
+    """Версии из schema_migrations (пустое множество, если таблицы ещё нет)"""
+    cur = await conn.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not (await cur.fetchone())[0]:
+        return set()
+    cur = await conn.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in await cur.fetchall()}
+
+
+async def get_pending_migrations(conn) -> list:
+    applied = await get_applied_versions(conn)
+    return [m for m in load_migrations() if m.version not in applied]
+
+
+async def _connect(dsn: str = None, **kwargs):
+    """Соединение с базой бота или с базой по строке dsn (тесты)"""
+    if dsn:
+        return await psycopg.AsyncConnection.connect(dsn, **kwargs)
+    return await psycopg.AsyncConnection.connect(**DB_CONFIG, **kwargs)
+
+
+async def check_schema():
+    """Проверка при старте бота: схема должна быть обновлена migrate.py"""
+    async with await _connect() as conn:
+        pending = await get_pending_migrations(conn)
+    if pending:
+        names = ', '.join(f"{m.version:04d}_{m.name}" for m in pending)
+        raise RuntimeError(f"Database schema is out of date, run migrate.py (pending: {names})")
+
+
+async def _ensure_table(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMPTZ DEFAULT now()
+        )
+    """)
+
+
+async def _mark_applied(conn, migration: Migration):
+    await conn.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+        (migration.version, migration.name)
+    )
+
+
+async def _check_indexes(conn, migration: Migration):
+    """Индексы миграции должны существовать и быть валидными.
+
+    Прерванный CREATE INDEX CONCURRENTLY оставляет индекс INVALID, а повторный
+    запуск с IF NOT EXISTS его молча пропускает - поэтому проверяем явно.
+    """
+    names = migration.concurrent_indexes()
+    if not names:
+        return
+    cur = await conn.execute("""
+        SELECT c.relname, i.indisvalid
+        FROM pg_class c
+        JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = ANY(%s) AND c.relnamespace = current_schema()::regnamespace
+    """, (names,))
+    found = {row[0]: row[1] for row in await cur.fetchall()}
+    invalid = [name for name in names if not found.get(name)]
+    if invalid:
+        raise RuntimeError(
+            f"Migration {migration.version:04d}_{migration.name} left invalid or missing "
+            f"indexes: {', '.join(invalid)}. Drop them with DROP INDEX CONCURRENTLY "
+            f"and run migrate.py again"
+        )
+
+
+async def migrate(baseline: int = None, dsn: str = None):
+    """Применить новые миграции (или отметить как применённые до baseline включительно)"""
+    async with await _connect(dsn, autocommit=True) as conn:
+        await conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            await _ensure_table(conn)
+            pending = await get_pending_migrations(conn)
+            if not pending:
+                logger.info("Database schema is up to date")
+
+            for migration in pending:
+                label = f"{migration.version:04d}_{migration.name}"
+
+                if baseline is not None and migration.version <= baseline:
+                    await _mark_applied(conn, migration)
+                    logger.info(f"Migration {label} marked as applied (baseline)")
+                    continue
+
+                if migration.transactional:
+                    async with conn.transaction():
+                        await conn.execute(migration.sql)
+                        await _mark_applied(conn, migration)
+                else:
+                    for statement in migration.statements():
+                        await conn.execute(statement)
+                    await _check_indexes(conn, migration)
+                    await _mark_applied(conn, migration)
+                logger.info(f"Migration {label} applied")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+
+
+async def print_status():
+    async with await _connect() as conn:
+        applied = await get_applied_versions(conn)
+    for migration in load_migrations():
+        mark = 'applied' if migration.version in applied else 'pending'
+        print(f"{migration.version:04d}_{migration.name}: {mark}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    args = sys.argv[1:]
+    if args[:1] == ['--status']:
+        asyncio.run(print_status())
+    elif args[:1] == ['--baseline'] and len(args) == 2:
+        asyncio.run(migrate(baseline=int(args[1])))
+    elif not args:
+        asyncio.run(migrate())
+    else:
+        print("Usage: python migrate.py [--status | --baseline VERSION]")
+        sys.exit(2)
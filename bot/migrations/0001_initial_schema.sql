@@ -1,16 +1,30 @@
+-- Базовая схема. Все операторы идемпотентны: миграция безопасна
+-- и для базы, созданной раньше вручную из init.sql
+
 -- Создание таблицы users
 CREATE TABLE IF NOT EXISTS users (
     user_id BIGSERIAL PRIMARY KEY,
     telegram_id BIGINT UNIQUE NOT NULL,
     username VARCHAR(255),
+    full_name VARCHAR(255),
     reg_date TIMESTAMPTZ DEFAULT now(),
     wallet_ton VARCHAR(255),
     wallet_btc VARCHAR(255),
     total_deals INT DEFAULT 0,
+    completed_deals INT DEFAULT 0,
+    cancelled_deals INT DEFAULT 0,
+    expired_deals INT DEFAULT 0,
     success_rate NUMERIC(5,2) DEFAULT 0 CHECK (success_rate >= 0 AND success_rate <= 100),
     role VARCHAR(20) DEFAULT 'user' CHECK (role IN ('admin', 'user'))
 );
 
+-- Для баз, созданных до появления колонки full_name
+ALTER TABLE users ADD COLUMN IF NOT EXISTS full_name VARCHAR(255);
+-- Счётчики сделок ведёт триггер update_user_stats (0002_triggers.sql)
+ALTER TABLE users ADD COLUMN IF NOT EXISTS completed_deals INT DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS cancelled_deals INT DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS expired_deals INT DEFAULT 0;
+
 -- Создание таблицы deals
 CREATE TABLE IF NOT EXISTS deals (
     deal_id BIGSERIAL PRIMARY KEY,
@@ -58,6 +72,25 @@ CREATE TABLE IF NOT EXISTS event_log (
     CONSTRAINT fk_initiator FOREIGN KEY (initiator_id) REFERENCES users(user_id) ON DELETE SET NULL
 );
 
+-- Создание таблицы receipts (сгенерированные квитанции и их file_id в Telegram)
+CREATE TABLE IF NOT EXISTS receipts (
+    deal_id BIGINT NOT NULL,
+    role VARCHAR(10) NOT NULL CHECK (role IN ('buyer', 'seller')),
+    pdf BYTEA,
+    file_id VARCHAR(255),
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (deal_id, role),
+    CONSTRAINT fk_receipt_deal FOREIGN KEY (deal_id) REFERENCES deals(deal_id) ON DELETE CASCADE
+);
+
+-- Создание таблицы fsm_storage (состояния диалогов aiogram)
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    key VARCHAR(255) PRIMARY KEY,
+    state VARCHAR(255),
+    data JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
 -- Создание таблицы admins
 CREATE TABLE IF NOT EXISTS admins (
     admin_id BIGSERIAL PRIMARY KEY,
@@ -89,12 +122,8 @@ CREATE INDEX IF NOT EXISTS idx_eventlog_initiator ON event_log(initiator_id);
 CREATE INDEX IF NOT EXISTS idx_eventlog_action ON event_log(action);
 CREATE INDEX IF NOT EXISTS idx_eventlog_timestamp ON event_log(timestamp DESC);
 
+-- Индекс для fsm_storage (очистка брошенных диалогов)
+CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated ON fsm_storage(updated_at);
+
 -- Индекс для admins
 CREATE INDEX IF NOT EXISTS idx_admins_login ON admins(login);
-
--- Тестовые данные
-INSERT INTO users (telegram_id, username, wallet_ton, wallet_btc, role) VALUES
-(123456789, 'test_buyer', NULL, 'bc1qtest...buyer', 'user'),
-(987654321, 'test_seller', 'UQTest...seller', 'bc1qtest...seller', 'user'),
-(111222333, 'admin_user', NULL, NULL, 'admin')
-ON CONFLICT (telegram_id) DO NOTHING;
@@ -0,0 +1,119 @@
+-- Функция для инкрементального обновления статистики участников сделки.
+-- total_deals считается при создании сделки, completed/cancelled/expired -
+-- при переходе в соответствующий статус. Сделки не пересчитываются:
+-- success_rate выводится из счётчиков самой строки users.
+CREATE OR REPLACE FUNCTION update_user_stats() 
+RETURNS TRIGGER AS $$
+DECLARE
+    d_total INT := 0;
+    d_completed INT := 0;
+    d_cancelled INT := 0;
+    d_expired INT := 0;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        d_total := 1;
+    ELSE
+        IF NEW.status IS NOT DISTINCT FROM OLD.status THEN
+            RETURN NEW;
+        END IF;
+        -- Выход из финального статуса (ручная правка) откатывает счётчик
+        d_completed := -(OLD.status = 'completed')::int;
+        d_cancelled := -(OLD.status = 'cancelled')::int;
+        d_expired := -(OLD.status = 'expired')::int;
+    END IF;
+    
+    d_completed := d_completed + (NEW.status = 'completed')::int;
+    d_cancelled := d_cancelled + (NEW.status = 'cancelled')::int;
+    d_expired := d_expired + (NEW.status = 'expired')::int;
+    
+    IF d_total = 0 AND d_completed = 0 AND d_cancelled = 0 AND d_expired = 0 THEN
+        RETURN NEW;
+    END IF;
+    
+    -- Обе строки обновляются одним запросом (в порядке user_id)
+    UPDATE users 
+    SET total_deals = total_deals + d_total,
+        completed_deals = completed_deals + d_completed,
+        cancelled_deals = cancelled_deals + d_cancelled,
+        expired_deals = expired_deals + d_expired,
+        success_rate = COALESCE(ROUND(
+            (completed_deals + d_completed) * 100.0 / NULLIF(total_deals + d_total, 0), 2
+        ), 0)
+    WHERE user_id IN (NEW.buyer_id, NEW.seller_id);
+    
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер: создание сделки и любая смена статуса
+DROP TRIGGER IF EXISTS trg_update_user_stats ON deals;
+CREATE TRIGGER trg_update_user_stats
+AFTER INSERT OR UPDATE OF status ON deals
+FOR EACH ROW
+EXECUTE FUNCTION update_user_stats();
+
+
+-- Функция для автоматического логирования изменений статуса сделки
+CREATE OR REPLACE FUNCTION log_deal_status_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status != OLD.status THEN
+        INSERT INTO event_log (initiator_id, action, details)
+        VALUES (
+            NULL,
+            'deal_status_changed',
+            json_build_object(
+                'deal_id', NEW.deal_id,
+                'old_status', OLD.status,
+                'new_status', NEW.status,
+                'buyer_id', NEW.buyer_id,
+                'seller_id', NEW.seller_id
+            )::text
+        );
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер: логирование изменений статуса
+DROP TRIGGER IF EXISTS trg_log_deal_status ON deals;
+CREATE TRIGGER trg_log_deal_status
+AFTER UPDATE OF status ON deals
+FOR EACH ROW
+EXECUTE FUNCTION log_deal_status_change();
+
+
+-- Функция: автоматическое вычисление комиссии (1% от суммы)
+CREATE OR REPLACE FUNCTION calculate_commission()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.commission := NEW.amount * 0.01;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер: автоматический расчёт комиссии при создании сделки
+DROP TRIGGER IF EXISTS trg_calculate_commission ON deals;
+CREATE TRIGGER trg_calculate_commission
+BEFORE INSERT ON deals
+FOR EACH ROW
+EXECUTE FUNCTION calculate_commission();
+
+
+-- Функция: валидация суммы сделки (не меньше 1)
+CREATE OR REPLACE FUNCTION validate_deal_amount()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.amount < 1 THEN
+        RAISE EXCEPTION 'Amount must be greater than or equal to 1';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер: валидация суммы
+DROP TRIGGER IF EXISTS trg_validate_amount ON deals;
+CREATE TRIGGER trg_validate_amount
+BEFORE INSERT OR UPDATE OF amount ON deals
+FOR EACH ROW
+EXECUTE FUNCTION validate_deal_amount();
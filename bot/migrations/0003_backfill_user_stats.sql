@@ -0,0 +1,29 @@
+-- Разовое заполнение счётчиков users по существующим сделкам;
+-- дальше их ведёт триггер update_user_stats
+
+-- Блокируем запись в deals, чтобы триггер не изменил счётчики во время пересчёта
+LOCK TABLE deals IN SHARE MODE;
+
+WITH participants AS (
+    SELECT buyer_id AS user_id, status FROM deals
+    UNION ALL
+    SELECT seller_id AS user_id, status FROM deals
+),
+stats AS (
+    SELECT user_id,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+           COUNT(*) FILTER (WHERE status = 'cancelled') AS cancelled,
+           COUNT(*) FILTER (WHERE status = 'expired') AS expired
+    FROM participants
+    GROUP BY user_id
+)
+UPDATE users u
+SET total_deals = COALESCE(s.total, 0),
+    completed_deals = COALESCE(s.completed, 0),
+    cancelled_deals = COALESCE(s.cancelled, 0),
+    expired_deals = COALESCE(s.expired, 0),
+    success_rate = COALESCE(ROUND(s.completed * 100.0 / NULLIF(s.total, 0), 2), 0)
+FROM users x
+LEFT JOIN stats s ON s.user_id = x.user_id
+WHERE u.user_id = x.user_id;
@@ -8,7 +8,8 @@ BEGIN
         INSERT INTO event_log (initiator_id, action, details)
         VALUES (NEW.user_id, 'user_registered', 
                 json_build_object('telegram_id', NEW.telegram_id, 'username', NEW.username)::text);
-    ELSIF TG_OP = 'UPDATE' THEN
+    ELSIF TG_OP = 'UPDATE' AND NEW IS DISTINCT FROM OLD THEN
+        -- upsert в get_or_create_user без изменений не пишет лишний лог
         INSERT INTO event_log (initiator_id, action, details)
         VALUES (NEW.user_id, 'user_updated',
                 json_build_object('changed_fields', 
@@ -22,6 +23,7 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+DROP TRIGGER IF EXISTS trg_audit_users ON users;
 CREATE TRIGGER trg_audit_users
 AFTER INSERT OR UPDATE ON users
 FOR EACH ROW
@@ -55,6 +57,7 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+DROP TRIGGER IF EXISTS trg_validate_transaction ON transactions;
 CREATE TRIGGER trg_validate_transaction
 BEFORE INSERT ON transactions
 FOR EACH ROW
@@ -77,6 +80,7 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+DROP TRIGGER IF EXISTS trg_check_expiry ON deals;
 CREATE TRIGGER trg_check_expiry
 BEFORE UPDATE ON deals
 FOR EACH ROW
@@ -101,6 +105,7 @@ DO INSTEAD (
 -- ========================================
 -- 5. CHECK constraint для admins
 -- ========================================
+ALTER TABLE admins DROP CONSTRAINT IF EXISTS chk_admin_access_format;
 ALTER TABLE admins 
 ADD CONSTRAINT chk_admin_access_format 
 CHECK (access_rights ~ '^([a-z_]+:[rw]+)(,[a-z_]+:[rw]+)*$');
@@ -0,0 +1,12 @@
+-- Статусы, которые пишут хендлеры оплаты, но не пропускал CHECK:
+-- awaiting_admin_confirmation и payment_rejected.
+-- Ограничение добавляется как NOT VALID (без проверки существующих строк).
+-- Проверку делает отдельная миграция 0015: VALIDATE в этой же транзакции
+-- держал бы ACCESS EXCLUSIVE от ADD CONSTRAINT на весь проход по deals.
+
+ALTER TABLE deals DROP CONSTRAINT IF EXISTS deals_status_check;
+ALTER TABLE deals ADD CONSTRAINT deals_status_check CHECK (status IN (
+    'awaiting_confirmation', 'awaiting_payment', 'awaiting_admin_confirmation',
+    'payment_received', 'payment_rejected', 'awaiting_delivery',
+    'completed', 'cancelled', 'expired'
+)) NOT VALID;
@@ -0,0 +1,37 @@
+-- migrate: no-transaction
+-- Индексы под реальные запросы бота. CONCURRENTLY не блокирует запись
+-- в deals, поэтому миграция выполняется вне транзакции, по одному оператору.
+-- Если построение прервалось, индекс остаётся INVALID: migrate.py это
+-- проверяет и не отмечает миграцию применённой. Удалите такой индекс
+-- (DROP INDEX CONCURRENTLY) и запустите migrate.py ещё раз.
+--
+-- Проверка планов после создания:
+--   EXPLAIN SELECT * FROM deals WHERE buyer_id = 1
+--       ORDER BY date_created DESC, deal_id DESC LIMIT 11;
+--     -> Index Scan using idx_deals_buyer_created (без Sort)
+--   EXPLAIN SELECT deal_id FROM deals
+--       WHERE status = 'awaiting_payment' AND expiry_time < NOW();
+--     -> Index Scan / Bitmap Index Scan on idx_deals_expiry_awaiting
+--   EXPLAIN SELECT COUNT(*) FROM deals WHERE status IN ('awaiting_confirmation',
+--       'awaiting_payment', 'awaiting_admin_confirmation', 'payment_received');
+--     -> Index Only Scan using idx_deals_active
+
+-- Ветки покупателя и продавца в get_user_deals (keyset-пагинация)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_deals_buyer_created
+    ON deals(buyer_id, date_created DESC, deal_id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_deals_seller_created
+    ON deals(seller_id, date_created DESC, deal_id DESC);
+
+-- expire_old_deals: в индексе только неоплаченные сделки
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_deals_expiry_awaiting
+    ON deals(expiry_time)
+    WHERE status = 'awaiting_payment';
+
+-- Активные сделки
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_deals_active
+    ON deals(status, date_created DESC)
+    WHERE status IN ('awaiting_confirmation', 'awaiting_payment', 'awaiting_admin_confirmation', 'payment_received');
+
+-- Одноколоночные индексы покрываются префиксом составных
+DROP INDEX CONCURRENTLY IF EXISTS idx_deals_buyer;
+DROP INDEX CONCURRENTLY IF EXISTS idx_deals_seller;
@@ -0,0 +1,62 @@
+-- event_log секционируется по месяцам (RANGE по timestamp).
+-- Запись идёт в маленькую секцию текущего месяца, чтение свежих логов
+-- затрагивает только последние секции, а старые месяцы отсоединяются
+-- и архивируются целиком (scheduler.maintain_event_log).
+-- Существующие записи переносятся в новые секции.
+
+ALTER TABLE event_log RENAME TO event_log_legacy;
+ALTER TABLE event_log_legacy RENAME CONSTRAINT event_log_pkey TO event_log_legacy_pkey;
+ALTER TABLE event_log_legacy ALTER COLUMN log_id DROP DEFAULT;
+ALTER SEQUENCE event_log_log_id_seq OWNED BY NONE;
+DROP INDEX IF EXISTS idx_eventlog_initiator;
+DROP INDEX IF EXISTS idx_eventlog_action;
+DROP INDEX IF EXISTS idx_eventlog_timestamp;
+
+CREATE TABLE event_log (
+    log_id BIGINT NOT NULL DEFAULT nextval('event_log_log_id_seq'),
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+    initiator_id BIGINT,
+    action VARCHAR(100) NOT NULL,
+    details TEXT,
+    PRIMARY KEY (log_id, timestamp),
+    CONSTRAINT fk_initiator FOREIGN KEY (initiator_id) REFERENCES users(user_id) ON DELETE SET NULL
+) PARTITION BY RANGE (timestamp);
+
+ALTER SEQUENCE event_log_log_id_seq OWNED BY event_log.log_id;
+
+-- Страховка на случай, если секция месяца не была создана заранее
+CREATE TABLE event_log_default PARTITION OF event_log DEFAULT;
+
+-- Индексы создаются во всех секциях автоматически
+CREATE INDEX idx_eventlog_initiator ON event_log(initiator_id);
+CREATE INDEX idx_eventlog_action ON event_log(action);
+CREATE INDEX idx_eventlog_timestamp ON event_log(timestamp DESC);
+
+-- Секция event_log_yYYYYmMM для месяца, в который попадает month
+CREATE OR REPLACE FUNCTION create_event_log_partition(month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    start_date DATE := date_trunc('month', month)::date;
+    partition_name TEXT := 'event_log_' || to_char(start_date, '"y"YYYY"m"MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF event_log FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_date, (start_date + INTERVAL '1 month')::date
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции от первого месяца старых данных до трёх месяцев вперёд
+SELECT create_event_log_partition(month::date)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT MIN(timestamp) FROM event_log_legacy), now())),
+    date_trunc('month', now()) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS month;
+
+INSERT INTO event_log (log_id, timestamp, initiator_id, action, details)
+SELECT log_id, COALESCE(timestamp, now()), initiator_id, action, details
+FROM event_log_legacy;
+
+DROP TABLE event_log_legacy;
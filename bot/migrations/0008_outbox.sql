@@ -0,0 +1,8 @@
+-- Недоставленные исходящие сообщения (notifier.py): сохраняются при остановке
+-- бота или после исчерпания попыток и отправляются повторно
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
@@ -0,0 +1,94 @@
+-- Снимок статистики для админки, который ведут триггеры:
+-- deal_stats - число, сумма и комиссия сделок по (статус, валюта),
+-- stats_snapshot - одна строка с числом пользователей и временем сверки.
+-- Расхождения (ручные правки, отключённые триггеры) исправляет
+-- задача планировщика reconcile_stats.
+
+CREATE TABLE IF NOT EXISTS deal_stats (
+    status VARCHAR(50) NOT NULL,
+    currency VARCHAR(10) NOT NULL DEFAULT '',
+    count BIGINT NOT NULL DEFAULT 0,
+    volume NUMERIC(20,2) NOT NULL DEFAULT 0,
+    commission NUMERIC(20,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (status, currency)
+);
+
+CREATE TABLE IF NOT EXISTS stats_snapshot (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    total_users BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now(),
+    reconciled_at TIMESTAMPTZ
+);
+
+
+-- Прибавить к ячейке (status, currency) одну сделку со знаком sign
+CREATE OR REPLACE FUNCTION deal_stats_add(p_status TEXT, p_currency TEXT, sign INT,
+                                          p_amount NUMERIC, p_commission NUMERIC)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO deal_stats AS ds (status, currency, count, volume, commission)
+    VALUES (COALESCE(p_status, ''), COALESCE(p_currency, ''), sign,
+            sign * COALESCE(p_amount, 0), sign * COALESCE(p_commission, 0))
+    ON CONFLICT (status, currency) DO UPDATE
+    SET count = ds.count + EXCLUDED.count,
+        volume = ds.volume + EXCLUDED.volume,
+        commission = ds.commission + EXCLUDED.commission,
+        updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_deal_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF TG_OP = 'UPDATE' AND (NEW.status, NEW.currency, NEW.amount, NEW.commission)
+                IS NOT DISTINCT FROM (OLD.status, OLD.currency, OLD.amount, OLD.commission) THEN
+            RETURN NULL;
+        END IF;
+        PERFORM deal_stats_add(OLD.status, OLD.currency, -1, OLD.amount, OLD.commission);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM deal_stats_add(NEW.status, NEW.currency, 1, NEW.amount, NEW.commission);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_update_deal_stats ON deals;
+CREATE TRIGGER trg_update_deal_stats
+AFTER INSERT OR DELETE OR UPDATE OF status, currency, amount, commission ON deals
+FOR EACH ROW
+EXECUTE FUNCTION update_deal_stats();
+
+
+CREATE OR REPLACE FUNCTION update_user_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE stats_snapshot
+    SET total_users = total_users + CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END,
+        updated_at = now();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_update_user_count ON users;
+CREATE TRIGGER trg_update_user_count
+AFTER INSERT OR DELETE ON users
+FOR EACH ROW
+EXECUTE FUNCTION update_user_count();
+
+
+-- Начальное заполнение (запись в deals и users на это время заблокирована)
+LOCK TABLE deals, users IN SHARE MODE;
+
+INSERT INTO deal_stats (status, currency, count, volume, commission)
+SELECT COALESCE(status, ''), COALESCE(currency, ''), COUNT(*),
+       COALESCE(SUM(amount), 0), COALESCE(SUM(commission), 0)
+FROM deals
+GROUP BY 1, 2
+ON CONFLICT (status, currency) DO NOTHING;
+
+INSERT INTO stats_snapshot (id, total_users, reconciled_at)
+SELECT TRUE, COUNT(*), now() FROM users
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,14 @@
+-- migrate: no-transaction
+-- Админские списки /deals и /active_deals листаются по deal_id с фильтром
+-- по статусу (get_deals_page). Составной индекс отдаёт страницу одного
+-- статуса без сортировки и без просмотра сделок в других статусах.
+--
+--   EXPLAIN SELECT * FROM deals WHERE status = ANY('{completed}')
+--       AND deal_id < 1000 ORDER BY deal_id DESC LIMIT 16;
+--     -> Index Scan using idx_deals_status_id
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_deals_status_id
+    ON deals(status, deal_id DESC);
+
+-- Покрывается префиксом idx_deals_status_id
+DROP INDEX CONCURRENTLY IF EXISTS idx_deals_status;
@@ -0,0 +1,25 @@
+-- migrate: no-transaction
+-- Индексы для /find (database.search):
+-- префикс username - btree по lower(username) с text_pattern_ops,
+-- подстрока кошелька и адреса гаранта - триграммы (pg_trgm, GIN).
+-- Расширение pg_trgm создаёт владелец базы или суперпользователь.
+--
+--   EXPLAIN SELECT * FROM users WHERE lower(username) LIKE 'ivan%'
+--       OR wallet_ton ILIKE '%abc%' OR wallet_btc ILIKE '%abc%';
+--     -> BitmapOr по idx_users_username_prefix, idx_users_wallet_ton_trgm,
+--        idx_users_wallet_btc_trgm
+--   EXPLAIN SELECT * FROM deals WHERE garant_payment_address ILIKE '%abc%';
+--     -> Bitmap Index Scan on idx_deals_garant_address_trgm
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_username_prefix
+    ON users(lower(username) text_pattern_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_wallet_ton_trgm
+    ON users USING gin (wallet_ton gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_wallet_btc_trgm
+    ON users USING gin (wallet_btc gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_deals_garant_address_trgm
+    ON deals USING gin (garant_payment_address gin_trgm_ops);
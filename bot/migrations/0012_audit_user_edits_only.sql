@@ -0,0 +1,41 @@
+-- Аудит users (0004) срабатывал на любое изменение строки. С тех пор как
+-- update_user_stats (0002) обновляет счётчики обоих участников при каждом
+-- создании и смене статуса сделки, это давало по два лишних 'user_updated'
+-- на переход. Теперь UPDATE логируется, только если изменились поля,
+-- которые меняет сам пользователь или админ; счётчики сделок не учитываются.
+-- WHEN с OLD недоступен для INSERT, поэтому триггеров два.
+
+CREATE OR REPLACE FUNCTION audit_user_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO event_log (initiator_id, action, details)
+        VALUES (NEW.user_id, 'user_registered', 
+                json_build_object('telegram_id', NEW.telegram_id, 'username', NEW.username)::text);
+    ELSE
+        INSERT INTO event_log (initiator_id, action, details)
+        VALUES (NEW.user_id, 'user_updated',
+                json_build_object('changed_fields', 
+                    CASE 
+                        WHEN OLD.wallet_ton IS DISTINCT FROM NEW.wallet_ton THEN 'wallet_ton'
+                        WHEN OLD.wallet_btc IS DISTINCT FROM NEW.wallet_btc THEN 'wallet_btc'
+                        ELSE 'other'
+                    END)::text);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_audit_users ON users;
+CREATE TRIGGER trg_audit_users
+AFTER INSERT ON users
+FOR EACH ROW
+EXECUTE FUNCTION audit_user_changes();
+
+DROP TRIGGER IF EXISTS trg_audit_users_update ON users;
+CREATE TRIGGER trg_audit_users_update
+AFTER UPDATE OF username, full_name, wallet_ton, wallet_btc, role ON users
+FOR EACH ROW
+WHEN ((NEW.username, NEW.full_name, NEW.wallet_ton, NEW.wallet_btc, NEW.role)
+      IS DISTINCT FROM (OLD.username, OLD.full_name, OLD.wallet_ton, OLD.wallet_btc, OLD.role))
+EXECUTE FUNCTION audit_user_changes();
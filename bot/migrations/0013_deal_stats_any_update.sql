@@ -0,0 +1,14 @@
+-- trg_update_deal_stats (0009) был объявлен как UPDATE OF status, currency,
+-- amount, commission. Такой триггер не срабатывает, если колонку поменял
+-- только BEFORE-триггер: check_deal_expiry (0004) ставит status = 'expired'
+-- при любом UPDATE просроченной сделки (например, confirm_delivery меняет
+-- лишь buyer_confirm), и переход не попадал в deal_stats до сверки
+-- reconcile_stats. Теперь триггер срабатывает на любой UPDATE, а лишнюю
+-- работу отсекает проверка IS NOT DISTINCT FROM в update_deal_stats().
+-- Уже накопленное расхождение исправит ближайшая сверка.
+
+DROP TRIGGER IF EXISTS trg_update_deal_stats ON deals;
+CREATE TRIGGER trg_update_deal_stats
+AFTER INSERT OR DELETE OR UPDATE ON deals
+FOR EACH ROW
+EXECUTE FUNCTION update_deal_stats();
@@ -0,0 +1,123 @@
+-- Счётчики снимка статистики (0009) без горячей строки пользователей
+-- и без взаимоблокировок на deal_stats.
+--
+-- deal_stats: строчный триггер обновлял ячейку (status, currency) на каждую
+-- сделку в порядке обработки строк. Пакетное истечение в двух репликах
+-- сразу могло взять ячейки в разном порядке и получить deadlock. Теперь
+-- триггеры уровня оператора сводят все строки оператора (transition tables)
+-- в дельты по ячейкам и применяют их в порядке (status, currency): одно
+-- обновление ячейки на оператор и единый порядок блокировок.
+-- Остающийся компромисс: одиночные переходы в одной ячейке по-прежнему
+-- ждут друг друга на её строке до конца транзакции (транзакции бота короткие).
+--
+-- total_users: одна строка stats_snapshot, которую обновляла каждая
+-- регистрация, заменена на 16 шардов user_counts (user_id % 16); соседние
+-- регистрации попадают в разные шарды, число пользователей - их сумма.
+
+CREATE OR REPLACE FUNCTION update_deal_stats_batch()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO deal_stats AS ds (status, currency, count, volume, commission)
+        SELECT COALESCE(status, ''), COALESCE(currency, ''), COUNT(*),
+               COALESCE(SUM(amount), 0), COALESCE(SUM(commission), 0)
+        FROM new_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (status, currency) DO UPDATE
+        SET count = ds.count + EXCLUDED.count,
+            volume = ds.volume + EXCLUDED.volume,
+            commission = ds.commission + EXCLUDED.commission,
+            updated_at = now();
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO deal_stats AS ds (status, currency, count, volume, commission)
+        SELECT COALESCE(status, ''), COALESCE(currency, ''), -COUNT(*),
+               -COALESCE(SUM(amount), 0), -COALESCE(SUM(commission), 0)
+        FROM old_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (status, currency) DO UPDATE
+        SET count = ds.count + EXCLUDED.count,
+            volume = ds.volume + EXCLUDED.volume,
+            commission = ds.commission + EXCLUDED.commission,
+            updated_at = now();
+    ELSE
+        -- Строки, у которых статус, валюта и суммы не менялись, взаимно
+        -- сокращаются и не трогают deal_stats
+        INSERT INTO deal_stats AS ds (status, currency, count, volume, commission)
+        SELECT status, currency, SUM(sign), SUM(sign * amount), SUM(sign * commission)
+        FROM (
+            SELECT COALESCE(status, '') AS status, COALESCE(currency, '') AS currency, 1 AS sign,
+                   COALESCE(amount, 0) AS amount, COALESCE(commission, 0) AS commission
+            FROM new_rows
+            UNION ALL
+            SELECT COALESCE(status, ''), COALESCE(currency, ''), -1,
+                   COALESCE(amount, 0), COALESCE(commission, 0)
+            FROM old_rows
+        ) AS changes
+        GROUP BY status, currency
+        HAVING (SUM(sign), SUM(sign * amount), SUM(sign * commission)) <> (0, 0, 0)
+        ORDER BY status, currency
+        ON CONFLICT (status, currency) DO UPDATE
+        SET count = ds.count + EXCLUDED.count,
+            volume = ds.volume + EXCLUDED.volume,
+            commission = ds.commission + EXCLUDED.commission,
+            updated_at = now();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер с transition tables допускает только одно событие
+DROP TRIGGER IF EXISTS trg_update_deal_stats ON deals;
+CREATE TRIGGER trg_deal_stats_insert
+AFTER INSERT ON deals
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_deal_stats_batch();
+
+CREATE TRIGGER trg_deal_stats_update
+AFTER UPDATE ON deals
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_deal_stats_batch();
+
+CREATE TRIGGER trg_deal_stats_delete
+AFTER DELETE ON deals
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_deal_stats_batch();
+
+DROP FUNCTION IF EXISTS update_deal_stats();
+DROP FUNCTION IF EXISTS deal_stats_add(TEXT, TEXT, INT, NUMERIC, NUMERIC);
+
+
+CREATE TABLE IF NOT EXISTS user_counts (
+    shard SMALLINT PRIMARY KEY,
+    count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION update_user_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE user_counts SET count = count + 1, updated_at = now() WHERE shard = NEW.user_id % 16;
+    ELSE
+        UPDATE user_counts SET count = count - 1, updated_at = now() WHERE shard = OLD.user_id % 16;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Начальное заполнение (регистрации на это время заблокированы)
+LOCK TABLE users IN SHARE MODE;
+
+INSERT INTO user_counts (shard, count)
+SELECT s.shard, COUNT(u.user_id)
+FROM generate_series(0, 15) AS s(shard)
+LEFT JOIN users u ON u.user_id % 16 = s.shard
+GROUP BY s.shard
+ON CONFLICT (shard) DO NOTHING;
+
+ALTER TABLE stats_snapshot DROP COLUMN IF EXISTS total_users;
@@ -0,0 +1,5 @@
+-- Проверка существующих строк для deals_status_check (добавлен NOT VALID в 0005).
+-- Отдельная транзакция: VALIDATE берёт SHARE UPDATE EXCLUSIVE и не мешает
+-- чтению и записи deals. На базах, где 0005 уже выполнил VALIDATE, ничего не делает.
+
+ALTER TABLE deals VALIDATE CONSTRAINT deals_status_check;
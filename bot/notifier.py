@@ -0,0 +1,363 @@
+# Очередь исходящих сообщений с учётом лимитов Telegram
+#
+# Сообщения копятся по чатам и отправляются несколькими воркерами.
+# Частоту ограничивают два token bucket: общий на бота и отдельный на чат;
+# порядок сообщений внутри чата сохраняется. На 429 чат и общий лимит бота
+# ждут retry_after, сетевые ошибки повторяются с паузой, а недоставленное сохраняется в outbox
+# и подбирается при следующем запуске или задачей планировщика. Число попыток
+# и время постановки хранятся вместе с сообщением: после
+# NOTIFY_OUTBOX_MAX_ATTEMPTS попыток или NOTIFY_OUTBOX_MAX_AGE_HOURS часов
+# оно отбрасывается с записью notification_dropped в event_log.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from aiogram import Bot
+from aiogram.exceptions import (TelegramRetryAfter, TelegramForbiddenError,
+                                TelegramBadRequest, TelegramNotFound)
+from aiogram.types import InlineKeyboardMarkup
+from config import (NOTIFY_RATE_LIMIT, NOTIFY_CHAT_RATE_LIMIT, NOTIFY_CHAT_BURST,
+                    NOTIFY_WORKERS, NOTIFY_MAX_ATTEMPTS, NOTIFY_OUTBOX_MAX_ATTEMPTS,
+                    NOTIFY_OUTBOX_MAX_AGE_HOURS)
+from database import save_outbox, take_outbox, log_event
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых повтор бесполезен (бот заблокирован, чат удалён, плохой запрос)
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+        self.paused_until = 0.0
+
+    def pause(self, now: float, seconds: float):
+        """Не выдавать токены seconds секунд (ответ 429 от Telegram)"""
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def reserve(self, now: float) -> float:
+        """Взять токен; если его нет - вернуть, сколько секунд ждать (токен не берётся)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        if now < self.paused_until:
+            return False
+        return self.updated is None or self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class OutboundMessage:
+    """Сообщение в очереди"""
+
+    __slots__ = ('chat_id', 'text', 'kwargs', 'enqueued_at', 'attempts', 'created_at')
+
+    def __init__(self, chat_id: int, text: str, kwargs: dict, enqueued_at: float,
+                 attempts: int = 0, created_at: float = None):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.enqueued_at = enqueued_at   # время цикла событий, для задержки доставки
+        self.attempts = attempts          # неудачных попыток всего, включая прошлые загрузки
+        self.created_at = created_at if created_at is not None else time.time()
+
+    def is_expired(self) -> bool:
+        """Пора отбросить: исчерпаны попытки или сообщение устарело"""
+        return (self.attempts >= NOTIFY_OUTBOX_MAX_ATTEMPTS
+                or time.time() - self.created_at > NOTIFY_OUTBOX_MAX_AGE_HOURS * 3600)
+
+    def to_payload(self) -> dict:
+        """Представление для outbox (JSON)"""
+        kwargs = {
+            key: value.model_dump(mode='json', exclude_none=True) if hasattr(value, 'model_dump') else value
+            for key, value in self.kwargs.items()
+        }
+        return {'text': self.text, 'kwargs': kwargs,
+                'attempts': self.attempts, 'created_at': self.created_at}
+
+    @classmethod
+    def from_payload(cls, chat_id: int, payload: dict, enqueued_at: float):
+        kwargs = dict(payload.get('kwargs') or {})
+        if kwargs.get('reply_markup'):
+            kwargs['reply_markup'] = InlineKeyboardMarkup.model_validate(kwargs['reply_markup'])
+        return cls(chat_id, payload['text'], kwargs, enqueued_at,
+                   attempts=payload.get('attempts', 0), created_at=payload.get('created_at'))
+
+
+_bot = None
+_workers = []
+_chats = {}          # chat_id -> deque[OutboundMessage]
+_chat_buckets = {}   # chat_id -> TokenBucket
+_ready = []          # куча (время готовности, seq, chat_id)
+_scheduled = set()   # чаты в куче или в отправке
+_seq = itertools.count()
+_wakeup = asyncio.Event()
+_global_bucket = TokenBucket(NOTIFY_RATE_LIMIT, NOTIFY_RATE_LIMIT)
+_stats = {
+    'sent': 0,
+    'dropped': 0,
+    'expired': 0,
+    'retry_after': 0,
+    'retried': 0,
+    'persisted': 0,
+    'in_flight': 0,
+    'latency_ms_total': 0.0,
+    'latency_ms_max': 0.0,
+}
+
+
+def _now() -> float:
+    return asyncio.get_running_loop().time()
+
+
+def _schedule(chat_id: int, delay: float = 0.0):
+    heapq.heappush(_ready, (_now() + delay, next(_seq), chat_id))
+    _scheduled.add(chat_id)
+    _wakeup.set()
+
+
+def _enqueue(message: OutboundMessage):
+    _chats.setdefault(message.chat_id, deque()).append(message)
+    if message.chat_id not in _scheduled:
+        _schedule(message.chat_id)
+
+
+def notify(chat_id: int, text: str, **kwargs):
+    """Поставить сообщение в очередь отправки (не ждёт Telegram).
+
+    kwargs передаются в bot.send_message (parse_mode, reply_markup и т.д.).
+    """
+    _enqueue(OutboundMessage(chat_id, text, kwargs, _now()))
+
+
+def get_notifier_stats() -> dict:
+    """Метрики очереди: глубина, доставка, повторы, задержка от постановки до отправки"""
+    sent = _stats['sent'] or 1
+    return {
+        'pending': sum(len(messages) for messages in _chats.values()),
+        'chats': len(_chats),
+        'in_flight': _stats['in_flight'],
+        'sent': _stats['sent'],
+        'dropped': _stats['dropped'],
+        'expired': _stats['expired'],
+        'retry_after': _stats['retry_after'],
+        'retried': _stats['retried'],
+        'persisted': _stats['persisted'],
+        'avg_latency_ms': round(_stats['latency_ms_total'] / sent, 1),
+        'max_latency_ms': round(_stats['latency_ms_max'], 1),
+    }
+
+
+async def start_notifier(bot: Bot):
+    """Подобрать недоставленное из outbox и запустить воркеры отправки"""
+    global _bot
+    _bot = bot
+    await load_outbox()
+    if not _workers:
+        for _ in range(NOTIFY_WORKERS):
+            _workers.append(asyncio.create_task(_worker()))
+        logger.info(f"Notifier started ({NOTIFY_WORKERS} workers, {NOTIFY_RATE_LIMIT} msg/s, "
+                    f"{NOTIFY_CHAT_RATE_LIMIT} msg/s per chat)")
+
+
+async def stop_notifier(timeout: float = 10):
+    """Дослать очередь (не дольше timeout секунд), остаток сохранить в outbox"""
+    if not _workers:
+        return
+    deadline = _now() + timeout
+    while (_chats or _stats['in_flight']) and _now() < deadline:
+        await asyncio.sleep(0.1)
+
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    pending = [message for messages in _chats.values() for message in messages]
+    _chats.clear()
+    _ready.clear()
+    _scheduled.clear()
+    if pending:
+        await _persist(pending)
+    logger.info("Notifier stopped")
+
+
+async def load_outbox(limit: int = 1000):
+    """Вернуть в очередь сообщения, сохранённые в outbox (этим или другим процессом)"""
+    rows = await take_outbox(limit)
+    now = _now()
+    for row in rows:
+        message = OutboundMessage.from_payload(row['chat_id'], row['payload'], now)
+        if message.is_expired():
+            await _expire(message)
+        else:
+            _enqueue(message)
+    if rows:
+        logger.info(f"Loaded {len(rows)} messages from outbox")
+
+
+async def _expire(message: OutboundMessage):
+    """Отбросить сообщение, которое так и не удалось доставить"""
+    _stats['expired'] += 1
+    logger.error(f"Dropping message to {message.chat_id} after {message.attempts} attempts "
+                 f"({(time.time() - message.created_at) / 3600:.1f}h in queue)")
+    await log_event(None, 'notification_dropped', {
+        'chat_id': message.chat_id,
+        'attempts': message.attempts,
+        'created_at': message.created_at,
+        'text': message.text[:200],
+    })
+
+
+async def _persist(messages: list):
+    try:
+        await save_outbox([(m.chat_id, m.to_payload()) for m in messages])
+        _stats['persisted'] += len(messages)
+        logger.warning(f"Saved {len(messages)} undelivered messages to outbox")
+    except Exception as e:
+        _stats['dropped'] += len(messages)
+        logger.error(f"Failed to save {len(messages)} messages to outbox: {e}")
+
+
+async def _next_chat() -> int:
+    """Дождаться чата, которому уже можно отправлять"""
+    while True:
+        if not _ready:
+            _wakeup.clear()
+            await _wakeup.wait()
+            continue
+        delay = _ready[0][0] - _now()
+        if delay > 0:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        return heapq.heappop(_ready)[2]
+
+
+async def _acquire(bucket: TokenBucket):
+    while True:
+        wait = bucket.reserve(_now())
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+
+
+def _flood_wait(chat_id: int, retry_after: float):
+    """429: лимит Telegram общий на бота, поэтому ждёт не только чат"""
+    _stats['retry_after'] += 1
+    logger.warning(f"Flood control for chat {chat_id}, retry in {retry_after}s")
+    now = _now()
+    _global_bucket.pause(now, retry_after)
+    _chat_bucket(chat_id).pause(now, retry_after)
+
+
+async def send_document(chat_id: int, document, **kwargs):
+    """Отправить документ сразу, с токенами тех же лимитов, что и у очереди.
+
+    Возвращает Message (нужен file_id). На 429 повторяет после retry_after,
+    остальные ошибки пробрасывает. Сообщения чата, ещё стоящие в очереди,
+    документ может обогнать.
+    """
+    for attempt in range(1, NOTIFY_MAX_ATTEMPTS + 1):
+        await _acquire(_chat_bucket(chat_id))
+        await _acquire(_global_bucket)
+        try:
+            return await _bot.send_document(chat_id=chat_id, document=document, **kwargs)
+        except TelegramRetryAfter as e:
+            if attempt == NOTIFY_MAX_ATTEMPTS:
+                raise
+            _flood_wait(chat_id, float(e.retry_after))
+
+
+def _chat_bucket(chat_id: int) -> TokenBucket:
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        if len(_chat_buckets) > 10000:
+            # Забываем чаты, лимит которых уже восстановился
+            now = _now()
+            for key in [key for key, b in _chat_buckets.items() if b.is_full(now)]:
+                del _chat_buckets[key]
+        bucket = _chat_buckets[chat_id] = TokenBucket(NOTIFY_CHAT_RATE_LIMIT, NOTIFY_CHAT_BURST)
+    return bucket
+
+
+async def _worker():
+    while True:
+        chat_id = await _next_chat()
+        messages = _chats.get(chat_id)
+        if not messages:
+            _scheduled.discard(chat_id)
+            continue
+
+        wait = _chat_bucket(chat_id).reserve(_now())
+        if wait:
+            _schedule(chat_id, wait)
+            continue
+
+        await _acquire(_global_bucket)
+        message = messages[0]
+        _stats['in_flight'] += 1
+        try:
+            retry_delay = await _send(message)
+        finally:
+            _stats['in_flight'] -= 1
+
+        if retry_delay is None:
+            messages.popleft()
+        if messages:
+            _schedule(chat_id, retry_delay or 0.0)
+        else:
+            del _chats[chat_id]
+            _scheduled.discard(chat_id)
+
+
+async def _send(message: OutboundMessage):
+    """Отправить сообщение. Возвращает None, если с ним покончено,
+    или паузу в секундах перед повтором"""
+    try:
+        await _bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+    except TelegramRetryAfter as e:
+        _flood_wait(message.chat_id, float(e.retry_after))
+        return float(e.retry_after)
+    except PERMANENT_ERRORS as e:
+        _stats['dropped'] += 1
+        logger.error(f"Failed to send message to {message.chat_id}: {e}")
+        return None
+    except Exception as e:
+        message.attempts += 1
+        if message.is_expired():
+            await _expire(message)
+            return None
+        # Первые NOTIFY_MAX_ATTEMPTS попыток - с паузой в процессе, дальше по одной
+        # попытке на каждый проход load_outbox
+        if message.attempts >= NOTIFY_MAX_ATTEMPTS:
+            logger.error(f"Giving up on message to {message.chat_id} after {message.attempts} attempts: {e}")
+            await _persist([message])
+            return None
+        _stats['retried'] += 1
+        logger.warning(f"Error sending message to {message.chat_id} (attempt {message.attempts}): {e}")
+        return float(2 ** message.attempts)
+
+    latency_ms = (_now() - message.enqueued_at) * 1000
+    _stats['sent'] += 1
+    _stats['latency_ms_total'] += latency_ms
+    _stats['latency_ms_max'] = max(_stats['latency_ms_max'], latency_ms)
+    return None
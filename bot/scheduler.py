@@ -1,18 +1,195 @@
+import asyncio
+import gzip
+import os
+from datetime import datetime, timezone
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from database import expire_old_deals
+from database import (get_pool_stats, check_pool, delete_expired_fsm,
+                      create_event_log_partitions, get_event_log_partitions,
+                      detach_event_log_partition, export_event_log_partition,
+                      drop_event_log_partition, reconcile_stats,
+                      try_advisory_lock, EVENT_LOG_MAINTENANCE_LOCK_ID)
+from config import (DB_POOL_CHECK_MINUTES, FSM_STORAGE, FSM_TTL, EVENT_LOG_PARTITIONS_AHEAD,
+                    EVENT_LOG_RETENTION_MONTHS, EVENT_LOG_ARCHIVE_DIR, STATS_RECONCILE_MINUTES)
+from utils.receipt_renderer import get_render_stats
+from expiry import expire_overdue_deals
+from notifier import get_notifier_stats, load_outbox
 import logging
 
 logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
 
+def log_pool_stats():
+    """Периодический вывод метрик пула соединений"""
+    stats = get_pool_stats()
+    logger.info(
+        f"DB pool: size={stats['pool_size']}, available={stats['pool_available']}, "
+        f"waiting={stats['requests_waiting']}, requests={stats['requests_num']}, "
+        f"wait_ms={stats['requests_wait_ms']}, timeouts={stats['requests_timeouts']}, "
+        f"lost={stats['connections_lost']}"
+    )
+
+def log_render_stats():
+    """Периодический вывод метрик генерации квитанций"""
+    stats = get_render_stats()
+    logger.info(
+        f"Receipts: pending={stats['pending']}, rendered={stats['rendered']}, "
+        f"rejected={stats['rejected']}, failed={stats['failed']}, "
+        f"max_pending={stats['max_pending']}, avg_render_ms={stats['avg_render_ms']}, "
+        f"avg_wait_ms={stats['avg_wait_ms']}"
+    )
+
+def log_notifier_stats():
+    """Периодический вывод метрик очереди исходящих сообщений"""
+    stats = get_notifier_stats()
+    logger.info(
+        f"Notifier: pending={stats['pending']}, chats={stats['chats']}, "
+        f"in_flight={stats['in_flight']}, sent={stats['sent']}, dropped={stats['dropped']}, "
+        f"expired={stats['expired']}, retry_after={stats['retry_after']}, retried={stats['retried']}, "
+        f"persisted={stats['persisted']}, avg_latency_ms={stats['avg_latency_ms']}, "
+        f"max_latency_ms={stats['max_latency_ms']}"
+    )
+
+async def reconcile_stats_snapshot():
+    """Сверка снимка статистики админки с deals и users"""
+    fixed = await reconcile_stats()
+    if fixed:
+        logger.warning(f"Stats snapshot reconciled, {fixed} rows corrected")
+
+async def cleanup_fsm():
+    """Удаление брошенных диалогов из fsm_storage"""
+    deleted = await delete_expired_fsm(FSM_TTL)
+    if deleted:
+        logger.info(f"Removed {deleted} expired FSM records")
+
+async def archive_event_log_partition(name: str):
+    """Сохранить отсоединённую секцию в EVENT_LOG_ARCHIVE_DIR/<name>.csv.gz и удалить её"""
+    os.makedirs(EVENT_LOG_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(EVENT_LOG_ARCHIVE_DIR, f"{name}.csv.gz")
+    tmp_path = f"{path}.tmp"
+    
+    # Сжатие и запись на диск - в потоке, чтобы не блокировать event loop
+    archive = await asyncio.to_thread(gzip.open, tmp_path, 'wb')
+    try:
+        async def write(data: bytes):
+            await asyncio.to_thread(archive.write, data)
+        size = await export_event_log_partition(name, write)
+    finally:
+        await asyncio.to_thread(archive.close)
+    
+    # Таблица удаляется только после того, как архив полностью записан
+    os.replace(tmp_path, path)
+    await drop_event_log_partition(name)
+    logger.info(f"Event log partition {name} archived to {path} ({size} bytes raw)")
+
+async def maintain_event_log():
+    """Секции event_log: создать будущие, отсоединить и заархивировать устаревшие.
+    
+    Выполняется только в одной реплике: остальные пропускают запуск, а не
+    отсоединяют и выгружают ту же секцию параллельно.
+    """
+    async with try_advisory_lock(EVENT_LOG_MAINTENANCE_LOCK_ID) as locked:
+        if not locked:
+            logger.info("Event log maintenance is running in another process, skipped")
+            return
+        await _maintain_event_log()
+
+async def _maintain_event_log():
+    created = await create_event_log_partitions(EVENT_LOG_PARTITIONS_AHEAD)
+    logger.info(f"Event log partitions ready up to {created[-1]}")
+    
+    if EVENT_LOG_RETENTION_MONTHS <= 0:
+        return
+    
+    now = datetime.now(timezone.utc)
+    total_months = now.year * 12 + now.month - 1 - EVENT_LOG_RETENTION_MONTHS
+    cutoff = (total_months // 12, total_months % 12 + 1)
+    
+    for partition in await get_event_log_partitions():
+        if partition['month'] >= cutoff:
+            break
+        try:
+            if partition['attached']:
+                await detach_event_log_partition(partition['name'])
+            await archive_event_log_partition(partition['name'])
+        except Exception as e:
+            # Отсоединённая таблица остаётся в БД и архивируется при следующем запуске
+            logger.error(f"Error archiving event log partition {partition['name']}: {e}")
+
 def start_scheduler():
     """Запуск планировщика задач"""
+    # Точное истечение выполняет expiry.py, здесь - редкая страховочная проверка
     scheduler.add_job(
-        expire_old_deals,
+        expire_overdue_deals,
         'interval',
-        minutes=1,
+        minutes=10,
         id='expire_deals'
     )
     
+    scheduler.add_job(
+        log_pool_stats,
+        'interval',
+        minutes=5,
+        id='pool_stats'
+    )
+    
+    scheduler.add_job(
+        check_pool,
+        'interval',
+        minutes=DB_POOL_CHECK_MINUTES,
+        id='pool_check'
+    )
+    
+    scheduler.add_job(
+        log_render_stats,
+        'interval',
+        minutes=5,
+        id='render_stats'
+    )
+    
+    scheduler.add_job(
+        log_notifier_stats,
+        'interval',
+        minutes=5,
+        id='notifier_stats'
+    )
+    
+    # Повторная отправка сообщений, сохранённых в outbox
+    scheduler.add_job(
+        load_outbox,
+        'interval',
+        minutes=5,
+        id='retry_outbox'
+    )
+    
+    scheduler.add_job(
+        reconcile_stats_snapshot,
+        'interval',
+        minutes=STATS_RECONCILE_MINUTES,
+        id='reconcile_stats'
+    )
+    
+    # Первый запуск сразу при старте, чтобы секция текущего месяца уже была
+    scheduler.add_job(
+        maintain_event_log,
+        'interval',
+        hours=24,
+        next_run_time=datetime.now(),
+        id='maintain_event_log'
+    )
+    
+    if FSM_STORAGE == 'postgres':
+        scheduler.add_job(
+            cleanup_fsm,
+            'interval',
+            hours=1,
+            id='cleanup_fsm'
+        )
+    
     scheduler.start()
     logger.info("Scheduler started")
+
+def stop_scheduler():
+    """Остановка планировщика задач"""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+        logger.info("Scheduler stopped")
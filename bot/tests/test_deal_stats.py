@@ -0,0 +1,69 @@
+from tests.conftest import create_user
+
+
+def deal_stats(db) -> dict:
+    rows = db.execute("SELECT status, currency, count FROM deal_stats").fetchall()
+    return {(row['status'], row['currency']): row['count'] for row in rows}
+
+
+def test_expiry_forced_by_trigger_moves_deal_stats(db):
+    buyer_id, seller_id = create_user(db), create_user(db)
+    deal_id = db.execute(
+        """INSERT INTO deals (buyer_id, seller_id, amount, currency, status, expiry_time)
+           VALUES (%s, %s, 10, 'TON', 'awaiting_payment', now() - interval '1 minute')
+           RETURNING deal_id""",
+        (buyer_id, seller_id)
+    ).fetchone()['deal_id']
+    before = deal_stats(db)
+
+    # Меняется только buyer_confirm; status = 'expired' ставит check_deal_expiry
+    db.execute("UPDATE deals SET buyer_confirm = true WHERE deal_id = %s", (deal_id,))
+
+    status = db.execute("SELECT status FROM deals WHERE deal_id = %s", (deal_id,)).fetchone()['status']
+    assert status == 'expired'
+    after = deal_stats(db)
+    assert after[('awaiting_payment', 'TON')] == before[('awaiting_payment', 'TON')] - 1
+    assert after[('expired', 'TON')] == before.get(('expired', 'TON'), 0) + 1
+
+
+def test_update_without_stats_columns_keeps_deal_stats(db):
+    buyer_id, seller_id = create_user(db), create_user(db)
+    deal_id = db.execute(
+        """INSERT INTO deals (buyer_id, seller_id, amount, currency, status)
+           VALUES (%s, %s, 10, 'BTC', 'awaiting_confirmation') RETURNING deal_id""",
+        (buyer_id, seller_id)
+    ).fetchone()['deal_id']
+    before = deal_stats(db)
+
+    db.execute("UPDATE deals SET seller_confirm = true WHERE deal_id = %s", (deal_id,))
+
+    assert deal_stats(db) == before
+
+
+def test_batch_update_moves_deal_stats(db):
+    buyer_id, seller_id = create_user(db), create_user(db)
+    deal_ids = [
+        db.execute(
+            """INSERT INTO deals (buyer_id, seller_id, amount, currency, status)
+               VALUES (%s, %s, %s, %s, 'awaiting_payment') RETURNING deal_id""",
+            (buyer_id, seller_id, amount, currency)
+        ).fetchone()['deal_id']
+        for amount, currency in ((10, 'TON'), (20, 'TON'), (5, 'BTC'))
+    ]
+    before = deal_stats(db)
+
+    db.execute("UPDATE deals SET status = 'expired' WHERE deal_id = ANY(%s)", (deal_ids,))
+
+    after = deal_stats(db)
+    assert after[('awaiting_payment', 'TON')] == before[('awaiting_payment', 'TON')] - 2
+    assert after[('awaiting_payment', 'BTC')] == before[('awaiting_payment', 'BTC')] - 1
+    assert after[('expired', 'TON')] == before.get(('expired', 'TON'), 0) + 2
+    assert after[('expired', 'BTC')] == before.get(('expired', 'BTC'), 0) + 1
+
+
+def test_registration_updates_user_counts(db):
+    total = lambda: db.execute("SELECT SUM(count) AS total FROM user_counts").fetchone()['total']
+    before = total()
+    create_user(db)
+    create_user(db)
+    assert total() == before + 2
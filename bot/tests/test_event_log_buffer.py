@@ -0,0 +1,174 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from psycopg import DataError
+
+import database
+from database import EventLogBuffer
+
+
+class FakeCopy:
+    def __init__(self, written, started, release):
+        self.written = written
+        self.started = started
+        self.release = release
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def write_row(self, row):
+        # Первая строка пачки сигналит о начале записи и ждёт разрешения
+        self.started.set()
+        await self.release.wait()
+        self.written.append(row)
+
+
+class FakeConnection:
+    def __init__(self, written, started, release):
+        self.copy_args = (written, started, release)
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def copy(self, query):
+                return FakeCopy(*connection.copy_args)
+
+        return Cursor()
+
+    async def commit(self):
+        pass
+
+
+def test_stop_during_flush_keeps_events(monkeypatch):
+    async def scenario():
+        written = []
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        @asynccontextmanager
+        async def fake_connection():
+            yield FakeConnection(written, started, release)
+
+        monkeypatch.setattr(database, 'get_connection', fake_connection)
+
+        buffer = EventLogBuffer(batch_size=2, flush_interval=60, max_pending=100)
+        buffer.start()
+        buffer.add(1, 'a', '')
+        buffer.add(1, 'b', '')
+        await started.wait()
+
+        # Пачка в записи, новые события ещё в буфере
+        buffer.add(1, 'c', '')
+        buffer.add(1, 'd', '')
+        stopping = asyncio.create_task(buffer.stop())
+        await asyncio.sleep(0)
+        release.set()
+        await stopping
+        return written, buffer._rows
+
+    written, pending = asyncio.run(scenario())
+    assert [row[1] for row in written] == ['a', 'b', 'c', 'd']
+    assert pending == []
+
+
+def test_cancelled_flush_returns_batch_to_buffer(monkeypatch):
+    async def scenario():
+        written = []
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        @asynccontextmanager
+        async def fake_connection():
+            yield FakeConnection(written, started, release)
+
+        monkeypatch.setattr(database, 'get_connection', fake_connection)
+
+        buffer = EventLogBuffer(batch_size=100, flush_interval=60, max_pending=100)
+        buffer.add(1, 'a', '')
+        buffer.add(1, 'b', '')
+        flushing = asyncio.create_task(buffer.flush())
+        await started.wait()
+        flushing.cancel()
+        try:
+            await flushing
+        except asyncio.CancelledError:
+            pass
+        return buffer._rows
+
+    pending = asyncio.run(scenario())
+    assert [row[1] for row in pending] == ['a', 'b']
+
+
+class RejectingConnection:
+    """COPY отвергается целиком, INSERT - только для событий 'bad'"""
+
+    def __init__(self, written):
+        self.written = written
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def copy(self, query):
+                class Copy:
+                    async def __aenter__(self):
+                        return self
+
+                    async def __aexit__(self, *exc):
+                        raise DataError("invalid input syntax")
+
+                    async def write_row(self, row):
+                        pass
+
+                return Copy()
+
+            async def execute(self, query, row):
+                if row[1] == 'bad':
+                    raise DataError("invalid input syntax")
+                connection.written.append(row)
+
+        return Cursor()
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def commit(self):
+        pass
+
+
+def test_rejected_batch_drops_only_bad_events(monkeypatch):
+    async def scenario():
+        written = []
+
+        @asynccontextmanager
+        async def fake_connection():
+            yield RejectingConnection(written)
+
+        monkeypatch.setattr(database, 'get_connection', fake_connection)
+
+        buffer = EventLogBuffer(batch_size=100, flush_interval=60, max_pending=100)
+        for action in ('a', 'bad', 'b'):
+            buffer.add(1, action, '')
+        await buffer.flush()
+        return written, buffer._rows
+
+    written, pending = asyncio.run(scenario())
+    assert [row[1] for row in written] == ['a', 'b']
+    assert pending == []
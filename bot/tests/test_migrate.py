@@ -0,0 +1,52 @@
+from migrate import MIGRATIONS_DIR, Migration, split_statements
+
+
+def test_no_transaction_migration_statements():
+    migration = Migration(MIGRATIONS_DIR / '0006_deal_indexes.sql')
+
+    statements = migration.statements()
+
+    # Примеры EXPLAIN в шапке заканчиваются ';', но это комментарии
+    assert len(statements) == 6
+    assert all(s.startswith(('CREATE INDEX CONCURRENTLY', 'DROP INDEX CONCURRENTLY'))
+               for s in statements)
+    assert not any('--' in s for s in statements)
+    assert migration.concurrent_indexes() == [
+        'idx_deals_buyer_created', 'idx_deals_seller_created',
+        'idx_deals_expiry_awaiting', 'idx_deals_active',
+    ]
+
+
+def test_split_keeps_dollar_quoted_body():
+    sql = """
+        CREATE FUNCTION f() RETURNS trigger AS $body$
+        BEGIN
+            UPDATE t SET x = 1;  -- внутри тела
+            RETURN NEW;
+        END;
+        $body$ LANGUAGE plpgsql;
+        SELECT $$a;b$$, 'c;''d', "e;f";
+    """
+
+    statements = split_statements(sql)
+
+    assert len(statements) == 2
+    assert 'RETURN NEW;' in statements[0] and statements[0].endswith('LANGUAGE plpgsql')
+    assert statements[1] == """SELECT $$a;b$$, 'c;''d', "e;f\""""
+
+
+def test_split_ignores_semicolon_in_comments():
+    sql = """
+        CREATE INDEX CONCURRENTLY idx_a
+            -- старый вариант: ON t(a);
+            ON t(b);
+        /* DROP INDEX idx_b; */
+        DROP INDEX CONCURRENTLY idx_c;
+    """
+
+    statements = split_statements(sql)
+
+    assert len(statements) == 2
+    assert 'ON t(b)' in statements[0] and 'ON t(a)' not in statements[0]
+    assert statements[1] == 'DROP INDEX CONCURRENTLY idx_c'
+
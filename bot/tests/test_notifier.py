@@ -0,0 +1,12 @@
+from notifier import TokenBucket
+
+
+def test_paused_bucket_gives_no_tokens_until_retry_after():
+    bucket = TokenBucket(rate=30, capacity=30)
+    assert bucket.reserve(100.0) == 0.0
+
+    bucket.pause(100.0, 5)
+
+    assert bucket.reserve(101.0) == 4.0
+    assert not bucket.is_full(104.0)
+    assert bucket.reserve(105.0) == 0.0
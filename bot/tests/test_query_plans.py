@@ -0,0 +1,75 @@
+# Планы запросов под индексы из 0006. На пустой тестовой базе seq scan
+# всегда дешевле, поэтому он выключен: проверяется, что индекс вообще
+# подходит запросу - по нему идёт чтение и не нужна сортировка всей выборки.
+
+import pytest
+
+from database import _EXPIRE_DEALS_SQL, _user_deals_query
+from tests.conftest import create_user
+
+
+def explain(db, query: str, params: dict) -> dict:
+    db.execute("SET LOCAL enable_seqscan = off")
+    db.execute("SET LOCAL enable_bitmapscan = off")
+    row = db.execute(f"EXPLAIN (FORMAT JSON) {query}", params).fetchone()
+    return row['QUERY PLAN'][0]['Plan']
+
+
+def plan_nodes(plan: dict, under_sort: bool = False):
+    """Узлы плана: (узел, есть ли над ним Sort без Limit между ними)"""
+    yield plan, under_sort
+    if plan['Node Type'] == 'Limit':
+        under_sort = False
+    elif plan['Node Type'] == 'Sort':
+        under_sort = True
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child, under_sort=under_sort)
+
+
+def deals_indexes(plan: dict) -> set:
+    return {node['Index Name'] for node, _ in plan_nodes(plan)
+            if node.get('Relation Name') == 'deals' and 'Index Name' in node}
+
+
+def sorted_deals_scans(plan: dict) -> list:
+    """Чтения deals, результат которых целиком идёт в Sort"""
+    return [node['Node Type'] for node, under_sort in plan_nodes(plan)
+            if node.get('Relation Name') == 'deals' and under_sort]
+
+
+@pytest.fixture
+def user_with_deals(db):
+    user_id, other_id = create_user(db), create_user(db)
+    deal_ids = []
+    for i in range(5):
+        buyer_id, seller_id = (user_id, other_id) if i % 2 else (other_id, user_id)
+        deal_ids.append(db.execute(
+            """INSERT INTO deals (buyer_id, seller_id, amount, currency, status)
+               VALUES (%s, %s, 10, 'TON', 'awaiting_confirmation') RETURNING deal_id""",
+            (buyer_id, seller_id)
+        ).fetchone()['deal_id'])
+    return user_id, deal_ids
+
+
+@pytest.mark.parametrize('page', ['first', 'next', 'previous'])
+def test_user_deals_read_created_indexes_without_sort(db, user_with_deals, page):
+    user_id, deal_ids = user_with_deals
+    cursor = {'first': {}, 'next': {'before_id': deal_ids[2]},
+              'previous': {'after_id': deal_ids[2]}}[page]
+    query, params, _ = _user_deals_query(user_id, limit=11, **cursor)
+
+    plan = explain(db, query, params)
+
+    assert {'idx_deals_buyer_created', 'idx_deals_seller_created'} <= deals_indexes(plan)
+    assert sorted_deals_scans(plan) == []
+
+
+def test_expire_old_deals_reads_expiry_index_without_sort(db):
+    query = _EXPIRE_DEALS_SQL.format(condition="TRUE")
+
+    plan = explain(db, query, {'limit': 100})
+
+    # Выбор просроченных сделок - CTE due; UPDATE дальше идёт по deal_id
+    due = next(node for node, _ in plan_nodes(plan) if node.get('Subplan Name') == 'CTE due')
+    assert deals_indexes(due) == {'idx_deals_expiry_awaiting'}
+    assert sorted_deals_scans(due) == []
@@ -0,0 +1,34 @@
+# Микро-бенчмарк генерации квитанций: python -m utils.bench_receipts [N]
+
+import sys
+import time
+from utils.document_generator import generate_seller_receipt, generate_buyer_receipt
+
+
+def bench(func, runs: int, **kwargs) -> float:
+    """Среднее время одного вызова в миллисекундах (после прогрева)"""
+    func(**kwargs)
+    started = time.perf_counter()
+    for _ in range(runs):
+        func(**kwargs)
+    return (time.perf_counter() - started) * 1000 / runs
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    seller_ms = bench(
+        generate_seller_receipt, runs,
+        deal_id=123, seller_username='seller_alex', seller_id=2,
+        buyer_username='buyer_ivan', buyer_id=1, amount=1500.0,
+        currency='TON', wallet_address='UQTest456seller' * 3
+    )
+    buyer_ms = bench(
+        generate_buyer_receipt, runs,
+        deal_id=123, buyer_username='buyer_ivan', buyer_id=1,
+        seller_username='seller_alex', seller_id=2, amount=1500.0,
+        currency='TON', seller_wallet='UQTest456seller' * 3
+    )
+
+    print(f"seller receipt: {seller_ms:.2f} ms/receipt ({runs} runs)")
+    print(f"buyer receipt:  {buyer_ms:.2f} ms/receipt ({runs} runs)")
@@ -107,167 +107,191 @@ FONT_NAME_BOLD = 'CustomFont-Bold' if font_registered else 'Helvetica-Bold'
 print(f"📝 Using fonts: {FONT_NAME} / {FONT_NAME_BOLD}")
 
 
-def generate_seller_receipt(deal_id: int, seller_username: str, seller_id: int, 
-                           buyer_username: str, buyer_id: int, amount: float, 
-                           currency: str, wallet_address: str) -> bytes:
-    """Генерирует PDF-документ для продавца о завершённой сделке"""
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    
-    # Стиль для заголовка
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontName=FONT_NAME_BOLD,
-        fontSize=18,
-        textColor=colors.HexColor('#1F2125'),
-        spaceAfter=30,
-        alignment=1
-    )
-    
-    # Стиль для обычного текста
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontName=FONT_NAME,
-        fontSize=11,
-        textColor=colors.HexColor('#1F2125'),
-        leading=18,
-        spaceAfter=12
-    )
-    
-    # Стиль для подзаголовков
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontName=FONT_NAME_BOLD,
-        fontSize=12,
-        textColor=colors.HexColor('#134252'),
-        spaceAfter=10,
-        spaceBefore=15
+# Стили и статичные элементы квитанций создаются один раз при импорте модуля,
+# при каждом вызове заполняются только данные сделки
+
+_base_styles = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_base_styles['Heading1'],
+    fontName=FONT_NAME_BOLD,
+    fontSize=18,
+    textColor=colors.HexColor('#1F2125'),
+    spaceAfter=30,
+    alignment=1
+)
+
+NORMAL_STYLE = ParagraphStyle(
+    'CustomNormal',
+    parent=_base_styles['Normal'],
+    fontName=FONT_NAME,
+    fontSize=11,
+    textColor=colors.HexColor('#1F2125'),
+    leading=18,
+    spaceAfter=12
+)
+
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_base_styles['Heading2'],
+    fontName=FONT_NAME_BOLD,
+    fontSize=12,
+    textColor=colors.HexColor('#134252'),
+    spaceAfter=10,
+    spaceBefore=15
+)
+
+FOOTER_STYLE = ParagraphStyle(
+    'Footer', 
+    parent=_base_styles['Normal'], 
+    fontName=FONT_NAME,
+    fontSize=9, 
+    textColor=colors.grey, 
+    alignment=0
+)
+
+DEAL_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#134252')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
+    ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#F5F5F5'), colors.white]),
+])
+
+PAYMENT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#32B8C6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
+    ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#F5F5F5'), colors.white]),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+TABLE_COL_WIDTHS = [80*mm, 80*mm]
+
+# Тексты, которые отличаются у продавца и покупателя
+RECEIPT_ROLES = {
+    'seller': {
+        'title': "🔐 EasyGarant<br/>Система гарантирования платежей",
+        'role': 'Продавец (получатель средств)',
+        'self_label': 'Продавец (Вы)',
+        'other_label': 'Покупатель',
+        'payment_labels': ('Сумма', 'Валюта', 'Адрес получения'),
+        'summary': (
+            "Спасибо за использование сервиса FastDeal!<br/><br/>"
+            "Данная квитанция подтверждает, что вами была проведена сделка по продаже "
+            "товара/услуги покупателю @{other_username} (ID: {other_id}). "
+            "На ваш кошелёк поступила сумма {amount} {currency} "
+            "на адрес {wallet}.<br/><br/>"
+            "Все средства защищены нашей системой гарантирования."
+        ),
+        'service': (
+            "Сервис: FastDeal - система гарантирования платежей EasyGarant<br/>"
+            "Платформа: Telegram Bot"
+        ),
+    },
+    'buyer': {
+        'title': "🔐 EasyGarante<br/>Система гарантирования платежей",
+        'role': 'Покупатель (инициатор платежа)',
+        'self_label': 'Покупатель (Вы)',
+        'other_label': 'Продавец',
+        'payment_labels': ('Переведено', 'Валюта', 'На адрес продавца'),
+        'summary': (
+            "Спасибо за использование сервиса EasyGarant!<br/><br/>"
+            "Данная квитанция подтверждает, что вами была проведена сделка по покупке "
+            "товара/услуги у продавца @{other_username} (ID: {other_id}). "
+            "Вами было переведено {amount} {currency} "
+            "на адрес продавца {wallet}.<br/><br/>"
+            "Все средства защищены нашей системой гарантирования FastDeal."
+        ),
+        'service': (
+            "Сервис: EasyGarant - система гарантирования крипто-платежей<br/>"
+            "Платформа: Telegram Bot. Владелец: @dontwritethis"
+        ),
+    },
+}
+
+# Статичные элементы разметки (переиспользуются между вызовами)
+_DOC_TITLE = Paragraph("КВИТАНЦИЯ О ЗАВЕРШЁННОЙ СДЕЛКЕ", HEADING_STYLE)
+_PARTIES_HEADER = Paragraph("Стороны сделки:", HEADING_STYLE)
+_PAYMENT_HEADER = Paragraph("Информация о платеже:", HEADING_STYLE)
+_SPACER_10 = Spacer(1, 10*mm)
+_SPACER_15 = Spacer(1, 15*mm)
+_SPACER_20 = Spacer(1, 20*mm)
+_TITLES = {role: Paragraph(texts['title'], TITLE_STYLE) for role, texts in RECEIPT_ROLES.items()}
+
+
+def _party_info(label: str, username: str, user_id: int) -> Paragraph:
+    return Paragraph(
+        f"{label}:<br/>"
+        f"Username: @{username}<br/>"
+        f"ID в системе: {user_id}",
+        NORMAL_STYLE
     )
+
+
+def build_receipt(role: str, deal_id: int, self_username: str, self_id: int,
+                  other_username: str, other_id: int, amount: float,
+                  currency: str, wallet: str) -> bytes:
+    """Генерирует PDF-квитанцию о завершённой сделке для роли seller/buyer"""
     
-    content = []
-    
-    # Заголовок
-    title = Paragraph("🔐 EasyGarant<br/>Система гарантирования платежей", title_style)
-    content.append(title)
-    content.append(Spacer(1, 20*mm))
-    
-    # Основной заголовок документа
-    doc_title = Paragraph("КВИТАНЦИЯ О ЗАВЕРШЁННОЙ СДЕЛКЕ", heading_style)
-    content.append(doc_title)
-    content.append(Spacer(1, 15*mm))
+    texts = RECEIPT_ROLES[role]
+    now = datetime.now().strftime('%d.%m.%Y в %H:%M:%S')
     
-    # Информация о сделке
-    deal_data = [
+    deal_table = Table([
         ['Параметр', 'Значение'],
         ['Номер сделки', f'#{deal_id}'],
-        ['Дата завершения', datetime.now().strftime('%d.%m.%Y в %H:%M:%S')],
-        ['Роль в сделке', 'Продавец (получатель средств)'],
-    ]
-    
-    deal_table = Table(deal_data, colWidths=[80*mm, 80*mm])
-    deal_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#134252')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#F5F5F5'), colors.white]),
-    ]))
-    
-    content.append(deal_table)
-    content.append(Spacer(1, 15*mm))
-    
-    # Стороны сделки
-    parties_header = Paragraph("Стороны сделки:", heading_style)
-    content.append(parties_header)
-    
-    seller_info = Paragraph(
-        f"Продавец (Вы):<br/>"
-        f"Username: @{seller_username}<br/>"
-        f"ID в системе: {seller_id}",
-        normal_style
+        ['Дата завершения', now],
+        ['Роль в сделке', texts['role']],
+    ], colWidths=TABLE_COL_WIDTHS)
+    deal_table.setStyle(DEAL_TABLE_STYLE)
+    
+    amount_label, currency_label, wallet_label = texts['payment_labels']
+    payment_table = Table([
+        [amount_label, f'{amount} {currency}'],
+        [currency_label, currency],
+        [wallet_label, wallet],
+    ], colWidths=TABLE_COL_WIDTHS)
+    payment_table.setStyle(PAYMENT_TABLE_STYLE)
+    
+    summary = Paragraph(
+        texts['summary'].format(
+            other_username=other_username, other_id=other_id,
+            amount=amount, currency=currency, wallet=wallet
+        ),
+        NORMAL_STYLE
     )
-    content.append(seller_info)
-    content.append(Spacer(1, 10*mm))
-    
-    buyer_info = Paragraph(
-        f"Покупатель:<br/>"
-        f"Username: @{buyer_username}<br/>"
-        f"ID в системе: {buyer_id}",
-        normal_style
+    system_info = Paragraph(
+        f"Документ сгенерирован: {now}<br/>" + texts['service'],
+        FOOTER_STYLE
     )
-    content.append(buyer_info)
-    content.append(Spacer(1, 15*mm))
-    
-    # Информация о платеже
-    payment_header = Paragraph("Информация о платеже:", heading_style)
-    content.append(payment_header)
     
-    payment_data = [
-        ['Сумма', f'{amount} {currency}'],
-        ['Валюта', currency],
-        ['Адрес получения', wallet_address],
+    content = [
+        _TITLES[role], _SPACER_20,
+        _DOC_TITLE, _SPACER_15,
+        deal_table, _SPACER_15,
+        _PARTIES_HEADER,
+        _party_info(texts['self_label'], self_username, self_id), _SPACER_10,
+        _party_info(texts['other_label'], other_username, other_id), _SPACER_15,
+        _PAYMENT_HEADER,
+        payment_table, _SPACER_20,
+        summary, _SPACER_15,
+        system_info,
     ]
     
-    payment_table = Table(payment_data, colWidths=[80*mm, 80*mm])
-    payment_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#32B8C6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#F5F5F5'), colors.white]),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    
-    content.append(payment_table)
-    content.append(Spacer(1, 20*mm))
-    
-    # Завершающий текст
-    footer_text = Paragraph(
-        f"Спасибо за использование сервиса FastDeal!<br/><br/>"
-        f"Данная квитанция подтверждает, что вами была проведена сделка по продаже "
-        f"товара/услуги покупателю @{buyer_username} (ID: {buyer_id}). "
-        f"На ваш кошелёк поступила сумма {amount} {currency} "
-        f"на адрес {wallet_address}.<br/><br/>"
-        f"Все средства защищены нашей системой гарантирования.",
-        normal_style
-    )
-    content.append(footer_text)
-    content.append(Spacer(1, 15*mm))
-    
-    # Футер
-    footer_style = ParagraphStyle(
-        'Footer', 
-        parent=styles['Normal'], 
-        fontName=FONT_NAME,
-        fontSize=9, 
-        textColor=colors.grey, 
-        alignment=0
-    )
-    
-    system_info = Paragraph(
-        f"Документ сгенерирован: {datetime.now().strftime('%d.%m.%Y в %H:%M:%S')}<br/>"
-        f"Сервис: FastDeal - система гарантирования платежей EasyGarant<br/>"
-        f"Платформа: Telegram Bot",
-        footer_style
-    )
-    content.append(system_info)
-    
-    # Построение PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
     doc.build(content)
     pdf_bytes = buffer.getvalue()
     buffer.close()
@@ -275,158 +299,17 @@ def generate_seller_receipt(deal_id: int, seller_username: str, seller_id: int,
     return pdf_bytes
 
 
+def generate_seller_receipt(deal_id: int, seller_username: str, seller_id: int, 
+                           buyer_username: str, buyer_id: int, amount: float, 
+                           currency: str, wallet_address: str) -> bytes:
+    """Генерирует PDF-документ для продавца о завершённой сделке"""
+    return build_receipt('seller', deal_id, seller_username, seller_id,
+                         buyer_username, buyer_id, amount, currency, wallet_address)
+
+
 def generate_buyer_receipt(deal_id: int, buyer_username: str, buyer_id: int, 
                           seller_username: str, seller_id: int, amount: float, 
                           currency: str, seller_wallet: str) -> bytes:
     """Генерирует PDF-документ для покупателя о завершённой сделке"""
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontName=FONT_NAME_BOLD,
-        fontSize=18,
-        textColor=colors.HexColor('#1F2125'),
-        spaceAfter=30,
-        alignment=1
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontName=FONT_NAME,
-        fontSize=11,
-        textColor=colors.HexColor('#1F2125'),
-        leading=18,
-        spaceAfter=12
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontName=FONT_NAME_BOLD,
-        fontSize=12,
-        textColor=colors.HexColor('#134252'),
-        spaceAfter=10,
-        spaceBefore=15
-    )
-    
-    content = []
-    
-    title = Paragraph("🔐 EasyGarante<br/>Система гарантирования платежей", title_style)
-    content.append(title)
-    content.append(Spacer(1, 20*mm))
-    
-    doc_title = Paragraph("КВИТАНЦИЯ О ЗАВЕРШЁННОЙ СДЕЛКЕ", heading_style)
-    content.append(doc_title)
-    content.append(Spacer(1, 15*mm))
-    
-    deal_data = [
-        ['Параметр', 'Значение'],
-        ['Номер сделки', f'#{deal_id}'],
-        ['Дата завершения', datetime.now().strftime('%d.%m.%Y в %H:%M:%S')],
-        ['Роль в сделке', 'Покупатель (инициатор платежа)'],
-    ]
-    
-    deal_table = Table(deal_data, colWidths=[80*mm, 80*mm])
-    deal_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#134252')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#F5F5F5'), colors.white]),
-    ]))
-    
-    content.append(deal_table)
-    content.append(Spacer(1, 15*mm))
-    
-    parties_header = Paragraph("Стороны сделки:", heading_style)
-    content.append(parties_header)
-    
-    buyer_info = Paragraph(
-        f"Покупатель (Вы):<br/>"
-        f"Username: @{buyer_username}<br/>"
-        f"ID в системе: {buyer_id}",
-        normal_style
-    )
-    content.append(buyer_info)
-    content.append(Spacer(1, 10*mm))
-    
-    seller_info = Paragraph(
-        f"Продавец:<br/>"
-        f"Username: @{seller_username}<br/>"
-        f"ID в системе: {seller_id}",
-        normal_style
-    )
-    content.append(seller_info)
-    content.append(Spacer(1, 15*mm))
-    
-    payment_header = Paragraph("Информация о платеже:", heading_style)
-    content.append(payment_header)
-    
-    payment_data = [
-        ['Переведено', f'{amount} {currency}'],
-        ['Валюта', currency],
-        ['На адрес продавца', seller_wallet],
-    ]
-    
-    payment_table = Table(payment_data, colWidths=[80*mm, 80*mm])
-    payment_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#32B8C6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#F5F5F5'), colors.white]),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    
-    content.append(payment_table)
-    content.append(Spacer(1, 20*mm))
-    
-    footer_text = Paragraph(
-        f"Спасибо за использование сервиса EasyGarant!<br/><br/>"
-        f"Данная квитанция подтверждает, что вами была проведена сделка по покупке "
-        f"товара/услуги у продавца @{seller_username} (ID: {seller_id}). "
-        f"Вами было переведено {amount} {currency} "
-        f"на адрес продавца {seller_wallet}.<br/><br/>"
-        f"Все средства защищены нашей системой гарантирования FastDeal.",
-        normal_style
-    )
-    content.append(footer_text)
-    content.append(Spacer(1, 15*mm))
-    
-    footer_style = ParagraphStyle(
-        'Footer', 
-        parent=styles['Normal'], 
-        fontName=FONT_NAME,
-        fontSize=9, 
-        textColor=colors.grey, 
-        alignment=0
-    )
-    
-    system_info = Paragraph(
-        f"Документ сгенерирован: {datetime.now().strftime('%d.%m.%Y в %H:%M:%S')}<br/>"
-        f"Сервис: EasyGarant - система гарантирования крипто-платежей<br/>"
-        f"Платформа: Telegram Bot. Владелец: @dontwritethis",
-        footer_style
-    )
-    content.append(system_info)
-    
-    doc.build(content)
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    
-    return pdf_bytes
+    return build_receipt('buyer', deal_id, buyer_username, buyer_id,
+                         seller_username, seller_id, amount, currency, seller_wallet)
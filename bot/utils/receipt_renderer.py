@@ -0,0 +1,107 @@
+# Асинхронная генерация квитанций в отдельных процессах
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import RECEIPT_WORKERS, RECEIPT_QUEUE_LIMIT
+from utils.document_generator import generate_seller_receipt, generate_buyer_receipt
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = 0
+_stats = {
+    'rendered': 0,
+    'rejected': 0,
+    'failed': 0,
+    'render_ms_total': 0.0,
+    'wait_ms_total': 0.0,
+    'max_pending': 0,
+}
+
+
+class RenderQueueFull(Exception):
+    """Очередь генерации документов переполнена"""
+
+
+def _timed_render(func, kwargs):
+    """Выполняется в процессе-воркере: генерирует PDF и замеряет время"""
+    started = time.perf_counter()
+    pdf_bytes = func(**kwargs)
+    return pdf_bytes, (time.perf_counter() - started) * 1000
+
+
+def start_renderer():
+    """Запуск пула процессов для генерации PDF"""
+    global _executor
+    if _executor is None:
+        # spawn: воркеры не наследуют сокеты и event loop бота
+        _executor = ProcessPoolExecutor(
+            max_workers=RECEIPT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        logger.info(f"Receipt renderer started ({RECEIPT_WORKERS} workers)")
+
+
+def stop_renderer():
+    """Остановка пула процессов"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        logger.info("Receipt renderer stopped")
+
+
+def get_render_stats() -> dict:
+    """Метрики генерации: количество, отказы, среднее время рендера и ожидания"""
+    rendered = _stats['rendered'] or 1
+    return {
+        'pending': _pending,
+        'rendered': _stats['rendered'],
+        'rejected': _stats['rejected'],
+        'failed': _stats['failed'],
+        'max_pending': _stats['max_pending'],
+        'avg_render_ms': round(_stats['render_ms_total'] / rendered, 1),
+        'avg_wait_ms': round(_stats['wait_ms_total'] / rendered, 1),
+    }
+
+
+async def _render(func, **kwargs) -> bytes:
+    global _pending
+    if _pending >= RECEIPT_QUEUE_LIMIT:
+        _stats['rejected'] += 1
+        raise RenderQueueFull(f"Receipt queue is full ({_pending} pending)")
+
+    if _executor is None:
+        start_renderer()
+
+    _pending += 1
+    _stats['max_pending'] = max(_stats['max_pending'], _pending)
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        pdf_bytes, render_ms = await loop.run_in_executor(_executor, _timed_render, func, kwargs)
+    except Exception:
+        _stats['failed'] += 1
+        raise
+    finally:
+        _pending -= 1
+
+    total_ms = (time.perf_counter() - started) * 1000
+    _stats['rendered'] += 1
+    _stats['render_ms_total'] += render_ms
+    _stats['wait_ms_total'] += total_ms - render_ms
+    logger.info(f"{func.__name__}: render {render_ms:.1f} ms, total {total_ms:.1f} ms")
+    return pdf_bytes
+
+
+async def render_seller_receipt(**kwargs) -> bytes:
+    """Квитанция продавца (аргументы как у generate_seller_receipt)"""
+    return await _render(generate_seller_receipt, **kwargs)
+
+
+async def render_buyer_receipt(**kwargs) -> bytes:
+    """Квитанция покупателя (аргументы как у generate_buyer_receipt)"""
+    return await _render(generate_buyer_receipt, **kwargs)
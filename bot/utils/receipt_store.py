@@ -0,0 +1,70 @@
+# Отправка квитанций с кэшированием PDF и Telegram file_id
+
+import logging
+from aiogram.types import BufferedInputFile
+from database import get_receipt, save_receipt, get_user_by_id, get_user_wallet
+from notifier import send_document
+from utils.receipt_renderer import render_seller_receipt, render_buyer_receipt
+
+logger = logging.getLogger(__name__)
+
+
+async def _render(deal, role: str) -> bytes:
+    """Сгенерировать квитанцию по строке deals"""
+    seller = await get_user_by_id(deal['seller_id'])
+    buyer = await get_user_by_id(deal['buyer_id'])
+    # Адрес в квитанции - из БД: строка seller может быть из кэша
+    seller_wallet = await get_user_wallet(deal['seller_id'], deal['currency'])
+
+    if role == 'seller':
+        return await render_seller_receipt(
+            deal_id=deal['deal_id'],
+            seller_username=seller['username'],
+            seller_id=seller['user_id'],
+            buyer_username=buyer['username'],
+            buyer_id=buyer['user_id'],
+            amount=deal['amount'],
+            currency=deal['currency'],
+            wallet_address=seller_wallet
+        )
+    return await render_buyer_receipt(
+        deal_id=deal['deal_id'],
+        buyer_username=buyer['username'],
+        buyer_id=buyer['user_id'],
+        seller_username=seller['username'],
+        seller_id=seller['user_id'],
+        amount=deal['amount'],
+        currency=deal['currency'],
+        seller_wallet=seller_wallet
+    )
+
+
+async def send_receipt(chat_id: int, deal, role: str, caption: str = None):
+    """Отправить квитанцию role ('buyer'/'seller') по сделке deal в чат chat_id.
+
+    Порядок: сохранённый file_id (без генерации и загрузки) -> сохранённый PDF
+    -> генерация. После первой загрузки file_id запоминается в receipts.
+    Отправка идёт через лимиты notifier.
+    """
+    deal_id = deal['deal_id']
+    stored = await get_receipt(deal_id, role)
+
+    if stored and stored['file_id']:
+        await send_document(chat_id, stored['file_id'], caption=caption, parse_mode="HTML")
+        logger.info(f"Receipt {deal_id}/{role} sent from file_id cache")
+        return
+
+    if stored and stored['pdf']:
+        pdf_bytes = bytes(stored['pdf'])
+    else:
+        pdf_bytes = await _render(deal, role)
+        await save_receipt(deal_id, role, pdf=pdf_bytes)
+
+    sent = await send_document(
+        chat_id,
+        BufferedInputFile(file=pdf_bytes, filename=f"receipt_deal_{deal_id}_{role}.pdf"),
+        caption=caption,
+        parse_mode="HTML"
+    )
+    await save_receipt(deal_id, role, file_id=sent.document.file_id)
+    logger.info(f"Receipt {deal_id}/{role} uploaded")
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import ssl
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+                    WEBHOOK_SSL_CERT, WEBHOOK_SSL_KEY, WEBHOOK_SHUTDOWN_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+
+class GracefulRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука, который при остановке дожидается апдейтов в работе.
+
+    Сессию бота не закрывает: после него on_shutdown ещё досылает очередь
+    уведомлений, сессию закрывает _close_session последним.
+    """
+
+    async def close(self) -> None:
+        pending = self._background_feed_update_tasks
+        if pending:
+            logger.info(f"Waiting for {len(pending)} updates in progress")
+            await asyncio.wait(set(pending), timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+
+
+async def health(request: web.Request) -> web.Response:
+    """Проверка живости для балансировщика"""
+    return web.Response(text="ok")
+
+
+def _ssl_context():
+    """TLS прямо в приложении (самоподписанный сертификат без reverse proxy)"""
+    if not (WEBHOOK_SSL_CERT and WEBHOOK_SSL_KEY):
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(WEBHOOK_SSL_CERT, WEBHOOK_SSL_KEY)
+    return context
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    """Регистрирует вебхук при каждом старте.
+
+    getWebhookInfo не показывает secret_token, поэтому по совпадению адреса
+    нельзя понять, что вебхук актуален; setWebhook идемпотентен.
+    """
+    url = f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}"
+    await bot.set_webhook(
+        url=url,
+        secret_token=WEBHOOK_SECRET,
+        certificate=FSInputFile(WEBHOOK_SSL_CERT) if WEBHOOK_SSL_CERT else None,
+        allowed_updates=dispatcher.resolve_used_update_types()
+    )
+    logger.info(f"Webhook set: {url}")
+
+
+def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запуск aiohttp-сервера, принимающего апдейты от Telegram.
+
+    Апдейты обрабатываются в фоне: Telegram сразу получает ответ 200,
+    поэтому несколько воркеров можно поставить за балансировщик.
+    Вебхук при остановке не удаляется - его продолжают обслуживать
+    остальные воркеры.
+    """
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_BASE_URL")
+
+    dp.startup.register(set_webhook)
+
+    app = web.Application()
+    app.router.add_get('/health', health)
+    GracefulRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    async def _close_session(app: web.Application):
+        await bot.session.close()
+
+    # on_shutdown выполняются по порядку: апдейты в работе -> dp.shutdown
+    # (stop_notifier) -> закрытие сессии
+    app.on_shutdown.append(_close_session)
+
+    web.run_app(
+        app,
+        host=WEBAPP_HOST,
+        port=WEBAPP_PORT,
+        ssl_context=_ssl_context(),
+        shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT
+    )